@@ -12,7 +12,8 @@ def is_user():
     return st.session_state.get("role") == "user"
 
 pages = [st.Page("views/home.py", title="Home", icon="🏠", default=True),
-         st.Page("views/dashboard_analysis.py", title="Trend Dashboard", icon="📈", default=False)]
+         st.Page("views/dashboard_analysis.py", title="Trend Dashboard", icon="📈", default=False),
+         st.Page("views/compare_subreddits.py", title="Compare Subreddits", icon="📊", default=False)]
 
 if is_operator():
     pages.append(st.Page("views/special_page.py", title="Post Analysis", icon="🧠"))
@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
-from typing import  List, Dict, Tuple
+from typing import  List, Dict, Tuple, Optional
 
 def perform_lda(
     text_data: pd.Series, 
@@ -47,7 +47,8 @@ def display_topics(lda: LatentDirichletAllocation, feature_names: List[str], n_t
 
 def analyze_topics_over_time(
     df: pd.DataFrame, 
-    topic_assignments: np.ndarray
+    topic_assignments: np.ndarray,
+    weight_column: Optional[str] = None
 ) -> pd.DataFrame:
     """
     Analyzes topic trends over time by calculating the number of posts per topic per year.
@@ -55,6 +56,8 @@ def analyze_topics_over_time(
     Args:
         df (pd.DataFrame): DataFrame containing the original data with a 'created_datetime' column.
         topic_assignments (np.ndarray): Topic assignments for each post.
+        weight_column (str, optional): Column with the number of posts each row stands for,
+            e.g. 'dup_count' after deduplication.
 
     Returns:
         pd.DataFrame: Topic trends over time.
@@ -63,31 +66,13 @@ def analyze_topics_over_time(
     df['year'] = df['created_datetime'].dt.year
 
     # Count posts per topic per year
-    topic_trends = df.groupby(['year', 'dominant_topic']).size().unstack(fill_value=0)
+    if weight_column is None:
+        topic_trends = df.groupby(['year', 'dominant_topic']).size().unstack(fill_value=0)
+    else:
+        topic_trends = df.groupby(['year', 'dominant_topic'])[weight_column].sum().unstack(fill_value=0)
 
     return topic_trends
 
-def detect_spikes(
-    topic_trends: pd.DataFrame, 
-    overall_trends: pd.Series
-) -> pd.DataFrame:
-    """
-    Detects spikes in topic popularity relative to the overall number of posts.
-
-    Args:
-        topic_trends (pd.DataFrame): Trends of topics over time.
-        overall_trends (pd.Series): Overall number of posts per year.
-
-    Returns:
-        pd.DataFrame: DataFrame of percentage changes (spikes).
-    """
-    # Normalize by overall number of posts
-    normalized_trends = topic_trends.div(overall_trends, axis=0).fillna(0)
-    percentage_change = normalized_trends.pct_change().fillna(0)
-
-    # Highlight spikes (e.g., >50% growth)
-    return percentage_change[percentage_change > 0.5]
-
 def get_cluster_descriptions(
     df: pd.DataFrame, 
     lda: LatentDirichletAllocation, 
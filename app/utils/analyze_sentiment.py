@@ -1,11 +1,28 @@
+import os
+import hashlib
+from collections import OrderedDict
 import pandas as pd
-from textblob import TextBlob
+
+from utils.logger import get_logger
+
+# Set up logging
+log = get_logger()
+
+# Default transformer model, shared with the post analysis page
+EMOTION_MODEL = "j-hartmann/emotion-english-distilroberta-base"
+
+# Per-text transformer results, keyed by (model name, text digest); the least recently used are evicted
+TRANSFORMER_CACHE_SIZE = 500_000
+_transformer_cache = OrderedDict()
+_transformer_pipelines = {}
 
 def analyze_sentiment(text):
     """
     Analyzes the sentiment of a given text using TextBlob.
     Returns Positive, Negative, or Neutral based on polarity.
     """
+    from textblob import TextBlob  # imported on first use, it pulls in nltk
+
     polarity = TextBlob(text).sentiment.polarity
     if polarity > 0.1:
         return 'Positive'
@@ -14,25 +31,44 @@ def analyze_sentiment(text):
     else:
         return 'Neutral'
 
-def assign_sentiments(df):
+def assign_sentiments(df, batch_size=None, progress_callback=None):
     """
     Assign sentiment labels to the posts in the DataFrame.
+
+    If a `progress_callback` is given, posts are scored in batches and the callback is
+    called as `progress_callback(done, total, labels)` with the labels of each batch.
     """
-    df['sentiment'] = df['selftext'].apply(analyze_sentiment)
+    if progress_callback is None:
+        df['sentiment'] = df['selftext'].apply(analyze_sentiment)
+        return df
+
+    total = len(df)
+    batch_size = batch_size or max(500, total // 20)
+    labels = []
+    for start in range(0, total, batch_size):
+        batch = df['selftext'].iloc[start:start + batch_size].apply(analyze_sentiment)
+        labels.append(batch)
+        progress_callback(start + len(batch), total, batch)
+    df['sentiment'] = pd.concat(labels) if labels else pd.Series(dtype=object)
     return df
 
-def calculate_sentiment_distribution(df):
+def calculate_sentiment_distribution(df, weight_column=None):
     """
     Groups posts by year and sentiment and calculates sentiment percentages per year.
+
+    If `weight_column` is given (e.g. 'dup_count' after deduplication), each row counts as
+    that many posts.
     """
     # Extract year
     df['year'] = df['created_datetime'].dt.year
     
     # Count posts per sentiment per year
-    sentiment_counts = df.groupby(['year', 'sentiment']).size().reset_index(name='count')
-    
-    # Total posts per year
-    total_per_year = df.groupby('year').size().reset_index(name='total')
+    if weight_column is None:
+        sentiment_counts = df.groupby(['year', 'sentiment']).size().reset_index(name='count')
+        total_per_year = df.groupby('year').size().reset_index(name='total')
+    else:
+        sentiment_counts = df.groupby(['year', 'sentiment'])[weight_column].sum().reset_index(name='count')
+        total_per_year = df.groupby('year')[weight_column].sum().reset_index(name='total')
     
     # Merge counts with totals
     sentiment_distribution = pd.merge(sentiment_counts, total_per_year, on='year')
@@ -44,3 +80,120 @@ def calculate_sentiment_distribution(df):
     
     return sentiment_distribution
 
+
+def sentiment_distribution_from_counts(counts):
+    """
+    Same result as `calculate_sentiment_distribution`, from running counts of posts per
+    (year, sentiment), e.g. updated batch by batch while the posts are scored.
+    """
+    rows = [{'year': year, 'sentiment': sentiment, 'count': count} for (year, sentiment), count in sorted(counts.items())]
+    sentiment_distribution = pd.DataFrame(rows, columns=['year', 'sentiment', 'count'])
+    sentiment_distribution['total'] = sentiment_distribution.groupby('year')['count'].transform('sum')
+    sentiment_distribution['percentage'] = sentiment_distribution['count'] / sentiment_distribution['total'] * 100
+    return sentiment_distribution
+
+
+def get_transformer_pipeline(model_name=EMOTION_MODEL, max_threads=None):
+    """
+    Loads (once per process) a text-classification pipeline on CPU.
+
+    Args:
+        model_name (str): Hugging Face model used for classification.
+        max_threads (int, optional): Upper bound on torch intra-op threads, set when a model
+            is loaded. Defaults to OMP_NUM_THREADS (set per job worker by
+            `utils.jobs`), else half of the available cores so the Streamlit server stays responsive.
+
+    Returns:
+        transformers.Pipeline: The loaded classification pipeline.
+    """
+    if model_name not in _transformer_pipelines:
+        import torch
+        from transformers import pipeline
+
+        if max_threads is None:
+            max_threads = int(os.environ.get("OMP_NUM_THREADS") or max(1, (os.cpu_count() or 2) // 2))
+        torch.set_num_threads(max_threads)
+        log.info(f"Loading transformer model {model_name} with {max_threads} threads")
+        _transformer_pipelines[model_name] = pipeline(
+            "text-classification", model=model_name, device=-1, truncation=True, max_length=512
+        )
+    return _transformer_pipelines[model_name]
+
+
+def make_length_buckets(texts, max_batch_size=32, max_batch_chars=32000):
+    """
+    Groups texts of similar length into batches to keep padding low.
+
+    Args:
+        texts (pd.Series): Texts to classify.
+        max_batch_size (int): Maximum number of texts per batch.
+        max_batch_chars (int): Budget of (padded) characters per batch.
+
+    Returns:
+        List[List]: Batches of index labels of `texts`, shortest texts first.
+    """
+    lengths = texts.str.len().clip(upper=512 * 4).sort_values(kind="stable")
+    batches, batch = [], []
+    for idx, length in lengths.items():
+        # Every text in a batch is padded to the longest one, which is the current text
+        if batch and (len(batch) >= max_batch_size or (len(batch) + 1) * length > max_batch_chars):
+            batches.append(batch)
+            batch = []
+        batch.append(idx)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def assign_transformer_sentiments(
+    df, model_name=EMOTION_MODEL, max_batch_size=32, max_threads=None, progress_callback=None
+):
+    """
+    Assign transformer labels (e.g. emotions) to the posts in the DataFrame.
+
+    Posts are classified in length-bucketed batches and results are cached per text (up to
+    TRANSFORMER_CACHE_SIZE texts), so re-running on an overlapping selection only classifies
+    new posts. The cache is keyed on the text rather than the post `id` because comment
+    analyses keep the submission ids with the thread text.
+
+    Args:
+        df (pd.DataFrame): Posts with a 'selftext' column.
+        model_name (str): Hugging Face model used for classification.
+        max_batch_size (int): Maximum number of posts per batch.
+        max_threads (int, optional): Upper bound on torch intra-op threads.
+        progress_callback (callable, optional): Called as `progress_callback(done, total, labels)`
+            with the labels of each classified batch.
+
+    Returns:
+        pd.DataFrame: The input DataFrame with a 'sentiment' column.
+    """
+    keys = pd.Series(
+        [(model_name, hashlib.sha1(str(text).encode()).digest()) for text in df['selftext']], index=df.index
+    )
+    sentiments = {}
+    for key in keys:
+        if key in _transformer_cache:
+            _transformer_cache.move_to_end(key)
+            sentiments[key] = _transformer_cache[key]
+    todo = df.loc[[key not in sentiments for key in keys], ['selftext']]
+    total = len(todo)
+    log.info(f"Classifying {total:,} posts with {model_name} ({len(df) - total:,} cached)")
+
+    if total:
+        classifier = get_transformer_pipeline(model_name, max_threads)
+        done = 0
+        for batch in make_length_buckets(todo['selftext'], max_batch_size):
+            texts = todo.loc[batch, 'selftext'].tolist()
+            results = classifier(texts, batch_size=len(texts))
+            labels = [result['label'].capitalize() for result in results]
+            for key, label in zip(keys.loc[batch], labels):
+                sentiments[key] = _transformer_cache[key] = label
+            done += len(batch)
+            if progress_callback is not None:
+                progress_callback(done, total, pd.Series(labels, index=batch))
+
+        while len(_transformer_cache) > TRANSFORMER_CACHE_SIZE:
+            _transformer_cache.popitem(last=False)
+
+    df['sentiment'] = [sentiments[key] for key in keys]
+    return df
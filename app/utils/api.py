@@ -1,11 +1,14 @@
-import openai
 import os
-from openai import OpenAI
+from functools import lru_cache
 from dotenv import load_dotenv
 
-load_dotenv()
-openai.api_key = os.environ.get("OPENAI_API_KEY")
-client = OpenAI(api_key = openai.api_key)
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """Creates the OpenAI client on first use, so importing this module stays cheap."""
+    from openai import OpenAI
+
+    load_dotenv()
+    return OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 
 def generate_summary_for_topics(topics: dict) -> dict:
     """
@@ -24,7 +27,7 @@ def generate_summary_for_topics(topics: dict) -> dict:
     
     try:
         # Make the API call to OpenAI (using GPT-4)
-        response = client.chat.completions.create(
+        response = get_openai_client().chat.completions.create(
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are a helpful assistant."},
@@ -0,0 +1,172 @@
+"""
+Headless batch mode: precomputes the default dashboard analysis for every dump.
+
+Each dump in downloads/reddit-downloads is processed in its own process (ingest, the
+default sentiment and topic pipelines, and the aggregates) and the results are written
+as versioned artifacts. Dumps whose source file has not changed since the last run are
+skipped, so this can run nightly, e.g. from cron in the repository root:
+
+    0 3 * * * cd /path/to/repo && PYTHONPATH=app python -m utils.batch --max-workers 2
+"""
+import os
+import re
+import json
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils.logger import get_logger
+from utils.read_data import file_identity
+from utils.cache import publish_dir
+
+# Set up logging
+log = get_logger()
+
+DUMPS_DIR = "downloads/reddit-downloads"
+ARTIFACTS_DIR = "downloads/artifacts"
+
+# Bump when the pipeline output changes, so older artifacts are recomputed
+ARTIFACT_VERSION = 5
+
+# The dashboard inputs of the default view (no keyword, full year range)
+DEFAULT_VIEW = {
+    "min_chars": 100, "start_year": 2000, "end_year": 2024, "engine": "textblob", "n_topics": 5,
+    "spike_freq": "month", "spike_sensitivity": 3.0,
+}
+
+FIGURE_FILES = ["posts_per_year.png", "sentiment_distribution.png", "topic_trends.png", "topic_spikes.png"]
+
+
+def list_dump_files(folder=DUMPS_DIR):
+    """Lists the submission dumps in the specified folder."""
+    return sorted(os.path.join(folder, file) for file in os.listdir(folder) if file.endswith('_submissions.zst'))
+
+
+def artifact_dir(file_path, artifacts_dir=ARTIFACTS_DIR):
+    subreddit = os.path.basename(file_path).split('_')[0]
+    return os.path.join(artifacts_dir, subreddit, f"v{ARTIFACT_VERSION}")
+
+
+def remove_old_versions(file_path, artifacts_dir=ARTIFACTS_DIR):
+    """Removes the artifacts of a dump written by older versions of the pipeline."""
+    subreddit_dir = os.path.dirname(artifact_dir(file_path, artifacts_dir))
+    for name in os.listdir(subreddit_dir):
+        match = re.fullmatch(r"v(\d+)", name)
+        if match and int(match.group(1)) < ARTIFACT_VERSION:
+            log.info(f"Removing old artifacts {os.path.join(subreddit_dir, name)}")
+            shutil.rmtree(os.path.join(subreddit_dir, name), ignore_errors=True)
+
+
+def source_fingerprint(file_path, view=None):
+    """Everything the artifacts of a dump depend on."""
+    _, mtime_ns, size = file_identity(file_path)
+    return {"source_mtime_ns": mtime_ns, "source_size": size, "version": ARTIFACT_VERSION, "view": view or DEFAULT_VIEW}
+
+
+def read_manifest(file_path, artifacts_dir=ARTIFACTS_DIR):
+    try:
+        with open(os.path.join(artifact_dir(file_path, artifacts_dir), "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def is_up_to_date(file_path, artifacts_dir=ARTIFACTS_DIR):
+    manifest = read_manifest(file_path, artifacts_dir)
+    return manifest is not None and manifest["fingerprint"] == source_fingerprint(file_path)
+
+
+def precompute_dump(file_path, artifacts_dir=ARTIFACTS_DIR):
+    """
+    Runs the default analysis of one dump and writes its artifacts.
+
+    The artifacts are written to a temporary folder that replaces the previous version
+    only once complete, so the dashboard never sees a partial result. The artifacts of
+    older pipeline versions are removed afterwards.
+
+    Returns:
+        str: The folder of the artifacts.
+    """
+    # Imported here: the dashboard imports this module only to read artifacts
+    from utils.metrics import trace_run
+    from utils.query import make_query
+    from utils.pipeline import filter_stage, posts_per_year_stage, sentiment_stage, topic_stage
+
+    fingerprint = source_fingerprint(file_path)
+    view = DEFAULT_VIEW
+    query = make_query(file_path, view["min_chars"], None, view["start_year"], view["end_year"])
+
+    with trace_run("batch", file=os.path.basename(file_path)) as run:
+        filtered_df = filter_stage(query)
+        posts_fig = posts_per_year_stage(query)
+        _, sentiment_distribution, sentiment_fig = sentiment_stage(query, view["engine"])
+        trends_fig, spikes_fig, _ = topic_stage(
+            query, n_topics=view["n_topics"], spike_freq=view["spike_freq"], spike_sensitivity=view["spike_sensitivity"]
+        )
+
+    output_dir = artifact_dir(file_path, artifacts_dir)
+    tmp_dir = f"{output_dir}.tmp-{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name, image in zip(FIGURE_FILES, [posts_fig, sentiment_fig, trends_fig, spikes_fig]):
+        with open(os.path.join(tmp_dir, name), "wb") as f:
+            f.write(image)
+    filtered_df['year'].value_counts().sort_index().rename_axis('year').rename('posts').to_csv(os.path.join(tmp_dir, "posts_per_year.csv"))
+    sentiment_distribution.to_csv(os.path.join(tmp_dir, "sentiment_distribution.csv"), index=False)
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump({"source": os.path.abspath(file_path), "fingerprint": fingerprint, "rows": len(filtered_df), "metrics": run}, f, indent=2, default=str)
+
+    publish_dir(tmp_dir, output_dir)
+    remove_old_versions(file_path, artifacts_dir)
+    return output_dir
+
+
+def load_artifacts(file_path, view, artifacts_dir=ARTIFACTS_DIR):
+    """
+    Returns the precomputed analysis of a dump for the dashboard, or None if there is no
+    up-to-date artifact for these inputs.
+
+    Args:
+        file_path (str): Path of the dump.
+        view (dict): The dashboard inputs, compared with DEFAULT_VIEW.
+    """
+    if view != DEFAULT_VIEW or not os.path.exists(file_path) or not is_up_to_date(file_path, artifacts_dir):
+        return None
+    output_dir = artifact_dir(file_path, artifacts_dir)
+    figures = []
+    try:
+        for name in FIGURE_FILES:
+            with open(os.path.join(output_dir, name), "rb") as f:
+                figures.append(f.read())
+    except OSError:
+        # Replaced by a concurrent batch run; the next rerun reads the new version
+        return None
+    return {"figures": figures, "metrics": read_manifest(file_path, artifacts_dir)["metrics"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dumps-dir", default=DUMPS_DIR)
+    parser.add_argument("--artifacts-dir", default=ARTIFACTS_DIR)
+    parser.add_argument("--max-workers", type=int, default=2, help="Dumps processed at the same time.")
+    parser.add_argument("--force", action="store_true", help="Recompute dumps that did not change.")
+    args = parser.parse_args(argv)
+
+    dumps = list_dump_files(args.dumps_dir)
+    todo = [path for path in dumps if args.force or not is_up_to_date(path, args.artifacts_dir)]
+    log.info(f"{len(todo)} of {len(dumps)} dumps need precomputing")
+
+    failed = 0
+    # A fresh process per dump, so the memoized stage results of earlier dumps are freed
+    with ProcessPoolExecutor(max_workers=args.max_workers, max_tasks_per_child=1) as executor:
+        futures = {executor.submit(precompute_dump, path, args.artifacts_dir): path for path in todo}
+        for future in as_completed(futures):
+            try:
+                log.info(f"Wrote {future.result()}")
+            except Exception as e:
+                failed += 1
+                log.error(f"Precomputing {futures[future]} failed: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
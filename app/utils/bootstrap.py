@@ -0,0 +1,48 @@
+"""
+One-time offline provisioning of the NLTK data, keyword expansion table and transformer
+models used by the app.
+
+After this has run, the app starts without touching the network. Run from the repository root:
+
+    PYTHONPATH=app python -m utils.bootstrap
+"""
+import argparse
+
+from utils.clean_data import NLTK_DATA_DIR, check_nltk_resources
+from utils.keywords import KEYWORD_TABLE_DIR, build_expansion_table
+from utils.analyze_sentiment import EMOTION_MODEL
+from utils.summarize import SUMMARY_MODEL
+from utils.logger import get_logger
+
+# Set up logging
+log = get_logger()
+
+# Hugging Face models loaded by the app
+MODELS = [EMOTION_MODEL, SUMMARY_MODEL]
+
+
+def provision_models(models):
+    """Downloads the models into the local Hugging Face cache."""
+    from huggingface_hub import snapshot_download
+
+    for model in models:
+        log.info(f"Fetching model {model}")
+        snapshot_download(model)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download NLTK data and transformer models, and build the keyword table.")
+    parser.add_argument("--skip-models", action="store_true", help="Only download the NLTK data and build the keyword expansion table, without the transformer models.")
+    args = parser.parse_args(argv)
+
+    log.info(f"Provisioning NLTK data into {NLTK_DATA_DIR}")
+    check_nltk_resources()
+    log.info(f"Building keyword expansion table in {KEYWORD_TABLE_DIR}")
+    build_expansion_table()
+    if not args.skip_models:
+        provision_models(MODELS)
+    log.info("Done. Set HF_HUB_OFFLINE=1 to keep transformers from checking for model updates.")
+
+
+if __name__ == "__main__":
+    main()
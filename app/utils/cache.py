@@ -0,0 +1,86 @@
+import os
+import time
+import shutil
+import inspect
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+
+def memoize(maxsize=16, ttl=None, ignore=()):
+    """
+    Caches a function's results by its (hashable) arguments, shared by all callers in the process.
+
+    The cache lives at module level, so it survives Streamlit reruns and is shared across
+    sessions. Cached results are returned as is: callers must treat them as read-only.
+
+    Args:
+        maxsize (int): Number of entries kept; the least recently used entry is evicted first.
+        ttl (float, optional): Seconds after which an entry expires. None keeps entries until evicted.
+        ignore (Tuple[str, ...]): Keyword arguments left out of the key, e.g. progress callbacks.
+
+    Returns:
+        Callable: Decorator adding the cache, plus `cache_clear()` on the wrapped function.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        entries = OrderedDict()
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Bind to the signature so positional, keyword and default arguments share a key
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(item for item in bound.arguments.items() if item[0] not in ignore)
+            now = time.monotonic()
+            with lock:
+                if key in entries:
+                    created, result = entries[key]
+                    if ttl is None or now - created < ttl:
+                        entries.move_to_end(key)
+                        return result
+                    del entries[key]
+
+            result = func(*args, **kwargs)
+
+            with lock:
+                entries[key] = (now, result)
+                entries.move_to_end(key)
+                while len(entries) > maxsize:
+                    entries.popitem(last=False)
+            return result
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
+
+
+def publish_dir(tmp_dir, output_dir):
+    """
+    Replaces `output_dir` by the completely written `tmp_dir`.
+
+    A directory cannot be renamed onto a non-empty one, so the previous version is first
+    renamed aside and only deleted after the swap; readers never see a partial folder and
+    the folder is missing only between two renames.
+    """
+    # Hidden, so e.g. a Parquet dataset scan never mistakes it for a partition
+    parent_dir, name = os.path.split(output_dir)
+    old_dir = os.path.join(parent_dir, f".{name}.old-{os.getpid()}-{threading.get_ident()}")
+    try:
+        os.replace(output_dir, old_dir)
+    except FileNotFoundError:
+        old_dir = None
+    try:
+        os.replace(tmp_dir, output_dir)
+    except OSError:
+        if not os.path.isdir(output_dir):
+            raise
+        # Another writer published in between; keep its version
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
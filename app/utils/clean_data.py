@@ -1,56 +1,109 @@
-import logging
 import re
 import os
-import nltk
+from functools import lru_cache
 
-# Clear the NLTK cache to ensure it's using the fresh downloads
-# nltk.data.clear_cache()
+from utils.logger import get_logger
 
-# Check if resources are available
-def check_nltk_resources():
+# nltk takes seconds to import, so it is only imported on first use
+
+# Local NLTK data folder, filled by the offline bootstrap (utils/bootstrap.py)
+NLTK_DATA_DIR = "downloads/nltk_data"
+
+# (resource path, package) pairs needed by this module
+NLTK_RESOURCES = [
+    ('tokenizers/punkt_tab', 'punkt_tab'),
+    ('corpora/stopwords', 'stopwords'),
+    ('corpora/wordnet', 'wordnet'),
+    ('corpora/omw-1.4', 'omw-1.4'),
+]
+
+@lru_cache(maxsize=None)
+def ensure_nltk_resource(resource_path, package):
+    """
+    Makes sure an NLTK resource is available, downloading it only if it is missing.
+    Runs at most once per resource and process.
+    """
+    import nltk
+
+    if os.path.abspath(NLTK_DATA_DIR) not in nltk.data.path:
+        nltk.data.path.insert(0, os.path.abspath(NLTK_DATA_DIR))
     try:
-        nltk.data.find('tokenizers/punkt')
-        print("Punkt tokenizer is available!")
+        nltk.data.find(resource_path)
     except LookupError:
-        print("Punkt tokenizer not found, attempting to download...")
-        nltk.download('stopwords')
-        nltk.download('wordnet')
-        nltk.download('punkt_tab')
+        log.info(f"NLTK resource {package} not found, attempting to download...")
+        nltk.download(package, download_dir=NLTK_DATA_DIR, quiet=True)
 
-# Run the check function
-check_nltk_resources()
+# Check if resources are available
+def check_nltk_resources():
+    for resource_path, package in NLTK_RESOURCES:
+        ensure_nltk_resource(resource_path, package)
+
+@lru_cache(maxsize=None)
+def get_stop_words():
+    ensure_nltk_resource('corpora/stopwords', 'stopwords')
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+@lru_cache(maxsize=None)
+def get_lemmatizer():
+    ensure_nltk_resource('corpora/wordnet', 'wordnet')
+    ensure_nltk_resource('corpora/omw-1.4', 'omw-1.4')
+    from nltk.stem import WordNetLemmatizer
+    return WordNetLemmatizer()
 
 # Set up logging
-log = logging.getLogger("reddit_analysis")
-log.setLevel(logging.DEBUG)
-log.addHandler(logging.StreamHandler())
+log = get_logger()
+
+def build_keyword_regex(keywords):
+    """Regular expression matching any of the keywords (or phrases) as a whole word."""
+    return '|'.join([rf'\b{re.escape(k)}\b' for k in keywords])
+
+def post_matches(post, min_chars, keywords=None, start_year=None, end_year=None):
+    """
+    Applies the filters of `filter_data` to a single raw post (dict).
+    Used to estimate results while a dump is still being loaded.
+    """
+    selftext = post.get('selftext') or ''
+    if len(selftext) <= min_chars:
+        return False
+    if keywords and not re.search(build_keyword_regex(keywords), selftext, flags=re.IGNORECASE):
+        return False
+    year = post['created_datetime'].year
+    if start_year and year < start_year:
+        return False
+    if end_year and year > end_year:
+        return False
+    return True
 
 # Function to filter and process the DataFrame
 def filter_data(df, min_chars, keywords=None, start_year=None, end_year=None):
     log.info("Filtering data...")
     
-    # Filter columns
+    # Columns to keep
     columns_to_keep = [
         "title", "selftext", "score", "archived", "author",
         "created_utc", "id", "media", "num_comments",
         "subreddit", "created_datetime"
     ]
-    df = df[columns_to_keep]
     
     # Filter by text length
-    df = df[df['selftext'].str.len() > min_chars]
+    mask = df['selftext'].str.len().gt(min_chars).fillna(False).astype(bool)
     
     # Filter by keywords
     if keywords:
-        keyword_regex = '|'.join([rf'\b{k}\b' for k in keywords])
-        df = df[df['selftext'].str.contains(keyword_regex, flags=re.IGNORECASE, na=False)]
+        keyword_regex = build_keyword_regex(keywords)
+        mask &= df['selftext'].str.contains(keyword_regex, flags=re.IGNORECASE, na=False).astype(bool)
     
     # Filter by year range
-    df['year'] = df['created_datetime'].dt.year
+    year = df['created_datetime'].dt.year.astype('int16')
     if start_year:
-        df = df[df['year'] >= start_year]
+        mask &= year >= start_year
     if end_year:
-        df = df[df['year'] <= end_year]
+        mask &= year <= end_year
+    
+    # Select rows and columns in one step; the result is a new frame, not a view
+    df = df.loc[mask, columns_to_keep]
+    df['year'] = year[mask]
     
     log.info(f"Filtered data to {len(df):,} rows.")
     return df
@@ -72,13 +125,15 @@ def preprocess_text(text: str) -> str:
     text = re.sub(r'[^\w\s]', '', text)
     text = re.sub(r'\d+', '', text)
     # Tokenize
-    tokens = nltk.word_tokenize(text)
+    ensure_nltk_resource('tokenizers/punkt_tab', 'punkt_tab')
+    from nltk import word_tokenize
+    tokens = word_tokenize(text)
 
     # Remove stopwords
-    stop_words = set(nltk.corpus.stopwords.words('english'))
+    stop_words = get_stop_words()
     tokens = [word for word in tokens if word not in stop_words]
     # Lemmatize
-    lemmatizer = nltk.WordNetLemmatizer()
+    lemmatizer = get_lemmatizer()
     tokens = [lemmatizer.lemmatize(word) for word in tokens]
     return ' '.join(tokens)
 
@@ -87,17 +142,11 @@ def preprocess_text(text: str) -> str:
 
 # Linda added
 
-from nltk.corpus import wordnet
-from nltk.stem import WordNetLemmatizer
-
-# Download WordNet data if not already downloaded
-nltk.download('wordnet')
-nltk.download('omw-1.4')
-
 def generate_similar_words(keyword):
     
-    # Initialize WordNet Lemmatizer
-    lemmatizer = WordNetLemmatizer()
+    # Initialize WordNet Lemmatizer (downloads WordNet data if not already downloaded)
+    lemmatizer = get_lemmatizer()
+    from nltk.corpus import wordnet
     
     # Find synonyms using WordNet
     synonyms = set()
@@ -0,0 +1,271 @@
+"""
+One Parquet dataset of all dumps, partitioned by subreddit and year.
+
+Each `<subreddit>_submissions.zst` in downloads/reddit-downloads is converted once into
+hive-style partitions (downloads/dataset/subreddit=<name>/year=<year>/*.parquet). Every
+post also gets the length of its text and a flag for whether it counts as Northwestern-
+related, so the filters the dashboard applies per dump become predicates of one query:
+
+- subreddits and years select partition folders, the other folders are never opened;
+- the minimum length is compared with the row-group statistics of `selftext_len` (rows are
+  written sorted by it), so row groups of short posts are skipped without being read;
+- keywords are matched by Arrow while scanning the remaining row groups.
+
+Dumps are re-ingested only when they change:
+
+    PYTHONPATH=app python -m utils.dataset
+"""
+import os
+import json
+import tempfile
+import argparse
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from utils.logger import get_logger
+from utils.cache import publish_dir
+from utils.read_data import read_lines_zst, file_identity, compact_dataframe, NU_KEYWORDS, requires_nu_filter
+from utils.clean_data import build_keyword_regex
+
+# Set up logging
+log = get_logger()
+
+DUMPS_DIR = "downloads/reddit-downloads"
+DATASET_DIR = "downloads/dataset"
+
+# Fields read from each post of a dump
+POST_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("title", pa.string()),
+    ("selftext", pa.string()),
+    ("author", pa.string()),
+    ("score", pa.int64()),
+    ("num_comments", pa.int64()),
+    ("archived", pa.bool_()),
+    ("created_utc", pa.int64()),
+])
+# Each post is also stored with selftext_len and nu_related; subreddit and year are the partition keys
+PARTITIONING = ds.partitioning(pa.schema([("subreddit", pa.string()), ("year", pa.int16())]), flavor="hive")
+
+# Small row groups keep the length statistics selective
+ROWS_PER_GROUP = 16384
+
+# Files starting with "_" or "." are not part of the dataset
+MANIFEST_FILE = "_manifest.json"
+
+
+def subreddit_of(file_path):
+    return os.path.basename(file_path).split('_')[0]
+
+
+def read_manifest(dataset_dir=DATASET_DIR):
+    """Returns the source fingerprint of each ingested subreddit."""
+    try:
+        with open(os.path.join(dataset_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def source_fingerprint(file_path):
+    _, mtime_ns, size = file_identity(file_path)
+    return {"source": os.path.abspath(file_path), "mtime_ns": mtime_ns, "size": size}
+
+
+def is_ingested(file_path, dataset_dir=DATASET_DIR):
+    return read_manifest(dataset_dir).get(subreddit_of(file_path)) == source_fingerprint(file_path)
+
+
+def _posts_table(records, nu_filter):
+    """Builds the Arrow table of a chunk of parsed posts, sorted by text length."""
+    table = pa.Table.from_pylist(records, schema=POST_SCHEMA)
+    selftext = pc.fill_null(table["selftext"], "")
+    table = table.set_column(table.schema.get_field_index("selftext"), "selftext", selftext)
+    if nu_filter:
+        nu_related = pc.match_substring_regex(selftext, pattern=NU_KEYWORDS, ignore_case=True)
+    else:
+        nu_related = pa.array([True] * len(table), type=pa.bool_())
+    year = pc.cast(pc.year(pc.cast(table["created_utc"], pa.timestamp("s"))), pa.int16())
+    table = table.append_column("selftext_len", pc.cast(pc.utf8_length(selftext), pa.int32()))
+    table = table.append_column("nu_related", nu_related).append_column("year", year)
+    return table.sort_by("selftext_len")
+
+
+def ingest_dump(file_path, dataset_dir=DATASET_DIR, chunk_rows=250000):
+    """
+    Converts one dump into the partitions of its subreddit, replacing earlier ones.
+
+    The dump is streamed in chunks of `chunk_rows` posts; each chunk is written as one file
+    per year. The partitions are written to a hidden folder, which the dataset ignores, and
+    swapped in once complete.
+
+    Args:
+        file_path (str): Path to a `*_submissions.zst` file.
+        dataset_dir (str): Root folder of the dataset.
+        chunk_rows (int): Posts held in memory at a time.
+
+    Returns:
+        int: Number of posts ingested.
+    """
+    subreddit = subreddit_of(file_path)
+    nu_filter = requires_nu_filter(file_path)
+    output_dir = os.path.join(dataset_dir, f"subreddit={subreddit}")
+    os.makedirs(dataset_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".subreddit={subreddit}.tmp-", dir=dataset_dir)
+    log.info(f"Ingesting {file_path} into {output_dir}")
+
+    # Step 1: Parse the dump in chunks and write each chunk partitioned by year
+    year_partitioning = ds.partitioning(pa.schema([("year", pa.int16())]), flavor="hive")
+    records = []
+    chunks = 0
+    posts = 0
+    bad_lines = 0
+
+    def write_chunk():
+        ds.write_dataset(
+            _posts_table(records, nu_filter), tmp_dir, format="parquet", partitioning=year_partitioning,
+            basename_template=f"part-{chunks:05d}-{{i}}.parquet", existing_data_behavior="overwrite_or_ignore",
+            max_rows_per_group=ROWS_PER_GROUP, min_rows_per_group=min(ROWS_PER_GROUP, len(records)),
+            file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+        )
+
+    for line, _ in read_lines_zst(file_path):
+        try:
+            obj = json.loads(line)
+            record = {name: obj.get(name) for name in POST_SCHEMA.names}
+            record['created_utc'] = int(obj['created_utc'])
+            records.append(record)
+        except (KeyError, ValueError, TypeError, AttributeError):
+            bad_lines += 1
+            continue
+        if len(records) >= chunk_rows:
+            write_chunk()
+            posts += len(records)
+            chunks += 1
+            records = []
+    if records or not chunks:
+        os.makedirs(tmp_dir, exist_ok=True)
+        if records:
+            write_chunk()
+        posts += len(records)
+
+    # Step 2: Swap in the new partitions and record the source
+    publish_dir(tmp_dir, output_dir)
+    manifest = read_manifest(dataset_dir)
+    manifest[subreddit] = source_fingerprint(file_path)
+    tmp_manifest = os.path.join(dataset_dir, f".{MANIFEST_FILE}.tmp-{os.getpid()}")
+    with open(tmp_manifest, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, os.path.join(dataset_dir, MANIFEST_FILE))
+
+    log.info(f"Ingested {posts:,} posts of r/{subreddit} with {bad_lines:,} bad lines.")
+    return posts
+
+
+def ingest_all(dumps_dir=DUMPS_DIR, dataset_dir=DATASET_DIR, force=False):
+    """
+    Ingests every dump of `dumps_dir` that changed since it was last ingested.
+
+    Returns:
+        List[str]: The subreddits that were (re-)ingested.
+    """
+    os.makedirs(dataset_dir, exist_ok=True)
+    dumps = sorted(os.path.join(dumps_dir, file) for file in os.listdir(dumps_dir) if file.endswith('_submissions.zst'))
+    ingested = []
+    for path in dumps:
+        if force or not is_ingested(path, dataset_dir):
+            ingest_dump(path, dataset_dir)
+            ingested.append(subreddit_of(path))
+    log.info(f"Ingested {len(ingested)} of {len(dumps)} dumps")
+    return ingested
+
+
+def list_subreddits(dataset_dir=DATASET_DIR):
+    """Lists the subreddits in the dataset."""
+    return sorted(read_manifest(dataset_dir))
+
+
+def open_dataset(dataset_dir=DATASET_DIR):
+    return ds.dataset(dataset_dir, format="parquet", partitioning=PARTITIONING)
+
+
+def build_filter(subreddits=None, start_year=None, end_year=None, min_chars=0, keywords=None, nu_only=True, ids=None):
+    """
+    Builds the scan filter of a query.
+
+    Parameters:
+    - subreddits (List[str], optional): Subreddits to include; all if None.
+    - start_year, end_year (int, optional): Inclusive year range.
+    - min_chars (int): Posts need more than this many characters of text, as in `filter_data`.
+    - keywords (List[str], optional): Posts must contain one of these words or phrases.
+    - nu_only (bool): Posts of other subreddits must mention Northwestern, as in `load_reddit_data`.
+    - ids (List[str], optional): Only these posts.
+
+    Returns:
+    - pyarrow.dataset.Expression: The filter.
+    """
+    condition = ds.field("selftext_len") > min_chars
+    if subreddits:
+        condition &= ds.field("subreddit").isin(list(subreddits))
+    if start_year:
+        condition &= ds.field("year") >= start_year
+    if end_year:
+        condition &= ds.field("year") <= end_year
+    if nu_only:
+        condition &= ds.field("nu_related")
+    if ids is not None:
+        condition &= ds.field("id").isin(pa.array(list(ids), type=pa.string()))
+    if keywords:
+        condition &= pc.match_substring_regex(ds.field("selftext"), pattern=build_keyword_regex(keywords), ignore_case=True)
+    return condition
+
+
+def query_posts(subreddits=None, start_year=None, end_year=None, min_chars=0, keywords=None, nu_only=True, columns=None, dataset_dir=DATASET_DIR, ids=None):
+    """
+    Loads the posts that match a query from the dataset; see `build_filter` for the arguments.
+
+    Args:
+        columns (List[str], optional): Columns to read; all if None. Unread columns are never
+            decompressed.
+
+    Returns:
+        pd.DataFrame: The matching posts with compact dtypes and a `created_datetime` column
+        (if `created_utc` is read).
+    """
+    dataset = open_dataset(dataset_dir)
+    condition = build_filter(subreddits, start_year, end_year, min_chars, keywords, nu_only, ids)
+    table = dataset.to_table(columns=columns, filter=condition)
+    df = compact_dataframe(table.to_pandas())
+    if 'created_utc' in df:
+        df['created_datetime'] = pd.to_datetime(df['created_utc'], unit='s')
+    log.info(f"Queried {len(df):,} posts from the dataset.")
+    return df
+
+
+def count_posts(subreddits=None, start_year=None, end_year=None, min_chars=0, keywords=None, nu_only=True, dataset_dir=DATASET_DIR):
+    """
+    Counts the matching posts per subreddit and year, reading only the columns the filter needs.
+
+    Returns:
+        pd.DataFrame: One row per year and one column per subreddit.
+    """
+    columns = ["subreddit", "year"]
+    df = query_posts(subreddits, start_year, end_year, min_chars, keywords, nu_only, columns, dataset_dir)
+    return df.groupby(['year', 'subreddit'], observed=True).size().unstack(fill_value=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dumps-dir", default=DUMPS_DIR)
+    parser.add_argument("--dataset-dir", default=DATASET_DIR)
+    parser.add_argument("--force", action="store_true", help="Re-ingest dumps that did not change.")
+    args = parser.parse_args(argv)
+    ingest_all(args.dumps_dir, args.dataset_dir, args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,162 @@
+"""
+Near-duplicate detection for posts with MinHash signatures and LSH banding.
+
+Reposts, crossposts and templated bot posts are clustered by the Jaccard similarity of
+their word shingles. Each post is hashed once and only posts that share a band of their
+signature are compared, so the work grows roughly linearly with the number of posts.
+"""
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import get_logger
+
+# Set up logging
+log = get_logger()
+
+_WORD = re.compile(r"\w+")
+
+# Odd multipliers that combine the word hashes of a shingle
+_SHINGLE_MULTIPLIERS = [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x27D4EB2F165667C5]
+
+
+def shingle_hashes(texts, k=3):
+    """
+    Hashes the word k-shingles of all texts in one pass.
+
+    Args:
+        texts (Iterable[str]): The texts.
+        k (int): Number of words per shingle (at most 4).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The 32-bit shingle hashes of all texts, concatenated,
+        and the offset of the first shingle of each text.
+    """
+    word_hashes = {}
+    flat = []
+    starts = []
+    for text in texts:
+        words = _WORD.findall(str(text).lower())
+        # Texts shorter than a shingle are padded to form one shingle
+        words += [""] * (k - len(words))
+        starts.append(len(flat))
+        flat.extend(words)
+    if not flat:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+    hashes = np.array([word_hashes.get(w) or word_hashes.setdefault(w, zlib.crc32(w.encode())) for w in flat], dtype=np.uint64)
+
+    # Shingle i covers words i .. i + k - 1; the last k - 1 words of a text start no shingle
+    n = len(flat) - k + 1
+    combined = hashes[:n] * np.uint64(_SHINGLE_MULTIPLIERS[0])
+    for j in range(1, k):
+        combined += hashes[j:j + n] * np.uint64(_SHINGLE_MULTIPLIERS[j])
+    ends = np.append(starts[1:], len(flat)) - k + 1
+    valid = np.ones(n, dtype=bool)
+    for end in ends[:-1]:
+        valid[end:end + k - 1] = False
+    offsets = np.cumsum(np.concatenate([[0], (ends - starts)[:-1]]))
+    return combined[valid] >> np.uint64(32), offsets
+
+
+def minhash_signatures(texts, num_perm=64, k=3, seed=1):
+    """
+    Computes a MinHash signature per text.
+
+    Args:
+        texts (Iterable[str]): The texts.
+        num_perm (int): Number of hash functions, i.e. the signature length.
+        k (int): Number of words per shingle.
+        seed (int): Seed of the hash functions.
+
+    Returns:
+        np.ndarray: Signatures of shape (len(texts), num_perm).
+    """
+    hashes, offsets = shingle_hashes(texts, k)
+    # Multiply-shift hash functions: the high 32 bits of a * x + b (mod 2**64) for odd a
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+    signatures = np.empty((len(offsets), num_perm), dtype=np.uint64)
+    if len(offsets) == 0:
+        return signatures
+    for i in range(num_perm):
+        signatures[:, i] = np.minimum.reduceat((a[i] * hashes + b[i]) >> np.uint64(32), offsets)
+    return signatures
+
+
+def lsh_clusters(signatures, bands=16, threshold=0.8):
+    """
+    Clusters near-duplicate signatures.
+
+    Signatures are split into `bands` bands; posts with an identical band become candidates
+    and are merged if their signatures agree on at least `threshold` of the hash functions
+    (an estimate of their Jaccard similarity).
+
+    Args:
+        signatures (np.ndarray): MinHash signatures from `minhash_signatures`.
+        bands (int): Number of LSH bands; must divide the signature length.
+        threshold (float): Minimum estimated Jaccard similarity of duplicates.
+
+    Returns:
+        np.ndarray: The cluster of each post, given as the position of its first member.
+    """
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets = {}
+        band_view = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for i in range(n):
+            key = band_view[i].tobytes()
+            first = buckets.setdefault(key, i)
+            if first == i:
+                continue
+            root_first, root_i = find(first), find(i)
+            if root_first != root_i and np.mean(signatures[first] == signatures[i]) >= threshold:
+                # The earlier post represents the cluster
+                parent[max(root_first, root_i)] = min(root_first, root_i)
+
+    return np.array([find(i) for i in range(n)])
+
+
+def deduplicate(df, text_column='selftext', threshold=0.8, num_perm=64, bands=16):
+    """
+    Keeps one representative per cluster of near-identical texts.
+
+    Args:
+        df (pd.DataFrame): The posts.
+        text_column (str): Column compared between posts.
+        threshold (float): Minimum estimated Jaccard similarity of duplicates.
+        num_perm (int): MinHash signature length.
+        bands (int): Number of LSH bands.
+
+    Returns:
+        Tuple[pd.DataFrame, dict]: The first post of each cluster with a `dup_count` column
+        (the size of its cluster), and statistics with the number of posts, clusters and
+        the duplicate rate.
+    """
+    if df.empty:
+        return df.assign(dup_count=pd.Series(dtype='int32')), {"posts": 0, "clusters": 0, "duplicate_rate": 0.0}
+
+    clusters = lsh_clusters(minhash_signatures(df[text_column], num_perm), bands, threshold)
+    counts = np.bincount(clusters, minlength=len(df))
+    representatives = np.flatnonzero(clusters == np.arange(len(df)))
+    deduplicated = df.iloc[representatives].copy()
+    deduplicated['dup_count'] = counts[representatives].astype('int32')
+
+    stats = {
+        "posts": len(df),
+        "clusters": len(deduplicated),
+        "duplicate_rate": 1 - len(deduplicated) / len(df),
+    }
+    log.info(f"Removed {len(df) - len(deduplicated):,} near-duplicates ({stats['duplicate_rate']:.1%} of {len(df):,} posts).")
+    return deduplicated, stats
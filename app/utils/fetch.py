@@ -0,0 +1,146 @@
+import time
+import threading
+from itertools import product
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+
+from utils.read_data import make_reddit_client, post_to_record
+from utils.logger import get_logger
+
+# Set up logging
+log = get_logger()
+
+# Reddit allows 100 queries per minute per OAuth client; a listing page holds 100 posts
+DEFAULT_RATE = 100 / 60
+PAGE_SIZE = 100
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by all fetch workers.
+
+    The refill rate is re-derived from Reddit's quota headers (as exposed by
+    `praw.Reddit.auth.limits`) so the remaining requests are spread over the
+    rest of the rate-limit window.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=10):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` requests may be sent."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def update_from_limits(self, limits):
+        """
+        Adapts the bucket to the quota reported by Reddit.
+
+        Args:
+            limits (dict): Mapping with 'remaining' requests and the 'reset_timestamp' of the window.
+        """
+        remaining = limits.get('remaining')
+        reset_timestamp = limits.get('reset_timestamp')
+        if remaining is None or reset_timestamp is None:
+            return
+        window = max(reset_timestamp - time.time(), 1.0)
+        with self.lock:
+            self._refill()
+            # Never drop to zero so the bucket recovers once the window resets
+            self.rate = max(remaining, 1) / window
+            self.tokens = min(self.tokens, remaining)
+
+
+def make_fetch_pairs(subreddits, keywords):
+    """Returns every (subreddit, keyword) combination to fetch."""
+    return list(product(subreddits, keywords))
+
+
+def _fetch_pair(reddit, rate_limiter, subreddit_name, search_keyword, sort, limit):
+    rate_limiter.acquire()
+    records = []
+    for i, post in enumerate(reddit.subreddit(subreddit_name).search(search_keyword, sort=sort, limit=limit)):
+        # PRAW requests the next listing page after every PAGE_SIZE posts
+        if i and i % PAGE_SIZE == 0:
+            rate_limiter.update_from_limits(reddit.auth.limits)
+            rate_limiter.acquire()
+        record = post_to_record(post)
+        record['Keyword'] = search_keyword
+        records.append(record)
+    rate_limiter.update_from_limits(reddit.auth.limits)
+    return records
+
+
+def fetch_api_data_concurrently(
+    pairs, limit=1000, sort='relevance', max_workers=4, rate_limiter=None, on_partial=None, client_factory=None
+):
+    """
+    Fetches Reddit posts for many (subreddit, keyword) pairs concurrently.
+
+    Parameters:
+    - pairs (list): (subreddit, keyword) tuples to search.
+    - limit (int, optional): The maximum number of posts to fetch per pair. Default is 1000.
+    - sort (str, optional): Sort order of the searches. Default is 'relevance'.
+    - max_workers (int, optional): Number of searches running at the same time.
+    - rate_limiter (TokenBucket, optional): Limiter shared by the workers.
+    - on_partial (callable, optional): Called as `on_partial(df, done, total)` whenever a pair
+      completes, with only the posts of that pair that were not seen before.
+    - client_factory (callable, optional): Creates a Reddit client; called once per worker
+      thread because PRAW clients are not thread-safe. Defaults to `make_reddit_client`.
+
+    Returns:
+    - pd.DataFrame: Unique posts (by ID) with the columns of `get_api_data` plus the matching Keyword.
+    """
+    client_factory = client_factory or make_reddit_client
+    rate_limiter = rate_limiter or TokenBucket()
+    columns = ['ID', 'Title', 'Score', 'URL', 'Created', 'Subreddit', 'Text', 'Keyword']
+    clients = threading.local()
+
+    def fetch(subreddit_name, search_keyword):
+        if not hasattr(clients, 'reddit'):
+            clients.reddit = client_factory()
+        return _fetch_pair(clients.reddit, rate_limiter, subreddit_name, search_keyword, sort, limit)
+
+    post_data = []
+    seen_ids = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch, subreddit_name, search_keyword): (subreddit_name, search_keyword)
+            for subreddit_name, search_keyword in pairs
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            subreddit_name, search_keyword = futures[future]
+            try:
+                records = future.result()
+            except Exception as e:
+                log.warning(f"Fetching r/{subreddit_name} '{search_keyword}' failed: {e}")
+                records = []
+
+            # Deduplicate posts found by several pairs
+            new_records = []
+            for record in records:
+                if record['ID'] not in seen_ids:
+                    seen_ids.add(record['ID'])
+                    new_records.append(record)
+            post_data.extend(new_records)
+
+            if on_partial is not None:
+                on_partial(pd.DataFrame(new_records, columns=columns), done, len(futures))
+
+    log.info(f"Fetched {len(post_data):,} unique posts for {len(futures):,} subreddit/keyword pairs")
+    return pd.DataFrame(post_data, columns=columns)
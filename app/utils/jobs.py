@@ -0,0 +1,418 @@
+import os
+import zlib
+import uuid
+import time
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+
+from utils.analyze_sentiment import sentiment_distribution_from_counts
+from utils.query import AnalysisQuery, post_matches_query
+from utils.metrics import trace_run
+from utils.logger import get_logger
+
+# Set up logging
+log = get_logger()
+
+# Stages reported by an analysis job, in order
+STAGES = ["load", "filter", "comments", "dedup", "sentiment", "topics", "index"]
+
+# Minimum seconds between two live sentiment charts sent to the app
+PUBLISH_INTERVAL = 1.0
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a worker when the job was cancelled. Cancellation is checked between
+    stages and between the batches of the load, preprocessing and sentiment loops; fitting
+    the LDA model cannot be interrupted, so a job cancelled then stops once it is fitted.
+    """
+
+
+def _init_worker(torch_threads):
+    # Workers only render figures to PNG images, they never open windows
+    import matplotlib
+    matplotlib.use("Agg")
+    # Share the cores between the workers; torch reads this once, when it is first imported
+    os.environ["OMP_NUM_THREADS"] = str(torch_threads)
+
+
+def run_analysis_job(query, engine, n_topics, status, cancel_event, spike_freq="month", spike_sensitivity=3.0):
+    """
+    Runs the dashboard analysis for one query inside a worker process.
+
+    Besides the stage and progress, the job publishes results as soon as they exist:
+    `status['partial']` holds running posts-per-year counts during loading and the sentiment
+    distribution of the posts scored so far, `status['figures']` the figures of finished stages.
+
+    Args:
+        query (AnalysisQuery): The posts to analyze.
+        engine (str): Sentiment engine passed to the sentiment stage.
+        n_topics (int): Number of LDA topics.
+        status (dict): Shared dict the job writes its current stage and progress to.
+        cancel_event (multiprocessing.Event): Set by the app to cancel the job.
+        spike_freq (str): Bucket size of the spike detection.
+        spike_sensitivity (float): z-score threshold of the spike detection.
+
+    Returns:
+        dict: The figures of each stage, the sentiment distribution, the topic of each post,
+        the folder of the similar-posts index and the run's metrics.
+    """
+    # The pipeline (sklearn, seaborn, nltk) is only imported by the workers
+    from utils.pipeline import (
+        dedup_stage, filter_stage, load_stage, posts_per_year_stage, posts_stage, preprocess_stage, sentiment_stage,
+        similar_posts_stage, topic_stage
+    )
+
+    def check_cancelled(stage):
+        if cancel_event.is_set():
+            raise JobCancelled(f"Cancelled during {stage}")
+
+    def enter_stage(stage):
+        check_cancelled(stage)
+        status.update(stage=stage, progress=STAGES.index(stage) / len(STAGES))
+
+    def publish(**partial):
+        if 'first_insight_at' not in status:
+            status['first_insight_at'] = time.time()
+            log.info(f"First partial result after {time.time() - status['started_at']:.1f}s")
+        status['partial'] = dict(status.get('partial', {}), **partial)
+
+    def publish_figure(fig):
+        publish()
+        status['figures'] = status.get('figures', []) + [fig]
+
+    posts_per_year = Counter()
+
+    def load_progress(fraction, rows):
+        check_cancelled("load")
+        posts_per_year.update(row['created_datetime'].year for row in rows if post_matches_query(row, query))
+        status['progress'] = fraction / len(STAGES)
+        publish(posts_per_year=dict(sorted(posts_per_year.items())), load_fraction=fraction)
+
+    # Posts per (year, sentiment) scored so far, weighted by their near-duplicates
+    sentiment_counts = Counter()
+    last_published = [0.0]
+
+    def preprocess_progress(done, total):
+        check_cancelled("topics")
+        status['progress'] = (STAGES.index("topics") + 0.5 * done / total) / len(STAGES)
+
+    def sentiment_progress(done, total, labels):
+        check_cancelled("sentiment")
+        status['progress'] = (STAGES.index("sentiment") + done / total) / len(STAGES)
+        batch = posts_df.loc[labels.index]
+        weights = batch['dup_count'] if 'dup_count' in batch else pd.Series(1, index=batch.index)
+        sentiment_counts.update(weights.groupby([batch['created_datetime'].dt.year, labels]).sum().to_dict())
+        # Each update is copied to the app through the manager, so only send one per interval
+        if done < total and time.time() - last_published[0] < PUBLISH_INTERVAL:
+            return
+        last_published[0] = time.time()
+        publish(sentiment_distribution=sentiment_distribution_from_counts(sentiment_counts), scored_fraction=done / total)
+
+    status['started_at'] = time.time()
+
+    # Every stage records a span; the run is exported to logs/ and returned for the dashboard
+    with trace_run("analysis", file=os.path.basename(query.file_id[0]), source=query.source, engine=engine, n_topics=n_topics) as run:
+        enter_stage("load")
+        load_stage(query.file_id, progress_callback=load_progress)
+
+        enter_stage("filter")
+        filter_stage(query)
+        posts_fig = posts_per_year_stage(query)
+        publish_figure(posts_fig)
+
+        # Joins the comment threads for comment analyses, otherwise the filtered posts
+        enter_stage("comments")
+        posts_stage(query)
+
+        enter_stage("dedup")
+        posts_df = dedup_stage(query)
+
+        enter_stage("sentiment")
+        _, sentiment_distribution, sentiment_fig = sentiment_stage(query, engine, progress_callback=sentiment_progress)
+        publish_figure(sentiment_fig)
+
+        # Topics need posts, e.g. comment analyses where no matching post has comments have none
+        figures = [posts_fig, sentiment_fig]
+        topics = index_dir = None
+        if not posts_df.empty:
+            enter_stage("topics")
+            preprocess_stage(query, progress_callback=preprocess_progress)
+            check_cancelled("topics")
+            trends_fig, spikes_fig, topics = topic_stage(
+                query, n_topics=n_topics, spike_freq=spike_freq, spike_sensitivity=spike_sensitivity
+            )
+            figures += [trends_fig, spikes_fig]
+
+            enter_stage("index")
+            index_dir = similar_posts_stage(query)
+
+    status.update(stage="done", progress=1.0, finished_at=time.time())
+    return {
+        "figures": figures,
+        "sentiment_distribution": sentiment_distribution,
+        "topics": topics,
+        "index_dir": index_dir,
+        "metrics": run,
+    }
+
+
+def run_preview_job(query, engine, status, cancel_event):
+    """
+    Computes the sampled preview of a query inside a worker process (see `preview_pipeline`).
+
+    Each estimate, from the part of the dump read so far and then from each refinement
+    round, replaces `status['preview']`. The job stops when the estimate has converged, or
+    when it is cancelled because the exact analysis has finished.
+
+    Args:
+        query (AnalysisQuery): The posts to estimate.
+        engine (str): Sentiment engine.
+        status (dict): Shared dict the job writes its progress and estimates to.
+        cancel_event (multiprocessing.Event): Set by the app to cancel the job.
+
+    Returns:
+        dict: The last estimate.
+    """
+    from utils.pipeline import preview_pipeline
+
+    def load_progress(fraction):
+        if cancel_event.is_set():
+            raise JobCancelled("Cancelled during sample")
+        status['progress'] = fraction / 2
+
+    def on_estimate(estimate):
+        if 'first_insight_at' not in status:
+            status['first_insight_at'] = time.time()
+        if not estimate['complete']:
+            status['preview'] = estimate
+        else:
+            status.update(preview=estimate, progress=max(status['progress'], 0.5), stage="refine")
+        if cancel_event.is_set():
+            raise JobCancelled("Cancelled during refine")
+
+    status.update(started_at=time.time(), stage="sample")
+    with trace_run("preview", file=os.path.basename(query.file_id[0]), engine=engine):
+        estimate = preview_pipeline(query, engine, load_callback=load_progress, on_estimate=on_estimate)
+    status.update(stage="done", progress=1.0, finished_at=time.time())
+    return estimate
+
+
+class Job:
+    """An analysis submitted to the worker pool, possibly shared by several sessions."""
+
+    def __init__(self, key, future, status, cancel_event, executor=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.future = future
+        # The pool the job runs in, to replace that pool if a worker of it dies
+        self.executor = executor
+        self.status = status
+        self.cancel_event = cancel_event
+        self.sessions = set()
+        self.submitted = time.time()
+
+    @property
+    def state(self):
+        if not self.future.done():
+            # A cancelled job stops at its next stage boundary
+            if self.cancel_event.is_set():
+                return "cancelled"
+            return "running" if self.future.running() else "queued"
+        if self.future.cancelled() or isinstance(self.future.exception(), JobCancelled):
+            return "cancelled"
+        return "failed" if self.future.exception() else "done"
+
+    @property
+    def stage(self):
+        return self.status.get("stage", "queued")
+
+    @property
+    def progress(self):
+        return self.status.get("progress", 0.0)
+
+    @property
+    def partial(self):
+        return self.status.get("partial", {})
+
+    @property
+    def preview(self):
+        return self.status.get("preview")
+
+    @property
+    def figures(self):
+        return self.status.get("figures", [])
+
+    @property
+    def time_to_first_insight(self):
+        """Seconds from submission until the first partial result, or None if there is none yet."""
+        first_insight_at = self.status.get("first_insight_at")
+        return None if first_insight_at is None else first_insight_at - self.submitted
+
+    def result(self):
+        return self.future.result()
+
+    def error(self):
+        return self.future.exception()
+
+
+class JobManager:
+    """
+    Runs dashboard analyses in worker processes.
+
+    Each worker keeps the memoized stages (the loaded dump, filtered posts, ...) of the jobs
+    it ran, so jobs are routed by dump: every worker is a single-process pool of its own and
+    a query always goes to the worker picked by the hash of its `file_id`. A rerun with e.g.
+    a new year range thus reuses the loaded dump, at the cost of queueing behind other jobs
+    on the same dump while another worker may be idle.
+
+    Identical requests that are still in flight share one job, and each session may only
+    have `max_jobs_per_session` active jobs so one user cannot queue up all workers.
+    Previews run on their own workers, so a session's preview never takes a worker that
+    another session's analysis is waiting for.
+
+    If a worker process dies (out of memory, a crash in native code), its pool is broken:
+    its jobs fail with `BrokenProcessPool` and the worker is replaced by a new one.
+    """
+
+    def __init__(self, max_workers=2, max_jobs_per_session=1, max_preview_workers=1):
+        self.context = multiprocessing.get_context("spawn")
+        self.manager = self.context.Manager()
+        self.pool_sizes = {"analysis": max_workers, "preview": max_preview_workers}
+        self.executors = {kind: [self._new_executor() for _ in range(size)] for kind, size in self.pool_sizes.items()}
+        self.max_jobs_per_session = max_jobs_per_session
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def _new_executor(self):
+        torch_threads = max(1, (os.cpu_count() or 2) // sum(self.pool_sizes.values()))
+        return ProcessPoolExecutor(
+            max_workers=1, mp_context=self.context, initializer=_init_worker, initargs=(torch_threads,)
+        )
+
+    def _slot(self, kind, query):
+        """Index of the worker of `kind` that runs the jobs of the query's dump."""
+        return zlib.crc32(repr(query.file_id).encode()) % len(self.executors[kind])
+
+    def _replace_broken_executor(self, executor):
+        """Replaces the worker `executor`, unless that already happened. Call with the lock held."""
+        for kind, executors in self.executors.items():
+            for slot, current in enumerate(executors):
+                if current is executor:
+                    log.error(f"A worker process died; restarting {kind} worker {slot}")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executors[slot] = self._new_executor()
+
+    def _submit(self, kind, slot, fn, *args):
+        """Submits to a worker, replacing it once if it is broken. Call with the lock held."""
+        try:
+            return self.executors[kind][slot].submit(fn, *args)
+        except BrokenProcessPool:
+            self._replace_broken_executor(self.executors[kind][slot])
+            return self.executors[kind][slot].submit(fn, *args)
+
+    def _check_broken(self, job):
+        """Replaces the pool of a job that failed because a worker died. Call with the lock held."""
+        if job.future.done() and not job.future.cancelled() and isinstance(job.future.exception(), BrokenProcessPool):
+            self._replace_broken_executor(job.executor)
+
+    def _active_jobs(self, session_id, kind="analysis"):
+        return [
+            job for job in self.jobs.values()
+            if session_id in job.sessions and job.key[0] == kind and job.state in ("queued", "running")
+        ]
+
+    def submit(self, session_id, query: AnalysisQuery, engine="textblob", n_topics=5, preview=False, spike_freq="month", spike_sensitivity=3.0):
+        """
+        Submits an analysis, or joins an identical one that is still running.
+
+        Args:
+            session_id (str): Identifier of the requesting Streamlit session.
+            query (AnalysisQuery): The posts to analyze.
+            engine (str): Sentiment engine.
+            n_topics (int): Number of LDA topics.
+            preview (bool): Submit the sampled preview (`run_preview_job`) instead of the
+                exact analysis. Previews run in their own pool and are limited separately
+                from analyses, so one can run alongside the exact analysis of the same query.
+            spike_freq (str): Bucket size of the spike detection.
+            spike_sensitivity (float): z-score threshold of the spike detection.
+
+        Returns:
+            Job: The job computing the analysis.
+
+        Raises:
+            RuntimeError: If the session already has the maximum number of active jobs.
+        """
+        kind = "preview" if preview else "analysis"
+        key = (kind, query, engine) if preview else (kind, query, engine, n_topics, spike_freq, spike_sensitivity)
+        with self.lock:
+            for job in self.jobs.values():
+                self._check_broken(job)
+            # Drop finished jobs that nobody is waiting for
+            for job_id in [job_id for job_id, job in self.jobs.items() if not job.sessions and job.future.done()]:
+                del self.jobs[job_id]
+
+            for job in self.jobs.values():
+                if job.key == key and job.state in ("queued", "running"):
+                    log.info(f"Joining running job {job.id} for session {session_id}")
+                    job.sessions.add(session_id)
+                    return job
+
+            if len(self._active_jobs(session_id, kind)) >= self.max_jobs_per_session:
+                raise RuntimeError("An analysis is already running for this session. Cancel it or wait for it to finish.")
+
+            status = self.manager.dict(stage="queued", progress=0.0)
+            cancel_event = self.manager.Event()
+            slot = self._slot(kind, query)
+            if preview:
+                future = self._submit(kind, slot, run_preview_job, query, engine, status, cancel_event)
+            else:
+                future = self._submit(
+                    kind, slot, run_analysis_job, query, engine, n_topics, status, cancel_event, spike_freq, spike_sensitivity
+                )
+            job = Job(key, future, status, cancel_event, self.executors[kind][slot])
+            job.sessions.add(session_id)
+            self.jobs[job.id] = job
+            log.info(f"Submitted job {job.id} for session {session_id}")
+            return job
+
+    def get(self, job_id):
+        """Returns a job for polling; a job that failed because its worker died restarts the pool."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                self._check_broken(job)
+            return job
+
+    def release(self, job_id, session_id):
+        """
+        Detaches a session from a job. A job nobody waits for any more is cancelled if it is
+        still running, or dropped so its results can be garbage collected.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job.sessions.discard(session_id)
+            if job.sessions:
+                return
+            if job.future.done():
+                del self.jobs[job_id]
+            else:
+                job.cancel_event.set()
+                job.future.cancel()
+                log.info(f"Cancelled job {job.id}")
+
+    def shutdown(self):
+        """Cancels all jobs and stops the workers."""
+        with self.lock:
+            for job in self.jobs.values():
+                job.cancel_event.set()
+            for executors in self.executors.values():
+                for executor in executors:
+                    executor.shutdown(wait=True, cancel_futures=True)
+        self.manager.shutdown()
@@ -0,0 +1,192 @@
+import os
+import mmap
+from functools import lru_cache
+from itertools import zip_longest
+import numpy as np
+
+from utils.clean_data import generate_similar_words, get_lemmatizer
+from utils.logger import get_logger
+
+# Set up logging
+log = get_logger()
+
+# Precomputed expansion table, written by `build_expansion_table` (run by utils/bootstrap.py)
+KEYWORD_TABLE_DIR = "downloads/keyword-table"
+TABLE_FILE = "expansions.txt"
+OFFSETS_FILE = "offsets.npy"
+
+# Expansions kept per WordNet entry when the table is built
+MAX_TABLE_EXPANSIONS = 25
+
+
+def rank_similar_words(keyword, max_expansions=MAX_TABLE_EXPANSIONS):
+    """
+    Same words as `generate_similar_words`, ranked by usefulness for filtering:
+    the keyword and its lemmas, its plural, synonyms by WordNet frequency, then
+    the remaining suffix variations.
+
+    Args:
+        keyword (str): A WordNet lemma name; compounds use underscores.
+        max_expansions (int): Maximum number of words returned.
+
+    Returns:
+        List[str]: Ranked expansions, without duplicates.
+    """
+    from nltk.corpus import wordnet
+
+    lemmatizer = get_lemmatizer()
+    phrase = keyword.replace('_', ' ')
+
+    # Sum the corpus counts of every synonym over all senses of the keyword
+    synonym_counts = {}
+    for syn in wordnet.synsets(keyword):
+        for lemma in syn.lemmas():
+            synonym = lemma.name().replace('_', ' ')
+            synonym_counts[synonym] = synonym_counts.get(synonym, 0) + lemma.count()
+    synonyms = sorted(synonym_counts, key=lambda synonym: (-synonym_counts[synonym], synonym))
+
+    ranked = [phrase]
+    if '_' not in keyword:
+        ranked += [lemmatizer.lemmatize(keyword, pos=pos) for pos in ('n', 'v', 'a')]
+    ranked += [f"{phrase}s"] + synonyms + [f"{phrase}ed", f"{phrase}ing"]
+
+    return list(dict.fromkeys(ranked))[:max_expansions]
+
+
+def write_expansion_table(expansions, table_dir=KEYWORD_TABLE_DIR):
+    """
+    Writes an expansion table that can be searched without loading it.
+
+    The table is a text file with one sorted `key<TAB>word,word,...` line per key, plus
+    an array of line offsets for binary search.
+
+    Args:
+        expansions (Dict[str, List[str]]): Ranked expansions per lowercase key.
+        table_dir (str): Folder of the table.
+    """
+    os.makedirs(table_dir, exist_ok=True)
+    offsets = []
+    position = 0
+    with open(os.path.join(table_dir, TABLE_FILE), 'wb') as table_file:
+        for key in sorted(expansions, key=lambda key: key.encode()):
+            line = f"{key}\t{','.join(expansions[key])}\n".encode()
+            offsets.append(position)
+            table_file.write(line)
+            position += len(line)
+    np.save(os.path.join(table_dir, OFFSETS_FILE), np.array(offsets, dtype=np.int64))
+    _load_expansion_table.cache_clear()
+    _expand_keyword.cache_clear()
+    log.info(f"Wrote keyword expansion table with {len(offsets):,} entries to {table_dir}")
+
+
+def build_expansion_table(table_dir=KEYWORD_TABLE_DIR):
+    """Precomputes the ranked expansions of every WordNet lemma (takes a few minutes)."""
+    from nltk.corpus import wordnet
+
+    get_lemmatizer()  # makes sure WordNet is available
+    expansions = {name.lower(): rank_similar_words(name) for name in wordnet.all_lemma_names()}
+    write_expansion_table(expansions, table_dir)
+
+
+def table_version(table_dir=KEYWORD_TABLE_DIR):
+    """
+    Returns the (mtime, size) of the table's offsets, which are written last, or None if the
+    table has not been built. Cached lookups are keyed on it, so a table built by another
+    process is picked up.
+    """
+    try:
+        stat = os.stat(os.path.join(table_dir, OFFSETS_FILE))
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+@lru_cache(maxsize=4)
+def _load_expansion_table(table_dir, version):
+    if version is None or not os.path.exists(os.path.join(table_dir, TABLE_FILE)):
+        return None
+    with open(os.path.join(table_dir, TABLE_FILE), 'rb') as table_file:
+        table = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return table, np.load(os.path.join(table_dir, OFFSETS_FILE), mmap_mode='r')
+
+
+def load_expansion_table(table_dir=KEYWORD_TABLE_DIR):
+    """Memory-maps the current version of the expansion table, or returns None if it has not been built."""
+    return _load_expansion_table(table_dir, table_version(table_dir))
+
+
+def lookup_expansions(key, table_dir=KEYWORD_TABLE_DIR):
+    """
+    Binary-searches the table for `key`.
+
+    Returns:
+        List[str] | None: The ranked expansions, or None if the key is not in the table.
+    """
+    loaded = load_expansion_table(table_dir)
+    if loaded is None:
+        return None
+    table, offsets = loaded
+    target = key.encode()
+
+    low, high = 0, len(offsets)
+    while low < high:
+        middle = (low + high) // 2
+        start = int(offsets[middle])
+        candidate = table[start:table.find(b'\t', start)]
+        if candidate < target:
+            low = middle + 1
+        else:
+            high = middle
+    if low == len(offsets):
+        return None
+
+    start = int(offsets[low])
+    tab = table.find(b'\t', start)
+    if table[start:tab] != target:
+        return None
+    return table[tab + 1:table.find(b'\n', tab)].decode().split(',')
+
+
+def split_keywords(text):
+    """Splits comma-separated user input into normalized keywords and phrases."""
+    return [' '.join(part.lower().split()) for part in text.split(',') if part.strip()]
+
+
+@lru_cache(maxsize=1024)
+def _expand_keyword(keyword, table_dir, version):
+    # `version` (see `table_version`) drops the WordNet fallbacks once the table is built
+    expansions = lookup_expansions(keyword.replace(' ', '_'), table_dir)
+    if expansions is not None:
+        return expansions
+    if load_expansion_table(table_dir) is None:
+        # No table yet: fall back to walking WordNet
+        log.warning("Keyword expansion table missing, run utils/bootstrap.py to build it")
+        return [keyword] + [word for word in generate_similar_words(keyword) if word != keyword]
+    # Not a WordNet entry (e.g. a name): keep the word and its plural
+    return [keyword] if keyword.endswith('s') else [keyword, f"{keyword}s"]
+
+
+def expand_keywords(keywords, max_per_keyword=10, max_total=40, table_dir=KEYWORD_TABLE_DIR):
+    """
+    Expands keywords and phrases with their variants and synonyms for `filter_data`.
+
+    Args:
+        keywords (str | List[str]): Comma-separated text or a list of keywords/phrases.
+        max_per_keyword (int): Maximum number of (ranked) expansions per keyword.
+        max_total (int): Maximum number of words overall, so the filter regex stays small.
+
+    Returns:
+        List[str]: The keywords first, followed by their best expansions.
+    """
+    if isinstance(keywords, str):
+        keywords = split_keywords(keywords)
+    else:
+        keywords = [' '.join(keyword.lower().split()) for keyword in keywords if keyword.strip()]
+
+    version = table_version(table_dir)
+    expansions = [_expand_keyword(keyword, table_dir, version)[:max_per_keyword] for keyword in keywords]
+
+    # Interleave by rank so every keyword keeps its best expansions when capping
+    ranked = [word for rank in zip_longest(*expansions) for word in rank if word is not None]
+    return list(dict.fromkeys(keywords + ranked))[:max_total]
+
@@ -0,0 +1,15 @@
+import logging
+
+LOGGER_NAME = "reddit_analysis"
+
+
+def get_logger():
+    """
+    Returns the app logger, adding its handler only once per process
+    (every module used to add its own, which printed each message several times).
+    """
+    log = logging.getLogger(LOGGER_NAME)
+    if not log.handlers:
+        log.setLevel(logging.DEBUG)
+        log.addHandler(logging.StreamHandler())
+    return log
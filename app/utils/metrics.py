@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import time
+import contextvars
+from contextlib import contextmanager
+
+from utils.logger import get_logger
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Set up logging
+log = get_logger()
+
+# Where finished runs are exported
+METRICS_DIR = "logs"
+METRICS_LOG = os.path.join(METRICS_DIR, "metrics.jsonl")
+METRICS_PROM = os.path.join(METRICS_DIR, "metrics.prom")
+
+_current_trace = contextvars.ContextVar("reddit_analysis_trace", default=None)
+
+
+def peak_rss_mb():
+    """High-water mark of the resident memory of this process, in MB (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+@contextmanager
+def trace_run(name, **labels):
+    """
+    Collects the spans of one run (e.g. one dashboard analysis) and exports them when it ends.
+
+    Args:
+        name (str): Name of the run.
+        **labels: Extra fields stored with the run, e.g. the subreddit.
+
+    Yields:
+        dict: The run, with its 'spans' filled in as stages complete.
+    """
+    run = {"name": name, "labels": labels, "started_at": time.time(), "spans": []}
+    token = _current_trace.set(run)
+    start = time.perf_counter()
+    try:
+        yield run
+    finally:
+        run["wall_s"] = time.perf_counter() - start
+        _current_trace.reset(token)
+        export_run(run)
+
+
+@contextmanager
+def span(stage, rows_in=None):
+    """
+    Times one pipeline stage: wall time, CPU time, memory and row counts.
+
+    Memory is the process' peak RSS (a high-water mark over its whole lifetime, including
+    earlier jobs of a reused worker) and how much the stage raised it; a stage that stays
+    below an earlier peak shows a growth of 0.
+
+    Set `record['rows_out']` inside the block to record the size of the output.
+
+    Args:
+        stage (str): Name of the stage, e.g. "load" or "lda".
+        rows_in (int, optional): Number of input rows.
+
+    Yields:
+        dict: The span record.
+    """
+    record = {"stage": stage, "rows_in": rows_in, "rows_out": None}
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    peak_start = peak_rss_mb()
+    try:
+        yield record
+    finally:
+        record["wall_s"] = time.perf_counter() - wall_start
+        record["cpu_s"] = time.process_time() - cpu_start
+        record["process_peak_rss_mb"] = peak_rss_mb()
+        record["peak_rss_growth_mb"] = None if peak_start is None else record["process_peak_rss_mb"] - peak_start
+        log.debug(f"Stage {stage} took {record['wall_s']:.2f}s wall, {record['cpu_s']:.2f}s CPU")
+        run = _current_trace.get()
+        if run is not None:
+            run["spans"].append(record)
+
+
+def to_prometheus(run):
+    """Formats the spans of a run in the Prometheus text exposition format."""
+    metrics = [
+        ("wall_seconds", "wall_s", "Wall time of the stage in the last run."),
+        ("cpu_seconds", "cpu_s", "CPU time of the stage in the last run."),
+        ("process_peak_rss_megabytes", "process_peak_rss_mb", "Lifetime peak RSS of the process after the stage in the last run."),
+        ("peak_rss_growth_megabytes", "peak_rss_growth_mb", "Increase of the process peak RSS during the stage in the last run."),
+        ("rows_in", "rows_in", "Input rows of the stage in the last run."),
+        ("rows_out", "rows_out", "Output rows of the stage in the last run."),
+    ]
+    # A stage may run more than once per run: add up its times, rows and RSS growth, keep the highest peak
+    stages = {}
+    for record in run["spans"]:
+        totals = stages.setdefault(record["stage"], {})
+        for _, field, _ in metrics:
+            if record.get(field) is None:
+                continue
+            if field == "process_peak_rss_mb":
+                totals[field] = max(totals.get(field, 0), record[field])
+            else:
+                totals[field] = totals.get(field, 0) + record[field]
+
+    lines = []
+    for metric, field, help_text in metrics:
+        name = f"reddit_analysis_stage_{metric}"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for stage, totals in stages.items():
+            if field in totals:
+                lines.append(f'{name}{{run="{run["name"]}",stage="{stage}"}} {totals[field]}')
+    lines += [
+        "# HELP reddit_analysis_run_wall_seconds Wall time of the last run.",
+        "# TYPE reddit_analysis_run_wall_seconds gauge",
+        f'reddit_analysis_run_wall_seconds{{run="{run["name"]}"}} {run["wall_s"]}',
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def export_run(run, metrics_dir=None):
+    """Appends the run to the JSON log and rewrites the Prometheus text file with it."""
+    metrics_dir = metrics_dir or METRICS_DIR
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        with open(os.path.join(metrics_dir, os.path.basename(METRICS_LOG)), "a") as f:
+            f.write(json.dumps(run, default=str) + "\n")
+        prom_path = os.path.join(metrics_dir, os.path.basename(METRICS_PROM))
+        tmp_path = f"{prom_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(to_prometheus(run))
+        os.replace(tmp_path, prom_path)
+    except OSError as e:
+        log.warning(f"Could not export metrics: {e}")
@@ -1,48 +1,82 @@
-import logging
+import os
+import time
 import pandas as pd
-from utils.read_data import load_reddit_data
+from utils.cache import memoize
+from utils.logger import get_logger
+from utils.metrics import span
+from utils.read_data import load_reddit_data, load_comment_threads
+from utils.query import AnalysisQuery, post_matches_query
+from utils.sampling import sample_dump, refinement_rounds, estimate_posts_per_year, estimate_sentiment_distribution
 from utils.clean_data import filter_data, preprocess_text
-from utils.plots import plot_posts_per_year, plot_sentiment_distribution, plot_trends, plot_spikes
-from utils.analyze_clusters import perform_lda, display_topics, analyze_topics_over_time, detect_spikes, get_trending_topic
-from utils.analyze_sentiment import assign_sentiments, calculate_sentiment_distribution
+from utils.dedup import deduplicate
+from utils.similar import build_index, index_dir_for, touch_index, evict_indexes
+from utils.plots import render_png, plot_posts_per_year_counts, plot_sentiment_distribution, plot_trends, plot_spikes
+from utils.plots import plot_posts_per_year_ci, plot_sentiment_distribution_ci
+from utils.analyze_clusters import perform_lda, display_topics, analyze_topics_over_time, get_trending_topic
+from utils.spikes import topic_shares, detect_spikes_streaming, detect_spikes_resumable, spike_state_path, strongest_spikes
+from utils.analyze_sentiment import assign_sentiments, assign_transformer_sentiments, calculate_sentiment_distribution
 from utils.api import generate_summary_for_topics
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.decomposition import LatentDirichletAllocation
 
 # Set up logging
-log = logging.getLogger("reddit_analysis")
-log.setLevel(logging.DEBUG)
-log.addHandler(logging.StreamHandler())
+log = get_logger()
 
 # Main pipeline function
 def prepare_data_pipeline(file_path, min_chars, keywords=None, start_year=None, end_year=None, fig="Yes"):
     log.info("Starting Reddit Data Analysis...")
     
     # Step 1: Load data
-    df = load_reddit_data(file_path)
+    with span("load") as record:
+        df = load_reddit_data(file_path)
+        record['rows_out'] = len(df)
     
     # Step 2: Filter data
-    filtered_df = filter_data(df, min_chars, keywords, start_year, end_year)
+    with span("filter", rows_in=len(df)) as record:
+        filtered_df = filter_data(df, min_chars, keywords, start_year, end_year)
+        record['rows_out'] = len(filtered_df)
     
-    # Step 3: Generate plot
+    # Step 3: Generate plot (PNG image)
     if fig=="Yes":
-        fig = plot_posts_per_year(filtered_df)
+        with span("plot_posts_per_year"):
+            fig = render_png(plot_posts_per_year_counts, filtered_df['year'].value_counts().sort_index())
         return filtered_df, fig
     else:
         return filtered_df
 
-def sentiment_analysis_pipeline(submissions_df):
+def weight_column(df):
+    """
+    'dup_count' for deduplicated posts, so sentiment and topic counts still count every
+    post, including its near-duplicates, as posts-per-year does; None otherwise.
+    """
+    return 'dup_count' if 'dup_count' in df else None
+
+def sentiment_analysis_pipeline(submissions_df, engine="textblob", progress_callback=None):
     """
     Full pipeline to analyze sentiment and plot distribution over time.
+
+    Args:
+        submissions_df (pd.DataFrame): The filtered posts.
+        engine (str): "textblob" for polarity labels or "transformer" for emotion labels.
+        progress_callback (callable, optional): Called as `progress_callback(done, total, labels)`
+            after each batch of posts has been scored.
     """
     # Step 1: Assign sentiment to posts
-    submissions_with_sentiment = assign_sentiments(submissions_df)
+    with span("sentiment", rows_in=len(submissions_df)) as record:
+        if engine == "transformer":
+            submissions_with_sentiment = assign_transformer_sentiments(
+                submissions_df, progress_callback=progress_callback
+            )
+        else:
+            submissions_with_sentiment = assign_sentiments(submissions_df, progress_callback=progress_callback)
     
-    # Step 2: Calculate sentiment distribution
-    sentiment_distribution = calculate_sentiment_distribution(submissions_with_sentiment)
+        # Step 2: Calculate sentiment distribution
+        sentiment_distribution = calculate_sentiment_distribution(submissions_with_sentiment, weight_column(submissions_with_sentiment))
+        record['rows_out'] = len(sentiment_distribution)
     
-    # Step 3: Plot the sentiment distribution
-    fig = plot_sentiment_distribution(sentiment_distribution)
+    # Step 3: Plot the sentiment distribution (PNG image)
+    with span("plot_sentiment"):
+        fig = render_png(plot_sentiment_distribution, sentiment_distribution)
 
     return submissions_with_sentiment, sentiment_distribution, fig
 
@@ -51,7 +85,11 @@ def topic_modeling_pipeline(
     n_topics: int = 5, 
     max_features: int = 5000, 
     n_top_words: int = 10, 
-    n_examples: int = 3
+    n_examples: int = 3,
+    return_topics: bool = False,
+    spike_freq: str = "month",
+    spike_sensitivity: float = 3.0,
+    spike_state: str = None
 ) -> None:
     """
     Executes the entire pipeline: preprocessing, topic modeling, trend analysis, and visualization.
@@ -62,19 +100,31 @@ def topic_modeling_pipeline(
         max_features (int): Maximum features for vectorization.
         n_top_words (int): Number of top words to display per topic.
         n_examples (int): Number of example posts to display for each topic.
+        return_topics (bool): Also return the 'id' and topic label ('topic') of each post.
+        spike_freq (str): Bucket size of the spike detection: "day", "week", "month" or "year".
+        spike_sensitivity (float): z-score a topic's share must reach to be flagged as a spike.
+        spike_state (str): File to resume the spike detection from and save it to, so only
+            new periods are scored; if None, every period is scored from scratch.
     """
-    # Preprocess text
-    df['cleaned_text'] = df['selftext'].apply(preprocess_text)
+    # Preprocess text (unless a cached preprocessing stage already did)
+    if 'cleaned_text' not in df:
+        with span("preprocess", rows_in=len(df)) as record:
+            df['cleaned_text'] = df['selftext'].apply(preprocess_text)
+            record['rows_out'] = len(df)
 
     # Perform LDA
-    lda, vectorizer, topic_assignments = perform_lda(df['cleaned_text'], n_topics, max_features)
+    with span("lda", rows_in=len(df)) as record:
+        lda, vectorizer, topic_assignments = perform_lda(df['cleaned_text'], n_topics, max_features)
+        record['rows_out'] = n_topics
     
     # Add topic assignments to DataFrame
     df['dominant_topic'] = topic_assignments.argmax(axis=1) + 1  # 1-based indexing
     
     # Display topics
     topics = display_topics(lda, vectorizer.get_feature_names_out(), n_top_words)
-    summarized_topics = generate_summary_for_topics(topics)
+    with span("openai_summary", rows_in=len(topics)) as record:
+        summarized_topics = generate_summary_for_topics(topics)
+        record['rows_out'] = len(summarized_topics)
     print("Identified Topics:")
     for topic, words in summarized_topics.items():
         print(f"{topic}: {words}")
@@ -83,22 +133,39 @@ def topic_modeling_pipeline(
     topic_labels = {i + 1: summary for i, (topic, summary) in enumerate(summarized_topics.items())}
 
     # Analyze trends over time
-    topic_trends = analyze_topics_over_time(df, topic_assignments)
+    topic_trends = analyze_topics_over_time(df, topic_assignments, weight_column(df))
 
     # Replace numeric topic labels with summarized descriptions in trends
     topic_trends = topic_trends.rename(columns=topic_labels)
 
-    # Plot topic trends
-    fig1 = plot_trends(topic_trends)
+    # Plot topic trends (PNG image)
+    with span("plot_trends"):
+        fig1 = render_png(plot_trends, topic_trends)
 
-    # Detect and plot spikes
-    overall_trends = df.groupby('year').size()
-    spikes = detect_spikes(topic_trends, overall_trends)
+    # Detect and plot spikes: z-scores of each topic's share against its EWMA baseline
+    with span("spikes", rows_in=len(df)) as record:
+        if spike_state:
+            spikes = detect_spikes_resumable(
+                df, spike_freq, spike_state, list(topics.values()),
+                sensitivity=spike_sensitivity, weight_column=weight_column(df)
+            )
+        else:
+            shares, posts = topic_shares(df, spike_freq, weight_column=weight_column(df))
+            spikes, _ = detect_spikes_streaming(shares, posts, sensitivity=spike_sensitivity)
+        record['rows_out'] = len(spikes)
+        spikes = strongest_spikes(spikes)
 
     # Replace numeric topic labels with summarized descriptions in spikes
-    spikes = spikes.rename(columns=topic_labels)
-    fig2 = plot_spikes(spikes)
+    spikes = spikes.rename(columns={str(topic): label for topic, label in topic_labels.items()})
+    with span("plot_spikes"):
+        fig2 = render_png(
+            plot_spikes, spikes,
+            title=f"Spikes in Topic Popularity (z-score ≥ {spike_sensitivity:g})",
+            ylabel=spike_freq.capitalize(),
+        )
 
+    if return_topics:
+        return fig1, fig2, df[['id']].assign(topic=df['dominant_topic'].map(topic_labels))
     return fig1, fig2
 
 def trending_topic_pipeline(
@@ -136,4 +203,237 @@ def trending_topic_pipeline(
     # Call `get_trending_topic` for the specified month and year
     trending_topic, top_words = get_trending_topic(df, lda, vectorizer, year, month)
 
-    return trending_topic
\ No newline at end of file
+    return trending_topic
+
+
+def _score_sample(posts, query, engine, evaluated, matched, labels, size):
+    """Evaluates the posts of each year up to position `size`, updating the running counts and labels."""
+    new_posts = []
+    for year, year_posts in posts.items():
+        batch = [post for post in year_posts[evaluated.get(year, 0):size] if post_matches_query(post, query)]
+        evaluated[year] = min(size, len(year_posts))
+        matched[year] = matched.get(year, 0) + len(batch)
+        new_posts += batch
+    with span("sample_sentiment", rows_in=len(new_posts)) as record:
+        if new_posts:
+            scored = pd.DataFrame(new_posts)
+            scored = assign_transformer_sentiments(scored) if engine == "transformer" else assign_sentiments(scored)
+            for year, label in zip(scored['created_datetime'].dt.year, scored['sentiment']):
+                labels.setdefault(year, []).append(label)
+        record['rows_out'] = len(new_posts)
+
+
+def _preview_estimate(population, evaluated, matched, labels, tolerance, load_fraction, complete):
+    """Estimates with confidence intervals and their figures, as returned by `preview_pipeline`."""
+    posts_per_year = estimate_posts_per_year(population, evaluated, matched)
+    sentiment_distribution = estimate_sentiment_distribution(labels, dict(zip(posts_per_year['year'], posts_per_year['estimate'])))
+    max_error = ((sentiment_distribution['high'] - sentiment_distribution['low']) / 2).max() if len(sentiment_distribution) else 100.0
+    with span("plot_preview"):
+        figures = [render_png(plot_posts_per_year_ci, posts_per_year)]
+        if len(sentiment_distribution):
+            figures.append(render_png(plot_sentiment_distribution_ci, sentiment_distribution))
+    return {
+        'posts_per_year': posts_per_year,
+        'sentiment_distribution': sentiment_distribution,
+        'figures': figures,
+        'sampled': sum(evaluated.values()),
+        'population': sum(population.values()),
+        'max_error': max_error,
+        'converged': complete and max_error <= tolerance,
+        'load_fraction': load_fraction,
+        'complete': complete,
+    }
+
+
+def preview_pipeline(
+    query: AnalysisQuery, engine="textblob", capacity_per_year=1000, tolerance=5.0, load_callback=None, on_estimate=None,
+    snapshot_interval=5.0, snapshot_size=50
+):
+    """
+    Approximate posts-per-year and sentiment charts from a per-year stratified sample.
+
+    While the dump is streamed, every `snapshot_interval` seconds a subsample of at most
+    `snapshot_size` posts per year of the sample drawn so far is evaluated and passed to
+    `on_estimate`, so large dumps show estimates for the part read long before the end.
+    Once the dump is read, the sample is evaluated in rounds of growing size; after each
+    round the estimates and their 95% confidence intervals are passed to `on_estimate`.
+    Refinement stops once every sentiment percentage is known to within `tolerance`
+    percentage points, or when the whole sample has been evaluated.
+
+    Args:
+        query (AnalysisQuery): The posts to estimate.
+        engine (str): Sentiment engine, as in `sentiment_analysis_pipeline`.
+        capacity_per_year (int): Maximum number of posts sampled per year.
+        tolerance (float): Target half-width of the sentiment intervals in percentage points.
+        load_callback (callable, optional): Called as `load_callback(fraction)` while sampling.
+        on_estimate (callable, optional): Called with each estimate.
+        snapshot_interval (float): Minimum seconds between two estimates while streaming.
+        snapshot_size (int): Posts per year evaluated for an estimate while streaming.
+
+    Returns:
+        dict: The last estimate: 'posts_per_year' and 'sentiment_distribution' (DataFrames
+        with 'low' and 'high' bounds), their 'figures' (PNG images), 'sampled', 'population',
+        'max_error' (percentage points), 'converged', 'complete' (False for the estimates
+        while streaming) and 'load_fraction' (the fraction of the dump read).
+    """
+    def in_range(year):
+        return (query.start_year or year) <= year <= (query.end_year or year)
+
+    last_snapshot = [time.monotonic()]
+
+    def snapshot(sample, fraction):
+        # Step 1b: Estimates for the part of the dump read so far
+        if on_estimate is None or time.monotonic() - last_snapshot[0] < snapshot_interval:
+            return
+        posts = {year: year_posts for year, year_posts in sample.peek(snapshot_size).items() if in_range(year)}
+        population = {year: count for year, count in sample.population.items() if year in posts}
+        evaluated, matched, labels = {}, {}, {}
+        _score_sample(posts, query, engine, evaluated, matched, labels, snapshot_size)
+        on_estimate(_preview_estimate(population, evaluated, matched, labels, tolerance, fraction, False))
+        last_snapshot[0] = time.monotonic()
+
+    # Step 1: Draw the sample while streaming the dump
+    with span("sample") as record:
+        sample = sample_dump(query.file_id[0], capacity_per_year, progress_callback=load_callback, on_snapshot=snapshot)
+        posts = {year: year_posts for year, year_posts in sample.posts().items() if in_range(year)}
+        record['rows_out'] = sum(map(len, posts.values()))
+
+    population = {year: count for year, count in sample.population.items() if year in posts}
+    evaluated = {year: 0 for year in posts}
+    matched = {year: 0 for year in posts}
+    labels = {}
+    estimate = None
+
+    # Step 2: Evaluate growing prefixes of each year's sample
+    for size in refinement_rounds(capacity_per_year):
+        _score_sample(posts, query, engine, evaluated, matched, labels, size)
+
+        # Step 3: Estimates with confidence intervals
+        estimate = _preview_estimate(population, evaluated, matched, labels, tolerance, 1.0, True)
+        log.info(f"Preview from {estimate['sampled']:,} sampled posts, sentiment within ±{estimate['max_error']:.1f} points")
+        if on_estimate is not None:
+            on_estimate(estimate)
+        if estimate['converged'] or all(evaluated[year] == len(year_posts) for year, year_posts in posts.items()):
+            break
+
+    return estimate
+
+
+# Memoized stages used by the dashboard. Each stage is keyed by everything it depends on,
+# so e.g. a new year range reuses the loaded dump and a new n_topics reuses the preprocessing.
+STAGE_TTL = 60 * 60
+
+@memoize(maxsize=4, ttl=STAGE_TTL, ignore=('progress_callback',))
+def load_stage(file_id, progress_callback=None):
+    with span("load") as record:
+        df = load_reddit_data(file_id[0], progress_callback=progress_callback)
+        record['rows_out'] = len(df)
+    return df
+
+@memoize(maxsize=16, ttl=STAGE_TTL)
+def filter_stage(query: AnalysisQuery) -> pd.DataFrame:
+    if query.source != "submissions":
+        # The filtered submissions are shared by all sources
+        return filter_stage(query._replace(source="submissions", comments_id=None))
+    df = load_stage(query.file_id)
+    keywords = list(query.keywords) if query.keywords else None
+    with span("filter", rows_in=len(df)) as record:
+        filtered_df = filter_data(df, query.min_chars, keywords, query.start_year, query.end_year)
+        record['rows_out'] = len(filtered_df)
+    return filtered_df
+
+@memoize(maxsize=8, ttl=STAGE_TTL)
+def comment_threads_stage(query: AnalysisQuery) -> pd.DataFrame:
+    """
+    Replaces the text of each filtered submission by its comment thread, so the sentiment
+    and topic stages run over the discussion. Submissions without comments are dropped.
+    """
+    submissions = filter_stage(query)
+    with span("comments", rows_in=len(submissions)) as record:
+        threads = load_comment_threads(query.comments_id[0], submissions['id'])
+        threads['id'] = threads['id'].astype(submissions['id'].dtype)
+        df = submissions.rename(columns={'selftext': 'submission_text'}).join(
+            threads.set_index('id').rename(columns={'comment_text': 'selftext'}), on='id', how='inner'
+        )
+        record['rows_out'] = len(df)
+    return df
+
+def posts_stage(query: AnalysisQuery) -> pd.DataFrame:
+    """The rows the sentiment and topic stages analyze: filtered submissions or their comment threads."""
+    if query.source == "comments":
+        return comment_threads_stage(query)
+    return filter_stage(query)
+
+@memoize(maxsize=8, ttl=STAGE_TTL)
+def dedup_stage(query: AnalysisQuery) -> pd.DataFrame:
+    """
+    Removes near-duplicate posts (reposts, templated bot posts) before the sentiment and
+    topic stages. Each kept post carries the size of its cluster in `dup_count`, which the
+    sentiment percentages and topic trends are weighted by, so every chart still counts
+    posts (like `posts_per_year_stage`) while each text is only scored once.
+    """
+    df = posts_stage(query)
+    with span("dedup", rows_in=len(df)) as record:
+        deduplicated_df, stats = deduplicate(df)
+        record['rows_out'] = len(deduplicated_df)
+        record['duplicate_rate'] = stats['duplicate_rate']
+    return deduplicated_df
+
+@memoize(maxsize=16, ttl=STAGE_TTL)
+def posts_per_year_stage(query: AnalysisQuery):
+    posts_per_year = filter_stage(query)['year'].value_counts().sort_index()
+    with span("plot_posts_per_year"):
+        return render_png(plot_posts_per_year_counts, posts_per_year)
+
+@memoize(maxsize=16, ttl=STAGE_TTL, ignore=('progress_callback',))
+def sentiment_stage(query: AnalysisQuery, engine="textblob", progress_callback=None):
+    return sentiment_analysis_pipeline(dedup_stage(query).copy(), engine, progress_callback)
+
+@memoize(maxsize=16, ttl=STAGE_TTL, ignore=('progress_callback',))
+def preprocess_stage(query: AnalysisQuery, progress_callback=None, batch_size=2000) -> pd.DataFrame:
+    """
+    Adds the preprocessed text of each post as 'cleaned_text'. With a `progress_callback`,
+    posts are processed in batches and `progress_callback(done, total)` is called after each.
+    """
+    df = dedup_stage(query).copy()
+    with span("preprocess", rows_in=len(df)) as record:
+        if progress_callback is None:
+            df['cleaned_text'] = df['selftext'].apply(preprocess_text)
+        else:
+            batches = []
+            for start in range(0, len(df), batch_size):
+                batches.append(df['selftext'].iloc[start:start + batch_size].apply(preprocess_text))
+                progress_callback(start + len(batches[-1]), len(df))
+            df['cleaned_text'] = pd.concat(batches) if batches else pd.Series(dtype=object)
+        record['rows_out'] = len(df)
+    return df
+
+@memoize(maxsize=32, ttl=STAGE_TTL)
+def topic_stage(query: AnalysisQuery, n_topics=5, max_features=5000, n_top_words=10, spike_freq="month", spike_sensitivity=3.0):
+    """
+    Returns the trends and spikes figures and the topic of each post. The spike detection
+    resumes from the state of the last run on the same file, whatever its version.
+    """
+    state_key = (query._replace(file_id=query.file_id[0], comments_id=None), n_topics, max_features, spike_freq)
+    return topic_modeling_pipeline(
+        preprocess_stage(query).copy(), n_topics, max_features, n_top_words,
+        return_topics=True, spike_freq=spike_freq, spike_sensitivity=spike_sensitivity,
+        spike_state=spike_state_path(state_key)
+    )
+
+@memoize(maxsize=16, ttl=STAGE_TTL)
+def similar_posts_stage(query: AnalysisQuery) -> str:
+    """
+    Builds the similar-posts index of the analyzed posts once and returns its folder. Indexes
+    unused for longer than the stages are cached, or beyond the most recent ones, are removed.
+    """
+    output_dir = index_dir_for(query)
+    if os.path.exists(output_dir):
+        touch_index(output_dir)
+        return output_dir
+    df = preprocess_stage(query)
+    with span("similar_index", rows_in=len(df)) as record:
+        build_index(df, output_dir)
+        record['rows_out'] = len(df)
+    evict_indexes(os.path.dirname(output_dir), max_age=STAGE_TTL)
+    return output_dir
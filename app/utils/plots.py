@@ -1,3 +1,7 @@
+import io
+import hashlib
+import threading
+from collections import OrderedDict
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
@@ -5,10 +9,58 @@ import seaborn as sns
 # Set seaborn style for the new background color
 sns.set_theme(style="whitegrid", context="talk")
 
+# Rendered PNGs, keyed by plot function, data fingerprint and style
+RENDER_CACHE_SIZE = 64
+_render_cache = OrderedDict()
+_render_lock = threading.Lock()
+
+def data_fingerprint(data) -> str:
+    """Hashes the values, index and columns of a DataFrame or Series."""
+    digest = hashlib.sha1(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    digest.update(repr(getattr(data, 'columns', getattr(data, 'name', None))).encode())
+    return digest.hexdigest()
+
+def render_png(plot_func, data, dpi: int = 100, **style) -> bytes:
+    """
+    Renders `plot_func(data, **style)` to PNG bytes, reusing earlier renders of identical data.
+
+    The figure is closed right after rendering so a long-running server does not
+    accumulate matplotlib figures.
+
+    Args:
+        plot_func (Callable): One of the plot functions of this module.
+        data (pd.DataFrame | pd.Series): The aggregate data to plot.
+        dpi (int): Resolution of the image.
+        **style: Extra keyword arguments for `plot_func`.
+
+    Returns:
+        bytes: The PNG image.
+    """
+    key = (plot_func.__name__, data_fingerprint(data), dpi, tuple(sorted(style.items())))
+    with _render_lock:
+        if key in _render_cache:
+            _render_cache.move_to_end(key)
+            return _render_cache[key]
+
+    fig = plot_func(data, **style)
+    try:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=dpi, facecolor=fig.get_facecolor())
+    finally:
+        plt.close(fig)
+    image = buffer.getvalue()
+
+    with _render_lock:
+        _render_cache[key] = image
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return image
+
 # Function to plot the number of posts per year
 def plot_posts_per_year(df: pd.DataFrame):
-    posts_per_year = df['year'].value_counts().sort_index()
+    return plot_posts_per_year_counts(df['year'].value_counts().sort_index())
 
+def plot_posts_per_year_counts(posts_per_year: pd.Series):
     # Create the figure
     fig, ax = plt.subplots(figsize=(10, 6))
     sns.barplot(
@@ -48,10 +100,38 @@ def plot_sentiment_distribution(sentiment_distribution: pd.DataFrame):
     ax.set_title('Sentiment Distribution Over Time', fontsize=18, color='white')
     ax.set_xlabel('Year', fontsize=14, color='white')
     ax.set_ylabel('Percentage of Posts', fontsize=14, color='white')
-    ax.legend(
-        title='Sentiment', fontsize=12, title_fontsize=14, frameon=False, labelcolor='white'
+    if sentiment_distribution.empty:
+        # e.g. none of the matching posts has comments
+        ax.text(0.5, 0.5, 'No posts to analyze', transform=ax.transAxes, ha='center', va='center', fontsize=14, color='white')
+    else:
+        ax.legend(
+            title='Sentiment', fontsize=12, title_fontsize=14, frameon=False, labelcolor='white'
+        )
+        ax.get_legend().get_title().set_color('white')  # Ensure legend title is white
+    ax.tick_params(axis='x', rotation=45, colors='white')
+    ax.tick_params(axis='y', colors='white')
+    ax.grid(color='gray', linestyle='--', linewidth=0.5)
+
+    fig.patch.set_facecolor('#0F2C4C')  
+    ax.set_facecolor('#0F2C4C')  
+    fig.tight_layout()
+    return fig
+
+def plot_posts_per_year_ci(posts_per_year: pd.DataFrame):
+    """Estimated posts per year (year, estimate, low, high) with their confidence intervals."""
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.bar(posts_per_year['year'].astype(str), posts_per_year['estimate'], color='#4CAF50')
+    ax.errorbar(
+        posts_per_year['year'].astype(str), posts_per_year['estimate'],
+        yerr=[
+            (posts_per_year['estimate'] - posts_per_year['low']).clip(lower=0),
+            (posts_per_year['high'] - posts_per_year['estimate']).clip(lower=0),
+        ],
+        fmt='none', ecolor='white', capsize=4
     )
-    ax.get_legend().get_title().set_color('white')  # Ensure legend title is white
+    ax.set_title('Estimated Number of Posts per Year (95% CI)', fontsize=18, color='white')
+    ax.set_xlabel('Year', fontsize=14, color='white')
+    ax.set_ylabel('Number of Posts', fontsize=14, color='white')
     ax.tick_params(axis='x', rotation=45, colors='white')
     ax.tick_params(axis='y', colors='white')
     ax.grid(color='gray', linestyle='--', linewidth=0.5)
@@ -61,6 +141,16 @@ def plot_sentiment_distribution(sentiment_distribution: pd.DataFrame):
     fig.tight_layout()
     return fig
 
+def plot_sentiment_distribution_ci(sentiment_distribution: pd.DataFrame):
+    """`plot_sentiment_distribution` with a band for the confidence interval (low, high) of each line."""
+    fig = plot_sentiment_distribution(sentiment_distribution)
+    ax = fig.axes[0]
+    colors = dict(zip(sentiment_distribution['sentiment'].unique(), sns.color_palette('Set2')))
+    for sentiment, group in sentiment_distribution.groupby('sentiment'):
+        ax.fill_between(group['year'], group['low'], group['high'], color=colors[sentiment], alpha=0.25)
+    ax.set_title('Estimated Sentiment Distribution Over Time (95% CI)', fontsize=18, color='white')
+    return fig
+
 def plot_trends(topic_trends: pd.DataFrame) -> plt.Figure:
     fig, ax = plt.subplots(figsize=(12, 6))
     topic_trends.plot(kind='line', marker='o', colormap='tab10', ax=ax)
@@ -80,8 +170,64 @@ def plot_trends(topic_trends: pd.DataFrame) -> plt.Figure:
     fig.tight_layout()
     return fig
 
-def plot_spikes(spikes: pd.DataFrame) -> plt.Figure:
+def plot_posts_per_year_by_subreddit(posts_per_year: pd.DataFrame) -> plt.Figure:
+    """Matching posts per year (index) of each subreddit (columns)."""
     fig, ax = plt.subplots(figsize=(12, 6))
+    posts_per_year.plot(kind='line', marker='o', colormap='tab10', ax=ax)
+    ax.set_title('Posts per Year by Subreddit', fontsize=18, color='white')
+    ax.set_xlabel('Year', fontsize=14, color='white')
+    ax.set_ylabel('Number of Posts', fontsize=14, color='white')
+    ax.legend(
+        title='Subreddit', fontsize=12, title_fontsize=14, frameon=False, labelcolor='white'
+    )
+    ax.get_legend().get_title().set_color('white')
+    ax.tick_params(axis='x', rotation=45, colors='white')
+    ax.tick_params(axis='y', colors='white')
+    ax.grid(color='gray', linestyle='--', linewidth=0.5)
+
+    fig.patch.set_facecolor('#0F2C4C')
+    ax.set_facecolor('#0F2C4C')
+    fig.tight_layout()
+    return fig
+
+def plot_sentiment_by_subreddit(sentiment_shares: pd.DataFrame) -> plt.Figure:
+    """Percentage of posts per sentiment (columns) in each subreddit (index), as stacked bars."""
+    fig, ax = plt.subplots(figsize=(12, max(4, 0.8 * len(sentiment_shares))))
+    colors = {'Negative': '#E57373', 'Neutral': '#B0BEC5', 'Positive': '#4CAF50'}
+    sentiment_shares.plot(
+        kind='barh', stacked=True, ax=ax,
+        color=[colors.get(sentiment, '#FFB74D') for sentiment in sentiment_shares.columns],
+    )
+    ax.set_title('Sentiment by Subreddit', fontsize=18, color='white')
+    ax.set_xlabel('Percentage of Posts', fontsize=14, color='white')
+    ax.set_ylabel('Subreddit', fontsize=14, color='white')
+    ax.set_xlim(0, 100)
+    ax.legend(
+        title='Sentiment', fontsize=12, title_fontsize=14, frameon=False, labelcolor='white',
+        loc='upper left', bbox_to_anchor=(1, 1)
+    )
+    ax.get_legend().get_title().set_color('white')
+    ax.tick_params(axis='x', colors='white')
+    ax.tick_params(axis='y', colors='white')
+    ax.grid(color='gray', linestyle='--', linewidth=0.5)
+
+    fig.patch.set_facecolor('#0F2C4C')
+    ax.set_facecolor('#0F2C4C')
+    fig.tight_layout()
+    return fig
+
+def plot_spikes(
+    spikes: pd.DataFrame,
+    title: str = "Spikes in Topic Popularity (Percentage Change)",
+    ylabel: str = "Year"
+) -> plt.Figure:
+    fig, ax = plt.subplots(figsize=(12, max(6, 0.3 * len(spikes))))
+    if spikes.empty:
+        ax.text(0.5, 0.5, "No spikes at this sensitivity", ha='center', va='center', fontsize=16, color='white')
+        ax.set_title(title, fontsize=18, color='white')
+        ax.axis('off')
+        fig.patch.set_facecolor('#0F2C4C')
+        return fig
     heatmap = sns.heatmap(
         spikes, 
         cmap="coolwarm", 
@@ -91,9 +237,9 @@ def plot_spikes(spikes: pd.DataFrame) -> plt.Figure:
         ax=ax,
         annot_kws={"fontsize": 10, "color": "black"}
     )
-    ax.set_title("Spikes in Topic Popularity (Percentage Change)", fontsize=18, color='white')
+    ax.set_title(title, fontsize=18, color='white')
     ax.set_xlabel("Topic", fontsize=14, color='white')
-    ax.set_ylabel("Year", fontsize=14, color='white')
+    ax.set_ylabel(ylabel, fontsize=14, color='white')
     colorbar = heatmap.collections[0].colorbar
     colorbar.ax.yaxis.set_tick_params(color='white')  # Color for colorbar ticks
     plt.setp(colorbar.ax.yaxis.get_majorticklabels(), color='white')  # Color for tick labels
@@ -0,0 +1,33 @@
+import re
+from typing import NamedTuple, Optional, Tuple
+
+from utils.read_data import file_identity, comments_path_for, NU_KEYWORDS, requires_nu_filter
+from utils.clean_data import post_matches
+
+
+class AnalysisQuery(NamedTuple):
+    """Hashable description of the posts an analysis runs on, used as cache and job key."""
+    file_id: Tuple[str, int, int]
+    min_chars: int
+    keywords: Optional[Tuple[str, ...]] = None
+    start_year: Optional[int] = None
+    end_year: Optional[int] = None
+    # "submissions" analyzes the post texts, "comments" the comment threads of the posts
+    source: str = "submissions"
+    # Identity of the comment dump for "comments" queries, so results follow changes to it
+    comments_id: Optional[Tuple[str, int, int]] = None
+
+
+def make_query(file_path, min_chars, keywords=None, start_year=None, end_year=None, source="submissions") -> AnalysisQuery:
+    """Builds the cache key of an analysis from the dashboard inputs."""
+    keywords = tuple(sorted(set(keywords))) if keywords else None
+    comments_id = file_identity(comments_path_for(file_path)) if source == "comments" else None
+    return AnalysisQuery(file_identity(file_path), min_chars, keywords, start_year, end_year, source, comments_id)
+
+
+def post_matches_query(post, query: AnalysisQuery) -> bool:
+    """Applies the filters of the load and filter stages of a query to a single raw post (dict)."""
+    keywords = list(query.keywords) if query.keywords else None
+    if not post_matches(post, query.min_chars, keywords, query.start_year, query.end_year):
+        return False
+    return not requires_nu_filter(query.file_id[0]) or bool(re.search(NU_KEYWORDS, post.get('selftext') or '', flags=re.IGNORECASE))
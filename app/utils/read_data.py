@@ -2,17 +2,31 @@ import zstandard
 import os
 import json
 import pandas as pd
-import logging
 from datetime import datetime
 import re
+import time
+import zlib
+import shutil
+import hashlib
+import tempfile
+import importlib.util
+from collections import defaultdict
+from functools import lru_cache
 import praw
 from dotenv import load_dotenv
 
+from utils.logger import get_logger
+from utils.cache import publish_dir
+
 
 # Set up logging
-log = logging.getLogger("reddit_analysis")
-log.setLevel(logging.DEBUG)
-log.addHandler(logging.StreamHandler())
+log = get_logger()
+
+# Folder for cached Reddit API responses
+API_CACHE_DIR = "downloads/api-cache"
+
+# Folder for comment dumps split into partitions by submission id
+COMMENT_PARTITIONS_DIR = "downloads/comment-partitions"
 
 
 # Function to decode zstandard files
@@ -45,66 +59,294 @@ def read_lines_zst(file_name):
         reader.close()
 
 
+def file_identity(file_path):
+    """Returns (absolute path, mtime, size) so cached results are invalidated when a dump changes."""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size
+
+# Regular expression for the keywords every post of a non-Northwestern subreddit must match
+NU_KEYWORDS = r'\b(Northwestern|NU|wildcat|wildcats)\b'
+
+def requires_nu_filter(file_path):
+    """Posts from other subreddits are restricted to those mentioning Northwestern."""
+    return 'northwestern' not in file_path.lower()
+
 # Function to process the raw file into a DataFrame
-def load_reddit_data(file_path):
+def load_reddit_data(file_path, progress_callback=None, progress_every=50000):
+    """
+    Loads a redarcs submissions dump into a DataFrame.
+
+    Args:
+        file_path (str): Path to a `*_submissions.zst` file.
+        progress_callback (callable, optional): Called every `progress_every` lines as
+            `progress_callback(fraction, rows)` with the fraction of the file read and the
+            posts parsed since the previous call.
+        progress_every (int): Number of lines between two progress callbacks.
+    """
     log.info(f"Loading data from: {file_path}")
     file_size = os.stat(file_path).st_size
     data = []
     bad_lines = 0
-    for line, _ in read_lines_zst(file_path):
+    reported = 0
+    for i, (line, position) in enumerate(read_lines_zst(file_path), start=1):
         try:
             obj = json.loads(line)
             obj['created_datetime'] = datetime.utcfromtimestamp(int(obj['created_utc']))
             data.append(obj)
         except (KeyError, json.JSONDecodeError) as err:
             bad_lines += 1
+        if progress_callback is not None and i % progress_every == 0:
+            progress_callback(min(position / file_size, 1.0), data[reported:])
+            reported = len(data)
+    if progress_callback is not None:
+        progress_callback(1.0, data[reported:])
     log.info(f"Data loading complete with {len(data):,} rows and {bad_lines:,} bad lines.")
     
     df = pd.DataFrame(data)
-    if 'northwestern' not in file_path.lower():
-        NU_keywords = r'\b(Northwestern|NU|wildcat|wildcats)\b'  # Regular expression for the keywords
-        df = df[df['selftext'].str.contains(NU_keywords, flags=re.IGNORECASE, na=False)]
+    del data
+    if requires_nu_filter(file_path):
+        df = df[df['selftext'].str.contains(NU_KEYWORDS, flags=re.IGNORECASE, na=False)]
 
-    return df
+    # benchmarks/pipeline.py reports the memory saved by compacting
+    return compact_dataframe(df)
 
-def get_api_data(subreddit_name, search_keyword, limit=1000):
+# Repeated strings are stored once per category, free text as Arrow strings when pyarrow is installed
+CATEGORY_COLUMNS = ['subreddit', 'author']
+TEXT_COLUMNS = ['title', 'selftext', 'id']
+TEXT_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") else "string"
+
+def compact_dataframe(df):
     """
-    Function to fetch Reddit posts from a given subreddit based on a search keyword.
+    Converts a DataFrame of raw posts to compact dtypes.
 
     Parameters:
-    - subreddit_name (str): The name of the subreddit to search in.
-    - search_keyword (str): The keyword to search for in the subreddit.
-    - limit (int, optional): The maximum number of posts to fetch. Default is 1000.
+    - df (pd.DataFrame): Posts as parsed from a dump, with object columns.
+
+    Returns:
+    - pd.DataFrame: The same posts with categorical, string, boolean and downcast numeric columns.
+    """
+    dtypes = {}
+    for column in df.columns.intersection(CATEGORY_COLUMNS):
+        dtypes[column] = 'category'
+    for column in df.columns.intersection(TEXT_COLUMNS):
+        dtypes[column] = TEXT_DTYPE
+    if 'archived' in df and df['archived'].notna().all():
+        dtypes['archived'] = 'bool'
+    df = df.astype(dtypes)
+
+    for column in df.columns.intersection(['score', 'num_comments', 'created_utc']):
+        df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+def memory_per_million(df):
+    """Returns the memory of a DataFrame in MB, scaled to one million rows."""
+    if len(df) == 0:
+        return 0.0
+    return df.memory_usage(deep=True).sum() / 2**20 * 1_000_000 / len(df)
+
+def comments_path_for(submissions_path):
+    """Returns the path of the comment dump that belongs to a submissions dump."""
+    return submissions_path.replace("_submissions.zst", "_comments.zst")
+
+def comment_partition(link_id, n_partitions):
+    """Returns the partition that holds the comments of the submission `link_id`."""
+    return zlib.crc32(link_id.encode()) % n_partitions
+
+def partition_comments(comments_path, n_partitions=64, partitions_dir=COMMENT_PARTITIONS_DIR):
+    """
+    Streams a redarcs comment dump into `n_partitions` files on disk, hashed by the id of
+    the parent submission, so all comments of a thread end up in the same partition.
+
+    Only one line of the dump is held in memory at a time. Partitions are reused until the
+    dump changes; those of earlier versions of the dump are removed once the new ones are
+    published.
+
+    Args:
+        comments_path (str): Path to a `*_comments.zst` file.
+        n_partitions (int): Number of partition files.
+        partitions_dir (str): Folder the partitions of all dumps are written to.
+
+    Returns:
+        List[str]: Paths of the partition files (JSON lines with link_id, body and score).
+    """
+    _, mtime_ns, size = file_identity(comments_path)
+    output_dir = os.path.join(partitions_dir, f"{os.path.basename(comments_path)}-{mtime_ns}-{size}-{n_partitions}")
+    paths = [os.path.join(output_dir, f"part-{i:03d}.jsonl") for i in range(n_partitions)]
+    if os.path.exists(output_dir):
+        return paths
+
+    log.info(f"Partitioning comments from: {comments_path}")
+    os.makedirs(partitions_dir, exist_ok=True)
+    # Unique per writer, so concurrent partitioning of the same dump never shares files
+    tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(output_dir)}.tmp-", dir=partitions_dir)
+    partitions = [open(os.path.join(tmp_dir, os.path.basename(path)), "w") for path in paths]
+    comments = 0
+    bad_lines = 0
+    try:
+        for line, _ in read_lines_zst(comments_path):
+            try:
+                obj = json.loads(line)
+                # link_id is the fullname of the submission, e.g. "t3_abc123"
+                link_id = obj['link_id'].split('_', 1)[-1]
+                record = {'link_id': link_id, 'body': obj.get('body') or '', 'score': obj.get('score') or 0}
+            except (KeyError, AttributeError, json.JSONDecodeError):
+                bad_lines += 1
+                continue
+            partitions[comment_partition(link_id, n_partitions)].write(json.dumps(record) + "\n")
+            comments += 1
+    finally:
+        for partition in partitions:
+            partition.close()
+    # Publish the partitions only once complete, then drop those of earlier versions of the dump
+    publish_dir(tmp_dir, output_dir)
+    version = re.compile(rf"{re.escape(os.path.basename(comments_path))}-(\d+)-(\d+)-\d+")
+    for entry in os.scandir(partitions_dir):
+        match = version.fullmatch(entry.name)
+        if match and (int(match[1]), int(match[2])) != (mtime_ns, size):
+            log.info(f"Removing comment partitions of an earlier version: {entry.name}")
+            shutil.rmtree(entry.path, ignore_errors=True)
+    log.info(f"Partitioned {comments:,} comments into {n_partitions} partitions with {bad_lines:,} bad lines.")
+    return paths
+
+def load_comment_threads(comments_path, submission_ids, max_chars=20000, n_partitions=64, partitions_dir=COMMENT_PARTITIONS_DIR):
+    """
+    Joins a comment dump to a set of submissions and aggregates each thread.
+
+    The join runs one partition at a time (see `partition_comments`), so memory is bounded
+    by the largest partition and the aggregated threads, never the whole dump. Only the
+    partitions that hold comments of the submissions are read.
+
+    Args:
+        comments_path (str): Path to a `*_comments.zst` file.
+        submission_ids (Iterable[str]): Ids of the submissions to keep comments for.
+        max_chars (int): Maximum length of the text kept per thread.
 
     Returns:
-    - pd.DataFrame: A DataFrame containing post data (Title, Score, URL, Created, Subreddit, Text).
+        pd.DataFrame: One row per submission with comments: id, comment_count, comment_score
+        and comment_text (the comment bodies of the thread, joined).
+    """
+    submission_ids = set(submission_ids)
+    paths = partition_comments(comments_path, n_partitions, partitions_dir)
+    records = []
+    for partition_index in sorted({comment_partition(submission_id, n_partitions) for submission_id in submission_ids}):
+        path = paths[partition_index]
+        threads = defaultdict(list)
+        with open(path) as partition:
+            for line in partition:
+                comment = json.loads(line)
+                if comment['link_id'] in submission_ids and comment['body'] not in ('[deleted]', '[removed]'):
+                    threads[comment['link_id']].append(comment)
+        for link_id, comments in threads.items():
+            records.append({
+                'id': link_id,
+                'comment_count': len(comments),
+                'comment_score': sum(comment['score'] for comment in comments),
+                'comment_text': '\n'.join(comment['body'] for comment in comments)[:max_chars],
+            })
+    log.info(f"Joined comments to {len(records):,} of {len(submission_ids):,} submissions.")
+    return pd.DataFrame(records, columns=['id', 'comment_count', 'comment_score', 'comment_text'])
+
+def make_reddit_client():
+    """
+    Creates a new Reddit API client. PRAW clients are not thread-safe, so every thread
+    that talks to the API needs its own.
+
+    Returns:
+    - praw.Reddit: A read-only Reddit client configured from the environment.
     """
     # Load environment variables
     load_dotenv()
 
     # Set up Reddit API client
-    reddit = praw.Reddit(
+    return praw.Reddit(
         client_id=os.environ.get("REDDIT_CLIENT_ID"),
         client_secret=os.environ.get("REDDIT_CLIENT_SECRET"),
         user_agent='your_user_agent'
     )
 
-    # Search for posts in the specified subreddit with the given keyword
-    posts = reddit.subreddit(subreddit_name).search(search_keyword, sort='relevance', limit=limit)
-
-    # Create an empty list to store post data
-    post_data = []
-
-    # Extract relevant data from each post
-    for post in posts:
-        post_data.append({
-            'Title': post.title,
-            'Score': post.score,
-            'URL': post.url,
-            'Created': post.created_utc,
-            'Subreddit': post.subreddit.display_name,
-            'Text': post.selftext
-        })
+@lru_cache(maxsize=None)
+def get_reddit_client():
+    """Returns the Reddit API client shared by the sequential API calls of this process."""
+    return make_reddit_client()
+
+def post_to_record(post):
+    """Extracts the columns used by the app from a PRAW submission."""
+    return {
+        'ID': post.id,
+        'Title': post.title,
+        'Score': post.score,
+        'URL': post.url,
+        'Created': post.created_utc,
+        'Subreddit': post.subreddit.display_name,
+        'Text': post.selftext
+    }
+
+def _api_cache_path(cache_dir, subreddit_name, search_keyword, sort, limit):
+    key = json.dumps([subreddit_name.lower(), search_keyword.lower(), sort, limit])
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+def _read_api_cache(cache_path):
+    try:
+        with open(cache_path) as cache_file:
+            return json.load(cache_file)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def _write_api_cache(cache_path, posts):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as cache_file:
+        json.dump({'fetched_at': time.time(), 'posts': posts}, cache_file)
+    os.replace(tmp_path, cache_path)
+
+def get_api_data(subreddit_name, search_keyword, limit=1000, sort='relevance', cache_ttl=3600, cache_dir=API_CACHE_DIR):
+    """
+    Function to fetch Reddit posts from a given subreddit based on a search keyword.
+
+    Responses are cached on disk per (subreddit, keyword, sort, limit). A cached response
+    younger than `cache_ttl` is returned as is. An older one is fetched again, except for
+    sort='new', where only the posts newer than the newest cached post are fetched and put
+    in front; other orders cannot be merged because new posts may rank anywhere.
+
+    Parameters:
+    - subreddit_name (str): The name of the subreddit to search in.
+    - search_keyword (str): The keyword to search for in the subreddit.
+    - limit (int, optional): The maximum number of posts to fetch. Default is 1000.
+    - sort (str, optional): Sort order of the search. Default is 'relevance'.
+    - cache_ttl (float, optional): Seconds a cached response stays fresh. 0 disables the cache.
+    - cache_dir (str, optional): Folder for the cached responses.
+
+    Returns:
+    - pd.DataFrame: A DataFrame containing post data (ID, Title, Score, URL, Created, Subreddit, Text).
+    """
+    cache_path = _api_cache_path(cache_dir, subreddit_name, search_keyword, sort, limit)
+    cached = _read_api_cache(cache_path) if cache_ttl else None
+
+    if cached is not None and time.time() - cached['fetched_at'] < cache_ttl:
+        log.info(f"Using cached results for r/{subreddit_name} '{search_keyword}'")
+        return pd.DataFrame(cached['posts'])
+
+    subreddit = get_reddit_client().subreddit(subreddit_name)
+
+    if sort == 'new' and cached is not None and cached['posts']:
+        # Incremental refresh: newest posts first, stop at the first one we already have
+        newest = max(post['Created'] for post in cached['posts'])
+        new_posts = []
+        for post in subreddit.search(search_keyword, sort='new', limit=limit):
+            if post.created_utc <= newest:
+                break
+            new_posts.append(post_to_record(post))
+        new_ids = {post['ID'] for post in new_posts}
+        post_data = new_posts + [post for post in cached['posts'] if post['ID'] not in new_ids]
+        post_data = post_data[:limit]
+        log.info(f"Refreshed r/{subreddit_name} '{search_keyword}' with {len(new_posts):,} new posts")
+    else:
+        # Search for posts in the specified subreddit with the given keyword
+        posts = subreddit.search(search_keyword, sort=sort, limit=limit)
+        post_data = [post_to_record(post) for post in posts]
+
+    if cache_ttl:
+        _write_api_cache(cache_path, post_data)
 
     # Convert the list of post data to a DataFrame
     return pd.DataFrame(post_data)
@@ -120,15 +362,7 @@ def get_all_subreddits(limit=1000, keyword=None):
     Returns:
     - pd.DataFrame: A DataFrame containing subreddit names, subscribers, and descriptions.
     """
-    # Load environment variables
-    load_dotenv()
-
-    # Set up Reddit API client
-    reddit = praw.Reddit(
-        client_id=os.environ.get("REDDIT_CLIENT_ID"),
-        client_secret=os.environ.get("REDDIT_CLIENT_SECRET"),
-        user_agent='your_user_agent'
-    )
+    reddit = get_reddit_client()
 
     # Initialize the subreddit search
     if keyword:
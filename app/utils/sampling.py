@@ -0,0 +1,222 @@
+"""
+Approximate answers for exploratory queries: a per-year stratified sample of a dump with
+confidence intervals for the posts per year and the sentiment percentages.
+
+The year of each line is read with a regular expression, so only the sampled lines are
+parsed as JSON. While the dump is streamed, the reservoirs are a uniform sample of the lines
+read so far, so small estimates for the part of the dump read can be shown long before the
+end of a large dump. The full sample is then evaluated in rounds of growing size and
+refined until the intervals are narrow enough.
+"""
+import re
+import json
+import math
+import random
+import bisect
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from utils.logger import get_logger
+from utils.read_data import read_lines_zst, file_identity
+
+# Set up logging
+log = get_logger()
+
+# created_utc is an int in most dumps and a string in some older ones
+CREATED_UTC_PATTERN = re.compile(r'"created_utc"\s*:\s*"?(\d+)')
+
+# Timestamps of the first second of each year, to map created_utc to a year without datetime
+_YEARS = list(range(2005, 2036))
+_YEAR_STARTS = [datetime(year, 1, 1, tzinfo=timezone.utc).timestamp() for year in _YEARS]
+
+
+def year_of_line(line):
+    """Returns the year a raw dump line was posted in, or None if it has no created_utc."""
+    match = CREATED_UTC_PATTERN.search(line)
+    if match is None:
+        return None
+    position = bisect.bisect_right(_YEAR_STARTS, int(match.group(1))) - 1
+    return _YEARS[max(position, 0)]
+
+
+class StratifiedSample:
+    """
+    A uniform reservoir sample of the lines of each year, plus the exact number of lines per year.
+
+    Args:
+        capacity_per_year (int): Maximum number of lines kept per year.
+        seed (int): Seed of the reservoir sampling.
+    """
+
+    def __init__(self, capacity_per_year=1000, seed=0):
+        self.capacity_per_year = capacity_per_year
+        self.rng = random.Random(seed)
+        self.population = {}
+        self.reservoirs = {}
+
+    def add(self, year, line):
+        seen = self.population.get(year, 0) + 1
+        self.population[year] = seen
+        reservoir = self.reservoirs.setdefault(year, [])
+        if len(reservoir) < self.capacity_per_year:
+            reservoir.append(line)
+        else:
+            # Algorithm R: the i-th line replaces a random kept line with probability capacity / i
+            slot = self.rng.randrange(seen)
+            if slot < self.capacity_per_year:
+                reservoir[slot] = line
+
+    def posts(self):
+        """
+        Parses the sampled lines of each year, in random order, so every prefix of a year's
+        list is itself a uniform sample of that year.
+
+        Returns:
+            Dict[int, List[dict]]: The sampled posts per year.
+        """
+        posts = {}
+        for year, lines in sorted(self.reservoirs.items()):
+            parsed = _parse_lines(lines)
+            self.rng.shuffle(parsed)
+            posts[year] = parsed
+        return posts
+
+    def peek(self, n_per_year, seed=0):
+        """
+        Parses a uniform subsample of at most `n_per_year` of the lines kept so far, without
+        changing the reservoirs, e.g. for an estimate while the dump is still being read.
+
+        Returns:
+            Dict[int, List[dict]]: The subsampled posts per year.
+        """
+        rng = random.Random(seed)
+        return {
+            year: _parse_lines(rng.sample(lines, min(n_per_year, len(lines))))
+            for year, lines in sorted(self.reservoirs.items())
+        }
+
+
+def _parse_lines(lines):
+    parsed = []
+    for line in lines:
+        try:
+            post = json.loads(line)
+            post['created_datetime'] = datetime.utcfromtimestamp(int(post['created_utc']))
+            parsed.append(post)
+        except (KeyError, ValueError):
+            continue
+    return parsed
+
+
+def sample_dump(file_path, capacity_per_year=1000, seed=0, progress_callback=None, progress_every=100000, on_snapshot=None):
+    """
+    Streams a dump once and draws a stratified sample by year.
+
+    Args:
+        file_path (str): Path to a `*_submissions.zst` file.
+        capacity_per_year (int): Maximum number of posts sampled per year.
+        seed (int): Seed of the sample.
+        progress_callback (callable, optional): Called as `progress_callback(fraction)` every
+            `progress_every` lines with the fraction of the file read.
+        on_snapshot (callable, optional): Called as `on_snapshot(sample, fraction)` every
+            `progress_every` lines with the sample of the lines read so far.
+
+    Returns:
+        StratifiedSample: The sample and the number of posts per year.
+    """
+    file_size = file_identity(file_path)[2]
+    sample = StratifiedSample(capacity_per_year, seed)
+    for i, (line, position) in enumerate(read_lines_zst(file_path), start=1):
+        year = year_of_line(line)
+        if year is not None:
+            sample.add(year, line)
+        if i % progress_every == 0:
+            if progress_callback is not None:
+                progress_callback(min(position / file_size, 1.0))
+            if on_snapshot is not None:
+                on_snapshot(sample, min(position / file_size, 1.0))
+    log.info(f"Sampled {sum(map(len, sample.reservoirs.values())):,} of {sum(sample.population.values()):,} posts.")
+    return sample
+
+
+def wilson_interval(successes, n, population=None, z=1.96):
+    """
+    Wilson score interval of a proportion, with a finite population correction.
+
+    Args:
+        successes (int): Number of sampled items with the property.
+        n (int): Sample size.
+        population (float, optional): Size of the population the sample was drawn from
+            without replacement; the interval shrinks to the point estimate as n approaches it.
+        z (float): Normal quantile of the confidence level (1.96 for 95%).
+
+    Returns:
+        Tuple[float, float]: Lower and upper bound of the proportion.
+    """
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    fpc = 1.0
+    if population is not None and population > 1:
+        fpc = math.sqrt(max(population - n, 0) / (population - 1))
+    denominator = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominator * fpc
+    # With the correction the interval is centered between the Wilson center and p
+    center = p + (center - p) * fpc
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def estimate_posts_per_year(population, sampled, matched, z=1.96):
+    """
+    Estimates the number of matching posts per year from a stratified sample.
+
+    Args:
+        population (Dict[int, int]): Number of posts per year in the dump.
+        sampled (Dict[int, int]): Number of sampled posts evaluated per year.
+        matched (Dict[int, int]): Number of those that match the query.
+
+    Returns:
+        pd.DataFrame: year, estimate, low, high and sampled per year.
+    """
+    rows = []
+    for year in sorted(sampled):
+        n, k, total = sampled[year], matched.get(year, 0), population[year]
+        low, high = wilson_interval(k, n, total, z)
+        rows.append({'year': year, 'estimate': total * k / n if n else 0.0, 'low': total * low, 'high': total * high, 'sampled': n})
+    return pd.DataFrame(rows, columns=['year', 'estimate', 'low', 'high', 'sampled'])
+
+
+def estimate_sentiment_distribution(labels, estimated_totals, z=1.96):
+    """
+    Estimates the sentiment percentages per year from the labels of the sampled matching posts.
+
+    Args:
+        labels (Dict[int, List[str]]): Sentiment labels of the sampled matching posts per year.
+        estimated_totals (Dict[int, float]): Estimated number of matching posts per year,
+            used for the finite population correction.
+
+    Returns:
+        pd.DataFrame: The columns of `calculate_sentiment_distribution` plus the interval
+        bounds 'low' and 'high' of each percentage.
+    """
+    rows = []
+    for year, year_labels in sorted(labels.items()):
+        counts = pd.Series(year_labels, dtype=object).value_counts()
+        for sentiment, count in counts.items():
+            low, high = wilson_interval(count, len(year_labels), estimated_totals.get(year), z)
+            rows.append({
+                'year': year, 'sentiment': sentiment, 'count': count, 'total': len(year_labels),
+                'percentage': count / len(year_labels) * 100, 'low': low * 100, 'high': high * 100,
+            })
+    return pd.DataFrame(rows, columns=['year', 'sentiment', 'count', 'total', 'percentage', 'low', 'high'])
+
+
+def refinement_rounds(capacity_per_year, first_round=50):
+    """Sample sizes per year of the successive rounds, doubling up to the capacity."""
+    size = first_round
+    while size < capacity_per_year:
+        yield size
+        size *= 2
+    yield capacity_per_year
@@ -0,0 +1,180 @@
+"""
+Similar-posts search over an analyzed corpus.
+
+Posts are embedded as L2-normalized LSA vectors (TF-IDF reduced with a truncated SVD) and
+stored as a float32 matrix under downloads/indexes. A query is one matrix-vector product
+and an `argpartition` for the top k, an exact search that takes milliseconds for a million
+posts; the matrix is memory-mapped, so opening an index does not load it.
+
+Each analysis gets its own index; `evict_indexes` keeps the folder bounded by removing the
+least recently used ones.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from utils.logger import get_logger
+from utils.cache import publish_dir
+
+# Set up logging
+log = get_logger()
+
+INDEX_DIR = "downloads/indexes"
+
+# Indexes kept on disk; each holds a float32 vector per analyzed post
+MAX_INDEXES = 32
+
+
+def index_dir_for(key, index_dir=INDEX_DIR):
+    """Returns the folder of the index for a cache key, e.g. an AnalysisQuery."""
+    return os.path.join(index_dir, hashlib.sha1(repr(key).encode()).hexdigest()[:16])
+
+
+def embed_posts(texts, n_components=64, max_features=20000):
+    """
+    Embeds texts as normalized LSA vectors.
+
+    Args:
+        texts (Iterable[str]): Preprocessed texts, e.g. the 'cleaned_text' column.
+        n_components (int): Dimensions of the vectors.
+        max_features (int): Vocabulary size of the TF-IDF vectorizer.
+
+    Returns:
+        np.ndarray: float32 vectors of shape (len(texts), at most n_components).
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.decomposition import TruncatedSVD
+
+    tfidf = TfidfVectorizer(max_features=max_features, sublinear_tf=True).fit_transform(texts)
+    n_components = min(n_components, tfidf.shape[1] - 1, tfidf.shape[0] - 1)
+    if n_components >= 1:
+        vectors = TruncatedSVD(n_components=n_components, random_state=42).fit_transform(tfidf)
+    else:
+        vectors = tfidf.toarray()
+    vectors = vectors.astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def build_index(df, output_dir, text_column='cleaned_text', n_components=64):
+    """
+    Embeds the posts of an analysis and writes the index to `output_dir`.
+
+    Args:
+        df (pd.DataFrame): Posts with 'id', 'title', 'year' and the text column.
+        output_dir (str): Folder of the index; replaced if it exists.
+        text_column (str): Column to embed.
+        n_components (int): Dimensions of the vectors.
+
+    Returns:
+        str: The folder of the index.
+    """
+    vectors = embed_posts(df[text_column], n_components)
+    parent_dir = os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(output_dir)}.tmp-", dir=parent_dir)
+    np.save(os.path.join(tmp_dir, "vectors.npy"), vectors)
+    posts = pd.DataFrame({'id': df['id'].astype(str), 'title': df['title'].astype(str), 'year': df['year'].astype(int)})
+    posts.to_json(os.path.join(tmp_dir, "posts.jsonl"), orient='records', lines=True)
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump({"posts": len(df), "dimensions": vectors.shape[1]}, f)
+    publish_dir(tmp_dir, output_dir)
+    log.info(f"Built similar-posts index of {len(df):,} posts in {output_dir}")
+    return output_dir
+
+
+def touch_index(index_dir):
+    """Marks an index as used, so `evict_indexes` keeps it."""
+    try:
+        os.utime(index_dir)
+    except FileNotFoundError:
+        pass
+
+
+def evict_indexes(index_dir=INDEX_DIR, keep=MAX_INDEXES, max_age=None):
+    """
+    Removes all but the `keep` most recently used indexes, and those unused for `max_age`
+    seconds (including folders left behind by interrupted builds).
+
+    Returns:
+        List[str]: The removed folders.
+    """
+    try:
+        entries = [entry for entry in os.scandir(index_dir) if entry.is_dir()]
+    except FileNotFoundError:
+        return []
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    published = [entry for entry in entries if not entry.name.startswith('.')]
+    removed = [entry.path for entry in published[keep:]]
+    if max_age is not None:
+        cutoff = time.time() - max_age
+        removed += [entry.path for entry in entries if entry.stat().st_mtime < cutoff and entry.path not in removed]
+    for path in removed:
+        shutil.rmtree(path, ignore_errors=True)
+    if removed:
+        log.info(f"Evicted {len(removed)} similar-posts indexes from {index_dir}")
+    return removed
+
+
+def load_index(index_dir):
+    """
+    Opens an index written by `build_index`.
+
+    Returns:
+        dict: 'vectors' (memory-mapped), 'posts' (id, title, year) and 'positions' (id -> row).
+    """
+    posts = pd.read_json(os.path.join(index_dir, "posts.jsonl"), orient='records', lines=True, dtype={'id': str})
+    return {
+        'vectors': np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode='r'),
+        'posts': posts,
+        'positions': pd.Series(np.arange(len(posts)), index=posts['id']),
+    }
+
+
+def search(index, vector, k=10, exclude=()):
+    """
+    Returns the k posts whose vectors have the highest cosine similarity to `vector`.
+
+    Args:
+        index (dict): An index from `load_index`.
+        vector (np.ndarray): The query vector (normalized or not).
+        k (int): Number of posts to return.
+        exclude (Iterable[int]): Rows that must not be returned, e.g. the query post.
+
+    Returns:
+        pd.DataFrame: The posts with a 'similarity' column, most similar first.
+    """
+    scores = np.asarray(index['vectors'] @ vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        scores = scores / norm
+    exclude = list(exclude)
+    if exclude:
+        scores[exclude] = -np.inf
+    k = min(k, len(scores) - len(exclude))
+    if k <= 0:
+        return index['posts'].iloc[[]].assign(similarity=[])
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return index['posts'].iloc[top].assign(similarity=scores[top])
+
+
+def similar_posts(index, post_id, k=10):
+    """Returns the k posts most similar to the post with id `post_id`."""
+    position = int(index['positions'][post_id])
+    return search(index, np.asarray(index['vectors'][position]), k, exclude=[position])
+
+
+def posts_like_topic(index, post_ids, k=10):
+    """Returns the k posts closest to the centroid of a topic, given the ids of its posts."""
+    positions = index['positions'].reindex(post_ids).dropna().astype(int).to_numpy()
+    if len(positions) == 0:
+        return index['posts'].iloc[[]].assign(similarity=[])
+    centroid = np.asarray(index['vectors'][np.sort(positions)]).mean(axis=0)
+    return search(index, centroid, k)
@@ -0,0 +1,277 @@
+"""
+Incremental spike detection on topic shares per day, week or month.
+
+Each series (topic) keeps an exponentially weighted mean and variance of its share of
+the posts. A new bucket is scored by its z-score against that baseline and then folded
+into it, so adding buckets costs constant time per topic and never rescans the history.
+The state can be saved and resumed when new data arrives: `detect_spikes_resumable`
+keeps it on disk per analysis, so a refresh only counts the posts of buckets the saved
+detector has not folded in yet.
+
+A share computed from a handful of posts is noisy by itself, so the spread a bucket is
+compared with is at least the binomial standard error of the baseline share for the
+number of posts in the bucket, and buckets with fewer than `min_posts` posts (including
+empty ones) are skipped: they are neither scored nor folded into the baseline.
+"""
+import os
+import json
+import math
+import hashlib
+
+import pandas as pd
+
+from utils.logger import get_logger
+
+# Set up logging
+log = get_logger()
+
+# Bucket sizes offered by the dashboard, as pandas period frequencies
+FREQUENCIES = {"day": "D", "week": "W", "month": "M", "year": "Y"}
+
+# Saved detector states of the analyses, see `detect_spikes_resumable`
+SPIKE_STATE_DIR = "downloads/spike-state"
+
+
+class SpikeDetector:
+    """
+    EWMA mean/variance z-scores per series.
+
+    Args:
+        alpha (float): Weight of the newest bucket in the baseline (0 < alpha <= 1).
+        min_periods (int): Buckets a series needs before it can be flagged.
+    """
+
+    def __init__(self, alpha=0.3, min_periods=3):
+        self.alpha = alpha
+        self.min_periods = min_periods
+        self.last_bucket = None
+        self.series = {}
+
+    def score(self, values, posts=None):
+        """
+        Returns the z-score of each value against its series' baseline, without updating it.
+
+        Args:
+            values (dict): The share of each series in the new bucket.
+            posts (int, optional): Number of posts the shares were computed from; the
+                deviation is then at least the binomial standard error of the baseline.
+
+        Returns:
+            dict: z-scores; NaN for series that are still warming up.
+        """
+        scores = {}
+        for name, value in values.items():
+            mean, var, n = self.series.get(name, (0.0, 0.0, 0))
+            if n < self.min_periods:
+                scores[name] = math.nan
+                continue
+            # A floor of one percentage point keeps flat series from flagging tiny changes
+            floor = 0.01 ** 2
+            if posts:
+                # Binomial variance of the bucket's share, plus that of the EWMA baseline itself,
+                # at the share pooled from both as in a two-proportion test
+                pooled = (mean + value) / 2
+                floor = max(floor, pooled * (1 - pooled) / posts * (1 + self.alpha / (2 - self.alpha)))
+            scores[name] = (value - mean) / math.sqrt(max(var, floor))
+        return scores
+
+    def update(self, bucket, values, posts=None):
+        """
+        Scores a new bucket and folds it into the baselines (O(1) per series).
+
+        Args:
+            bucket (str): Label of the bucket; buckets must arrive in order.
+            values (dict): The share of each series in the bucket.
+            posts (int, optional): Number of posts in the bucket, see `score`.
+
+        Returns:
+            dict: The z-scores of the bucket, see `score`.
+        """
+        scores = self.score(values, posts)
+        for name, value in values.items():
+            mean, var, n = self.series.get(name, (value, 0.0, 0))
+            diff = value - mean
+            increment = self.alpha * diff
+            self.series[name] = (mean + increment, (1 - self.alpha) * (var + diff * increment), n + 1)
+        self.last_bucket = bucket
+        return scores
+
+    def to_dict(self):
+        return {"alpha": self.alpha, "min_periods": self.min_periods, "last_bucket": self.last_bucket, "series": self.series}
+
+    @classmethod
+    def from_dict(cls, state):
+        detector = cls(state["alpha"], state["min_periods"])
+        detector.last_bucket = state["last_bucket"]
+        detector.series = {name: tuple(values) for name, values in state["series"].items()}
+        return detector
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def topic_shares(df, freq="month", topic_column='dominant_topic', weight_column=None):
+    """
+    Share of the posts of each bucket that belong to each topic.
+
+    Args:
+        df (pd.DataFrame): Posts with 'created_datetime' and a topic column.
+        freq (str): One of FREQUENCIES.
+        weight_column (str, optional): Column with the number of posts each row stands for,
+            e.g. 'dup_count' after deduplication; the shares are weighted by it.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.Series]: One row per bucket with posts and one column per
+        topic, and the number of rows of each bucket. Buckets without posts are left out.
+        The row counts are not weighted: copies of a post are not independent observations.
+    """
+    periods = df['created_datetime'].dt.to_period(FREQUENCIES[freq])
+    groups = df.groupby([periods, df[topic_column]])
+    rows = groups.size().unstack(fill_value=0)
+    counts = rows if weight_column is None else groups[weight_column].sum().unstack(fill_value=0)
+    counts.columns = counts.columns.astype(str)
+    return counts.div(counts.sum(axis=1), axis=0), rows.sum(axis=1)
+
+
+def score_buckets(shares, posts=None, detector=None, min_posts=5, include_open_bucket=True):
+    """
+    Runs the detector over the buckets it has not seen yet; see `detect_spikes_streaming`.
+
+    Returns:
+        Tuple[pd.DataFrame, SpikeDetector]: The z-scores of every scored bucket and the
+        updated detector.
+    """
+    detector = detector or SpikeDetector()
+    if posts is not None:
+        kept = posts.reindex(shares.index).fillna(0) >= min_posts
+        shares, posts = shares[kept], posts.reindex(shares.index)[kept]
+    rows = {}
+    labels = [str(bucket) for bucket in shares.index]
+    counts = [None] * len(labels) if posts is None else [int(n) for n in posts]
+    new = [i for i, label in enumerate(labels) if detector.last_bucket is None or label > detector.last_bucket]
+    for i in new[:-1]:
+        rows[labels[i]] = detector.update(labels[i], shares.iloc[i].to_dict(), counts[i])
+    if new and include_open_bucket:
+        rows[labels[new[-1]]] = detector.score(shares.iloc[new[-1]].to_dict(), counts[new[-1]])
+    return pd.DataFrame.from_dict(rows, orient='index', columns=shares.columns), detector
+
+
+def flag_spikes(z_scores, sensitivity=3.0):
+    """Keeps the z-scores of at least `sensitivity`, for the buckets that contain one."""
+    spikes = z_scores[z_scores >= sensitivity].dropna(how='all')
+    spikes.index.name = 'period'
+    return spikes
+
+
+def detect_spikes_streaming(shares, posts=None, detector=None, sensitivity=3.0, min_posts=5, include_open_bucket=True):
+    """
+    Runs the detector over the buckets it has not seen yet and flags spikes.
+
+    The newest bucket may still be incomplete, so it is scored but not folded into the
+    baselines; a later refresh with more data scores it again.
+
+    Args:
+        shares (pd.DataFrame): Shares per bucket, see `topic_shares`.
+        posts (pd.Series, optional): Number of posts per bucket, see `topic_shares`.
+        detector (SpikeDetector, optional): Resumed state; a new detector if None.
+        sensitivity (float): z-score a bucket must reach to count as a spike; lower values
+            flag more spikes.
+        min_posts (int): Buckets with fewer posts are skipped and the baselines carried
+            forward unchanged.
+        include_open_bucket (bool): Also score the newest bucket.
+
+    Returns:
+        Tuple[pd.DataFrame, SpikeDetector]: The z-scores of the flagged spikes (NaN elsewhere)
+        for the buckets that contain at least one, and the updated detector.
+    """
+    z_scores, detector = score_buckets(shares, posts, detector, min_posts, include_open_bucket)
+    return flag_spikes(z_scores, sensitivity), detector
+
+
+def spike_state_path(key, state_dir=SPIKE_STATE_DIR):
+    """Returns the file of the saved detector state of an analysis, given a hashable key."""
+    return os.path.join(state_dir, hashlib.sha1(repr(key).encode()).hexdigest()[:16] + ".json")
+
+
+def read_spike_state(path, topics):
+    """
+    Returns the saved (detector, z-scores of the folded buckets, start of the first unfolded
+    bucket), or None if there is none for these `topics`.
+    """
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if state.get("topics") != topics:
+        return None
+    history = pd.DataFrame(**state["history"]) if state["history"]["index"] else None
+    return SpikeDetector.from_dict(state["detector"]), history, pd.Timestamp(state["resume_from"])
+
+
+def write_spike_state(path, topics, detector, history, resume_from):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "topics": topics, "detector": detector.to_dict(), "history": history.to_dict(orient='split'),
+            "resume_from": resume_from.isoformat(),
+        }, f)
+    os.replace(tmp_path, path)
+
+
+def detect_spikes_resumable(df, freq, state_path, topics, sensitivity=3.0, min_posts=5, topic_column='dominant_topic', weight_column=None):
+    """
+    Flags spikes like `detect_spikes_streaming` over `topic_shares(df, freq)`, resuming from
+    the state the previous run of the same analysis saved at `state_path`.
+
+    Only the posts from the first bucket the saved detector has not folded in are counted;
+    the z-scores of the earlier buckets come from the state. The state is used only if it was
+    saved for the same `topics` (e.g. the top words of each topic), because a refitted topic
+    model may number its topics differently; posts added to already folded buckets are not
+    counted until the state is reset.
+
+    Args:
+        df (pd.DataFrame): Posts with 'created_datetime' and a topic column.
+        freq (str): One of FREQUENCIES.
+        state_path (str): File of the saved state, see `spike_state_path`.
+        topics (list): JSON-serializable description of the topics.
+        sensitivity, min_posts: See `detect_spikes_streaming`.
+        topic_column, weight_column: See `topic_shares`.
+
+    Returns:
+        pd.DataFrame: The z-scores of the flagged spikes, as `detect_spikes_streaming`.
+    """
+    state = read_spike_state(state_path, topics)
+    detector, history, resume_from = state if state is not None else (None, None, None)
+    if resume_from is not None:
+        df = df[df['created_datetime'] >= resume_from]
+    shares, posts = topic_shares(df, freq, topic_column, weight_column)
+    z_scores, detector = score_buckets(shares, posts, detector, min_posts)
+    log.info(f"Scored {len(z_scores):,} new {freq} buckets for spikes ({0 if history is None else len(history):,} from the saved state)")
+
+    # Save the buckets folded into the baselines; the open bucket is scored again next time
+    folded = z_scores[[label <= (detector.last_bucket or '') for label in z_scores.index]]
+    history = folded if history is None else pd.concat([history, folded])
+    labels = [str(bucket) for bucket in shares.index]
+    if detector.last_bucket in labels:
+        resume_from = shares.index[labels.index(detector.last_bucket)].end_time + pd.Timedelta(1, 'ns')
+    if resume_from is not None:
+        write_spike_state(state_path, topics, detector, history, resume_from)
+
+    z_scores = pd.concat([history, z_scores.drop(folded.index)])
+    z_scores.columns.name = shares.columns.name
+    return flag_spikes(z_scores, sensitivity)
+
+
+def strongest_spikes(spikes, n=30):
+    """Keeps the `n` periods with the highest z-score, in chronological order, so fine buckets stay plottable."""
+    if len(spikes) <= n:
+        return spikes
+    return spikes.loc[spikes.max(axis=1).nlargest(n).index].sort_index()
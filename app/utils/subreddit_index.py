@@ -0,0 +1,68 @@
+from array import array
+
+# Substrings up to this length are indexed directly
+GRAM_SIZE = 3
+
+
+def build_subreddit_index(names, counts):
+    """
+    Builds a substring index over subreddit names for autocomplete.
+
+    Names are ranked by count once, and every 1- to GRAM_SIZE-character substring maps to
+    the ranks of the names containing it. Posting lists are therefore already sorted by count.
+
+    Args:
+        names (Iterable[str]): Subreddit names.
+        counts (Iterable[int]): Popularity of each subreddit, e.g. the number of posts.
+
+    Returns:
+        dict: The index, to be passed to `suggest_subreddits`.
+    """
+    ranked = sorted(zip(names, counts), key=lambda item: item[1], reverse=True)
+    names = [name for name, _ in ranked]
+    lowered = [name.lower() for name in names]
+
+    grams = {}
+    for rank, name in enumerate(lowered):
+        seen = set()
+        for size in range(1, GRAM_SIZE + 1):
+            for start in range(len(name) - size + 1):
+                seen.add(name[start:start + size])
+        for gram in seen:
+            grams.setdefault(gram, array('I')).append(rank)
+
+    return {'names': names, 'lowered': lowered, 'grams': grams}
+
+
+def suggest_subreddits(index, query, k=5):
+    """
+    Returns the `k` most popular subreddits whose name contains `query` (case-insensitive).
+
+    Args:
+        index (dict): Index built by `build_subreddit_index`.
+        query (str): Text typed by the user.
+        k (int): Number of suggestions.
+
+    Returns:
+        List[str]: Matching subreddit names, most popular first.
+    """
+    query = query.strip().lower()
+    if not query:
+        return []
+
+    grams = index['grams']
+    if len(query) <= GRAM_SIZE:
+        return [index['names'][rank] for rank in grams.get(query, [])[:k]]
+
+    # Scan the rarest gram of the query in rank order and stop after k verified matches
+    candidates = min(
+        (grams.get(query[start:start + GRAM_SIZE], ()) for start in range(len(query) - GRAM_SIZE + 1)),
+        key=len,
+    )
+    suggestions = []
+    for rank in candidates:
+        if query in index['lowered'][rank]:
+            suggestions.append(index['names'][rank])
+            if len(suggestions) == k:
+                break
+    return suggestions
@@ -1,13 +1,25 @@
-from transformers import pipeline
-import nltk
+from functools import lru_cache
 import matplotlib.pyplot as plt
 
+from utils.clean_data import ensure_nltk_resource
+from utils.analyze_sentiment import get_transformer_pipeline
+
+# Summarization model, also fetched by the offline bootstrap
+SUMMARY_MODEL = "t5-large"
+
+@lru_cache(maxsize=None)
+def get_summarizer():
+    """Loads the summarization pipeline once per process, on first use."""
+    # transformers (and torch) take many seconds to import
+    from transformers import pipeline
+    return pipeline("summarization", model=SUMMARY_MODEL, tokenizer=SUMMARY_MODEL)
+
 def summarize_first_row(df):
     """
     Summarizes the most controversial (highest score) post from the DataFrame.
     """
     # Initialize the summarizer
-    summarizer = pipeline("summarization", model="t5-large", tokenizer="t5-large")
+    summarizer = get_summarizer()
 
     # Filter and sort DataFrame by score
     filtered_df = df[df['Text'].str.len() > 1000]
@@ -38,11 +50,12 @@ def sentiment_analysis_by_paragraph(df):
     text = sorted_df.iloc[0]['Text']
 
     # Initialize emotion classification pipeline
-    emotion_model = pipeline("text-classification", model="j-hartmann/emotion-english-distilroberta-base")
+    emotion_model = get_transformer_pipeline()
 
     # Chunk text into paragraphs
-    nltk.download('punkt')
-    paragraphs = nltk.sent_tokenize(text)
+    ensure_nltk_resource('tokenizers/punkt_tab', 'punkt_tab')
+    from nltk import sent_tokenize
+    paragraphs = sent_tokenize(text)
 
     # Perform emotion detection
     emotion_counts = {}
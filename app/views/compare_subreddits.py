@@ -0,0 +1,89 @@
+import streamlit as st
+import os
+
+from utils.dataset import DATASET_DIR, MANIFEST_FILE, list_subreddits, query_posts
+from utils.keywords import expand_keywords
+from utils.plots import render_png, plot_posts_per_year_by_subreddit, plot_sentiment_by_subreddit
+from utils.analyze_sentiment import analyze_sentiment
+
+# Posts scored per subreddit for the sentiment comparison
+SENTIMENT_SAMPLE_SIZE = 2000
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def compare_subreddits(subreddits: tuple, start_year: int, end_year: int, min_chars: int, keywords: tuple, manifest_mtime: float):
+    """
+    Counts the posts per year of all selected subreddits from their IDs alone, then reads the
+    text of a sample of each subreddit for its sentiment. `manifest_mtime` invalidates the
+    cache after an ingest.
+    """
+    df = query_posts(
+        list(subreddits), start_year, end_year, min_chars, list(keywords) or None,
+        columns=["subreddit", "year", "id"],
+    )
+    posts_per_year = df.groupby(['year', 'subreddit'], observed=True).size().unstack(fill_value=0)
+
+    # Score a uniform sample of each subreddit, enough for percentages within a few points;
+    # only the sampled posts' texts are read
+    sample_ids = df.groupby('subreddit', observed=True, group_keys=False)['id'].apply(
+        lambda ids: ids.sample(min(len(ids), SENTIMENT_SAMPLE_SIZE), random_state=0)
+    )
+    sample = query_posts(
+        list(subreddits), start_year, end_year, min_chars,
+        columns=["subreddit", "selftext"], ids=sample_ids.tolist(),
+    )
+    sample['sentiment'] = sample['selftext'].astype(str).apply(analyze_sentiment)
+    sentiment_shares = (
+        sample.groupby('subreddit', observed=True)['sentiment'].value_counts(normalize=True).unstack(fill_value=0) * 100
+    )
+    return posts_per_year, sentiment_shares, df['subreddit'].value_counts()
+
+# Initialize session state for role selection
+if "role" not in st.session_state:
+    st.session_state["role"] = "user"  # Default role is 'user'
+
+st.title("Compare Subreddits")
+st.subheader("How is Northwestern discussed across subreddits?")
+
+subreddits = list_subreddits()
+if not subreddits:
+    st.info("The multi-subreddit dataset is empty. Run `make dataset` to ingest the dumps in downloads/reddit-downloads.")
+    st.stop()
+
+selected_subreddits = st.multiselect(
+    "Subreddits to compare:",
+    options=subreddits,
+    default=subreddits[:3],
+    help="Posts of subreddits other than r/Northwestern are limited to those mentioning Northwestern.",
+)
+
+keyword = st.text_input(
+    "Enter a keyword to compare:",
+    placeholder="Enter a keyword (e.g., 'admission')",
+    help="Separate several keywords or phrases with commas (e.g., 'admission, financial aid').",
+)
+
+start_year, end_year = st.slider(
+    "Select the year range for analysis",
+    min_value=2000,
+    max_value=2024,
+    value=(2000, 2024),
+    step=1,
+)
+
+min_chars = st.slider("Minimum post length (characters)", min_value=0, max_value=1000, value=100, step=50)
+
+if st.button("Compare") and selected_subreddits:
+    keywords = tuple(expand_keywords(keyword)) if keyword else ()
+    with st.spinner("Querying the dataset..."):
+        posts_per_year, sentiment_shares, posts = compare_subreddits(
+            tuple(sorted(selected_subreddits)), start_year, end_year, min_chars, keywords,
+            os.path.getmtime(os.path.join(DATASET_DIR, MANIFEST_FILE)),
+        )
+
+    if posts.sum() == 0:
+        st.warning("No posts match these filters.")
+    else:
+        st.caption(" · ".join(f"r/{subreddit}: {count:,} posts" for subreddit, count in posts.items()))
+        st.image(render_png(plot_posts_per_year_by_subreddit, posts_per_year))
+        st.image(render_png(plot_sentiment_by_subreddit, sentiment_shares))
+        st.caption(f"Sentiment (TextBlob) of up to {SENTIMENT_SAMPLE_SIZE:,} randomly sampled posts per subreddit.")
@@ -1,18 +1,40 @@
 import streamlit as st
 import os
+import uuid
+import pandas as pd
 
-from utils.pipeline import prepare_data_pipeline, sentiment_analysis_pipeline, topic_modeling_pipeline, trending_topic_pipeline
-from utils.clean_data import generate_similar_words
+from utils.query import make_query
+from utils.jobs import JobManager
+from utils.keywords import expand_keywords
+from utils.batch import load_artifacts
+from utils.read_data import comments_path_for
+from utils.similar import load_index, touch_index, similar_posts, posts_like_topic
 
 # Function to list subreddit files
 def list_subreddit_files(folder: str) -> list:
     """Lists subreddit files in the specified folder."""
-    return [file for file in os.listdir(folder) if file.endswith('.zst')]
+    return [file for file in os.listdir(folder) if file.endswith('_submissions.zst')]
+
+@st.cache_resource(max_entries=8)
+def open_similarity_index(index_dir: str) -> dict:
+    """Opens a similar-posts index once per server; its vectors stay memory-mapped."""
+    return load_index(index_dir)
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """Starts the worker pool once and shares it across sessions."""
+    return JobManager(max_workers=2, max_jobs_per_session=1)
 
 # Initialize session state for role selection
 if "role" not in st.session_state:
     st.session_state["role"] = "user"  # Default role is 'user'
 
+# Identify this session towards the shared worker pool
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
+session_id = st.session_state["session_id"]
+job_manager = get_job_manager()
+
 # Sidebar for role selection
 st.sidebar.title("Role Selection")
 previous_role = st.session_state["role"]  # Store the previous role
@@ -24,6 +46,9 @@ selected_role = st.sidebar.selectbox(
 
 st.sidebar.image("assets/images/nu.jpeg", caption=None, width=None, use_column_width=None, clamp=False, channels="RGB", output_format="auto", use_container_width=False)
 
+# Optional breakdown of where the last analysis spent its time
+show_performance = st.sidebar.toggle("Show performance panel", value=False)
+
 # Update the role and trigger rerun if it changes
 if selected_role != previous_role:
     st.session_state["role"] = selected_role
@@ -51,7 +76,8 @@ selected_subreddit = st.selectbox(
 # Text input for keyword
 keyword = st.text_input(
     "Enter a keyword to analyze:",
-    placeholder="Enter a keyword (e.g., 'admission')"
+    placeholder="Enter a keyword (e.g., 'admission')",
+    help="Separate several keywords or phrases with commas (e.g., 'admission, financial aid')."
 )
 
 # Add a slider for selecting the start and end year between 2000 and 2024
@@ -63,6 +89,46 @@ start_year, end_year = st.slider(
     step=1,
 )
 
+# Select the sentiment engine
+sentiment_engine = st.radio(
+    "Sentiment model:",
+    options=["textblob", "transformer"],
+    format_func=lambda engine: {"textblob": "TextBlob polarity (fast)", "transformer": "Transformer emotions (slower)"}[engine],
+    horizontal=True,
+)
+
+# Number of topics for the topic model
+n_topics = st.slider("Number of topics", min_value=2, max_value=10, value=5, step=1)
+
+# Spike detection: bucket size and the z-score a topic's share must reach
+spike_freq = st.select_slider("Spike detection per", options=["day", "week", "month", "year"], value="month")
+spike_sensitivity = st.slider(
+    "Spike threshold (z-score)",
+    min_value=1.0, max_value=5.0, value=3.0, step=0.5,
+    help="How far a topic's share of the posts must rise above its recent average to count as a spike. Lower values flag more spikes.",
+)
+
+# Comment dumps are optional; if one exists the comment threads can be analyzed instead of the posts
+source = "submissions"
+if selected_subreddit and os.path.exists(comments_path_for(os.path.join(folder_path, f"{selected_subreddit}_submissions.zst"))):
+    source = st.radio(
+        "Analyze",
+        options=["submissions", "comments"],
+        format_func=lambda option: {"submissions": "Post texts", "comments": "Comment threads"}[option],
+        horizontal=True,
+        help="Comment threads are joined to the matching posts from the comment dump; the first run partitions the dump on disk.",
+    )
+
+# Show charts while the analysis is still running
+progressive = st.toggle("Show results progressively", value=True)
+
+# Estimate the first charts from a sample while the exact analysis runs
+preview = st.toggle(
+    "Quick preview from a sample",
+    value=True,
+    help="Shows estimated charts with 95% confidence intervals within seconds, refined until the exact results are ready.",
+)
+
 # Analyze button
 if st.button("Analyze"):
     if selected_subreddit:
@@ -72,27 +138,162 @@ if st.button("Analyze"):
         subreddit_path = os.path.join(folder_path, f"{selected_subreddit}_submissions.zst")
 
         try:
-            # Assuming pipeline returns a list of plots
-            file_path = 'downloads/reddit-downloads/Northwestern_submissions.zst'
             min_chars = 100
             
             # Linda
             # keywords = ["northwestern", "NU"]
-            keywords = generate_similar_words(keyword)
-            
-            result_df, plot_fig = prepare_data_pipeline(subreddit_path, min_chars, keywords, start_year, end_year)
-            st.pyplot(plot_fig)
-
-            sentiment_results, sentiment_distribution, plot_fig2 = sentiment_analysis_pipeline(result_df)
-            st.pyplot(plot_fig2)
+            keywords = expand_keywords(keyword) if keyword else None
 
-            plot_fig3, plot_fig4 = topic_modeling_pipeline(result_df, n_topics=5, max_features=5000, n_top_words=10)
-            st.pyplot(plot_fig3)
-            st.pyplot(plot_fig4)
-
-            st.write("Analysis completed. Try again with a new keyword or subreddit.")
+            # The default view is precomputed by the batch job (utils.batch)
+            view = dict(
+                min_chars=min_chars, start_year=start_year, end_year=end_year, engine=sentiment_engine, n_topics=n_topics,
+                spike_freq=spike_freq, spike_sensitivity=spike_sensitivity,
+            )
+            artifacts = None if keyword or source != "submissions" else load_artifacts(subreddit_path, view)
+            if artifacts is not None:
+                st.session_state["analysis"] = dict(
+                    subreddit=selected_subreddit,
+                    keyword=keyword,
+                    figures=artifacts["figures"],
+                    metrics=artifacts["metrics"],
+                    topics=None,
+                    index_dir=None,
+                    time_to_first_insight=None,
+                    total_time=None,
+                )
+            else:
+                # Analyses run as jobs in worker processes; an identical running analysis is joined
+                query = make_query(subreddit_path, min_chars, keywords, start_year, end_year, source)
+                job = job_manager.submit(
+                    session_id, query, engine=sentiment_engine, n_topics=n_topics,
+                    spike_freq=spike_freq, spike_sensitivity=spike_sensitivity,
+                )
+                st.session_state["job_id"] = job.id
+                st.session_state["job_label"] = {"subreddit": selected_subreddit, "keyword": keyword}
+                if preview and source == "submissions":
+                    preview_job = job_manager.submit(session_id, query, engine=sentiment_engine, preview=True)
+                    st.session_state["preview_job_id"] = preview_job.id
 
         except Exception as e:
             st.error(f"An error occurred during analysis: {e}")
     else:
-        st.warning("Please select a subreddit to proceed.")
\ No newline at end of file
+        st.warning("Please select a subreddit to proceed.")
+
+def show_partial_results(job):
+    """Shows the figures of finished stages and a live chart for the running stage."""
+    for fig in job.figures:
+        st.image(fig)
+
+    partial = job.partial
+    if not job.figures and partial.get("posts_per_year"):
+        st.caption(f"Matching posts per year so far ({partial['load_fraction']:.0%} of the dump read)")
+        st.bar_chart(pd.Series(partial["posts_per_year"], name="posts"))
+    elif len(job.figures) == 1 and "sentiment_distribution" in partial:
+        st.caption(f"Sentiment so far ({partial['scored_fraction']:.0%} of the posts scored)")
+        st.line_chart(partial["sentiment_distribution"], x="year", y="percentage", color="sentiment")
+
+    if job.time_to_first_insight is not None:
+        st.caption(f"First results after {job.time_to_first_insight:.1f}s")
+
+def show_preview(estimate):
+    """Shows the sampled estimates of a preview job with their error."""
+    if not estimate["complete"]:
+        state = f"about {estimate['load_fraction']:.0%} of the dump read"
+    else:
+        state = "converged" if estimate["converged"] else "refining"
+    st.caption(
+        f"Preview estimated from {estimate['sampled']:,} of {estimate['population']:,} posts ({state}): "
+        f"sentiment percentages within ±{estimate['max_error']:.1f} points, bars and bands show 95% confidence intervals"
+    )
+    for fig in estimate["figures"]:
+        st.image(fig)
+
+def release_preview():
+    """Stops the preview job of this session, if any; the exact results replace it."""
+    preview_job_id = st.session_state.pop("preview_job_id", None)
+    if preview_job_id is not None:
+        job_manager.release(preview_job_id, session_id)
+
+@st.fragment(run_every=1.0)
+def show_job_progress(job_id: str):
+    """Polls the job and triggers a full rerun once it has finished."""
+    job = job_manager.get(job_id)
+    if job is None or job.state not in ("queued", "running"):
+        st.rerun()
+    st.progress(job.progress, text=f"{job.stage.capitalize()}... ({job.state})")
+    if st.button("Cancel analysis"):
+        job_manager.release(job_id, session_id)
+        release_preview()
+        st.rerun()
+    preview_job = job_manager.get(st.session_state.get("preview_job_id"))
+    if preview_job is not None and preview_job.preview is not None and len(job.figures) < 2:
+        # The estimates stand in until the exact posts and sentiment charts exist
+        show_preview(preview_job.preview)
+    elif progressive:
+        show_partial_results(job)
+
+job = job_manager.get(st.session_state.get("job_id"))
+if job is not None and job.state in ("queued", "running"):
+    show_job_progress(job.id)
+else:
+    if job is not None:
+        if job.state == "done":
+            # Keep the results so they survive reruns triggered by other widgets
+            st.session_state["analysis"] = dict(
+                st.session_state["job_label"],
+                figures=job.result()["figures"],
+                metrics=job.result()["metrics"],
+                topics=job.result()["topics"],
+                index_dir=job.result()["index_dir"],
+                time_to_first_insight=job.time_to_first_insight,
+                total_time=job.status.get("finished_at", job.submitted) - job.submitted,
+            )
+            st.write("Analysis completed. Try again with a new keyword or subreddit.")
+        elif job.state == "failed":
+            st.error(f"An error occurred during analysis: {job.error()}")
+        else:
+            st.info("Analysis cancelled.")
+        job_manager.release(job.id, session_id)
+        release_preview()
+        del st.session_state["job_id"]
+
+    if "analysis" in st.session_state:
+        # Show the last analysis of this session until a new one is started
+        analysis = st.session_state["analysis"]
+        st.caption(f"Analysis of {analysis['subreddit']} for keyword '{analysis['keyword'] or 'all keywords'}'")
+        if analysis["total_time"] is None:
+            st.caption("Served from the precomputed batch results.")
+        elif analysis["time_to_first_insight"] is not None:
+            st.caption(f"First results after {analysis['time_to_first_insight']:.1f}s, complete after {analysis['total_time']:.1f}s")
+        for fig in analysis["figures"]:
+            st.image(fig)
+
+        if analysis["index_dir"] is not None and os.path.exists(analysis["index_dir"]):
+            touch_index(analysis["index_dir"])
+            with st.expander("Explore similar posts"):
+                index = open_similarity_index(analysis["index_dir"])
+                topics = analysis["topics"].astype({"id": str}).merge(index["posts"], on="id")
+                topic = st.selectbox("Topic", options=sorted(topics["topic"].dropna().unique()))
+                st.caption("Posts closest to the topic as a whole")
+                st.dataframe(posts_like_topic(index, topics.loc[topics["topic"] == topic, "id"]), hide_index=True)
+
+                topic_posts = topics[topics["topic"] == topic]
+                post_id = st.selectbox(
+                    "Post",
+                    options=topic_posts["id"].head(200),
+                    format_func=dict(zip(topic_posts["id"], topic_posts["title"])).get,
+                )
+                if post_id is not None:
+                    st.caption("Posts like the selected one")
+                    st.dataframe(similar_posts(index, post_id), hide_index=True)
+
+        if show_performance:
+            with st.expander("Performance of the last run", expanded=True):
+                spans = pd.DataFrame(analysis["metrics"]["spans"])
+                if spans.empty:
+                    st.write("All stages were served from the cache.")
+                else:
+                    st.dataframe(spans[["stage", "wall_s", "cpu_s", "peak_rss_growth_mb", "rows_in", "rows_out"]], hide_index=True)
+                    if "duplicate_rate" in spans:
+                        st.caption(f"Near-duplicates scored once and counted with their copies: {spans['duplicate_rate'].max():.1%} of the posts")
+                st.caption(f"Worker time {analysis['metrics']['wall_s']:.2f}s; stages served from the cache are not listed.")
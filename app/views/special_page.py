@@ -1,11 +1,13 @@
 import streamlit as st
 import os
 import pandas as pd
-from transformers import pipeline
-import nltk
 
+from utils.analyze_sentiment import get_transformer_pipeline
 from utils.summarize import summarize_first_row
 from utils.read_data import get_api_data
+from utils.fetch import fetch_api_data_concurrently, make_fetch_pairs
+from utils.keywords import split_keywords
+from utils.subreddit_index import build_subreddit_index, suggest_subreddits
 
 # Initialize session state for role selection
 if "role" not in st.session_state:
@@ -45,8 +47,8 @@ def sentiment_analysis_by_paragraph_streamlit(df):
     # Get the Text from the highest-scored post
     text = sorted_df.iloc[0]['Text']
     
-    # Load the pre-trained emotion classification model
-    emotion_model = pipeline("text-classification", model="j-hartmann/emotion-english-distilroberta-base")
+    # Load the pre-trained emotion classification model (once per process, on first use)
+    emotion_model = get_transformer_pipeline()
 
     # Define color mapping for emotions
     emotion_colors = {
@@ -61,7 +63,6 @@ def sentiment_analysis_by_paragraph_streamlit(df):
     }
 
     # Chunk the text into paragraphs
-    nltk.download('punkt')
     paragraphs = text.split('\n')
 
     # Remove empty paragraphs (if any)
@@ -86,14 +87,20 @@ def sentiment_analysis_by_paragraph_streamlit(df):
 # Function to list subreddit files
 def list_subreddit_files(folder: str) -> list:
     """Lists subreddit files in the specified folder."""
-    return [file for file in os.listdir(folder) if file.endswith('.zst')]
+    return [file for file in os.listdir(folder) if file.endswith('_submissions.zst')]
+
+@st.cache_resource
+def load_subreddit_index(file_path: str) -> dict:
+    """Builds the subreddit autocomplete index once and shares it across sessions."""
+    subreddit_data = pd.read_csv(file_path)
+    # Remove rows where 'subreddit' is NaN
+    subreddit_data = subreddit_data.dropna(subset=['subreddit'])
+    return build_subreddit_index(subreddit_data['subreddit'].astype(str), subreddit_data['COUNT'])
 
 # Define the Streamlit app
-# Load the CSV data
+# Load the subreddit index
 file_path = "downloads/subreddit-list/top_text_subreddits.csv"
-subreddit_data = pd.read_csv(file_path)
-# Remove rows where 'subreddit' is NaN
-subreddit_data = subreddit_data.dropna(subset=['subreddit'])
+subreddit_index = load_subreddit_index(file_path)
 
 # Title and subtitle
 st.title("Controversial Posts Analysis")
@@ -102,14 +109,13 @@ st.subheader("Select a Subreddit & Keyword!")
 # Input field for user query
 user_input = st.text_input("Search for a subreddit:", "")
 
+selected_subreddit = None
+
 # Display suggestions if user input is provided
 if user_input:
-    # Filter subreddits that contain the user input (case-insensitive)
-    filtered_subreddits = subreddit_data[subreddit_data['subreddit'].str.contains(user_input, case=False, na='')]
+    # Top 5 subreddits by COUNT that contain the user input (case-insensitive)
+    top_suggestions = suggest_subreddits(subreddit_index, user_input, k=5)
 
-    # Sort by COUNT and take the top 5
-    top_suggestions = filtered_subreddits.nlargest(5, 'COUNT')['subreddit'].tolist()
-    
     if top_suggestions:
         selected_subreddit = st.radio("", top_suggestions)
         if selected_subreddit:
@@ -122,7 +128,8 @@ else:
 # Text input for keyword
 keyword = st.text_input(
     "Enter a keyword to analyze:",
-    placeholder="Enter a keyword (e.g., 'admission')"
+    placeholder="Enter a keyword (e.g., 'admission')",
+    help="Separate several keywords with commas to search for all of them at once.",
 )
 
 if st.button("Find and Summarize"):
@@ -130,8 +137,22 @@ if st.button("Find and Summarize"):
         st.write(f"Analyzing subreddit '{selected_subreddit}' for keyword '{keyword}'...")
 
         try:
-            # Call the pipeline function
-            df = get_api_data(selected_subreddit, keyword, limit=1000)
+            keywords = split_keywords(keyword)
+            if len(keywords) > 1:
+                # Search all keywords concurrently and report the posts found so far
+                progress = st.progress(0.0)
+                found = [0]
+
+                def show_partial(new_posts, done, total):
+                    found[0] += len(new_posts)
+                    progress.progress(done / total, text=f"Searched {done} of {total} keywords, {found[0]:,} posts found")
+
+                df = fetch_api_data_concurrently(
+                    make_fetch_pairs([selected_subreddit], keywords), limit=1000, on_partial=show_partial
+                )
+            else:
+                # Call the pipeline function
+                df = get_api_data(selected_subreddit, keyword, limit=1000)
 
             # Summarize and analyze
             summary = summarize_first_row(df)
@@ -0,0 +1,31 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def git_commit():
+    """Short hash of the checked-out commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def write_results(benchmark, results, output_dir=RESULTS_DIR):
+    """Writes benchmark results to `<output_dir>/<benchmark>-<commit>-<timestamp>.json`."""
+    commit = git_commit()
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"{benchmark}-{commit or 'unknown'}-{int(time.time())}.json")
+    with open(output_path, "w") as f:
+        json.dump({"benchmark": benchmark, "commit": commit, "python": sys.version, "results": results}, f, indent=2)
+    print(f"Results written to {output_path}")
+    return output_path
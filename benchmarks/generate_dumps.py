@@ -0,0 +1,111 @@
+"""
+Writes synthetic redarcs-style `<subreddit>_submissions.zst` dumps for benchmarking.
+
+Posts get realistic shapes: a growing number of posts per year, log-normal text lengths
+with removed/empty posts, Zipf-distributed authors and scores, topic words (including
+Northwestern keywords) mixed into a common vocabulary, and reposts of earlier texts with
+small edits.
+
+    python benchmarks/generate_dumps.py --posts 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import random
+from collections import deque
+from datetime import datetime, timezone
+
+import zstandard
+
+from common import ROOT
+
+DATA_DIR = os.path.join(ROOT, "benchmarks", "data")
+
+COMMON_WORDS = (
+    "the a to and of i in is it for that you this my on with be have are was but not so just "
+    "like what if do at can get any know about or would think really people time one all out"
+).split()
+TOPICS = {
+    "admissions": "admission admitted application essay early decision rejected waitlist accepted deferred".split(),
+    "campus": "campus dorm housing evanston lakefill library norris dining roommate quarter".split(),
+    "academics": "class professor exam midterm major course grade weinberg mccormick medill".split(),
+    "sports": "football wildcats basketball game stadium ryan field coach season win".split(),
+    "money": "tuition financial aid scholarship cost loan job internship salary rent".split(),
+}
+NU_WORDS = ["Northwestern", "NU", "wildcat", "wildcats"]
+SENTIMENT_WORDS = "great love happy amazing best bad terrible hate awful stressed worst good".split()
+
+
+REPOST_EDITS = ["", " edit: thanks everyone", " (reposting, no answers yet)", " x-post"]
+
+
+def make_post(rng, index, subreddit, start_year, end_year, previous=None, repost_rate=0.0):
+    # Later years have more posts: sample the year with linearly growing weight
+    years = list(range(start_year, end_year + 1))
+    year = rng.choices(years, weights=range(1, len(years) + 1))[0]
+    created = datetime(year, 1, 1, tzinfo=timezone.utc).timestamp() + rng.random() * 365 * 24 * 3600
+
+    removed = rng.random() < 0.1
+    if removed:
+        selftext = rng.choice(["[removed]", "[deleted]", ""])
+    elif previous and rng.random() < repost_rate:
+        selftext = rng.choice(previous) + rng.choice(REPOST_EDITS)
+    else:
+        topic = TOPICS[rng.choice(list(TOPICS))]
+        n_words = max(3, int(rng.lognormvariate(4.0, 1.0)))
+        words = rng.choices(COMMON_WORDS, k=n_words)
+        for _ in range(max(1, n_words // 8)):
+            words[rng.randrange(n_words)] = rng.choice(topic)
+        for _ in range(max(1, n_words // 30)):
+            words[rng.randrange(n_words)] = rng.choice(SENTIMENT_WORDS)
+        if rng.random() < 0.6:
+            words[rng.randrange(n_words)] = rng.choice(NU_WORDS)
+        selftext = " ".join(words)
+        if previous is not None:
+            previous.append(selftext)
+
+    return {
+        "id": f"{index:x}",
+        "title": " ".join(rng.choices(COMMON_WORDS + NU_WORDS, k=rng.randint(3, 12))),
+        "selftext": selftext,
+        "score": int(rng.paretovariate(1.5)) - 1,
+        "archived": year < end_year - 1,
+        "author": "[deleted]" if removed and rng.random() < 0.5 else f"user_{int(rng.paretovariate(1.1)) % 50000}",
+        "created_utc": int(created),
+        "media": None,
+        "num_comments": int(rng.paretovariate(1.3)) - 1,
+        "subreddit": subreddit,
+    }
+
+
+def generate_dump(n_posts, subreddit="Northwestern", output_dir=DATA_DIR, start_year=2008, end_year=2024, seed=42, repost_rate=0.15):
+    """
+    Writes `n_posts` synthetic posts to `<output_dir>/<n_posts>/<subreddit>_submissions.zst`.
+    A fraction `repost_rate` of the posts repeats an earlier text.
+
+    Returns:
+        str: Path of the dump.
+    """
+    path = os.path.join(output_dir, str(n_posts), f"{subreddit}_submissions.zst")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rng = random.Random(seed)
+    # Reposts pick from the most recent texts
+    previous = deque(maxlen=1000)
+    with open(path, "wb") as f, zstandard.ZstdCompressor(level=3).stream_writer(f) as writer:
+        for index in range(n_posts):
+            writer.write((json.dumps(make_post(rng, index, subreddit, start_year, end_year, previous, repost_rate)) + "\n").encode())
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Dump sizes.")
+    parser.add_argument("--subreddit", default="Northwestern")
+    parser.add_argument("--output", default=DATA_DIR)
+    args = parser.parse_args(argv)
+    for n_posts in args.posts:
+        print(f"Wrote {generate_dump(n_posts, args.subreddit, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
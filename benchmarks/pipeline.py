@@ -0,0 +1,167 @@
+"""
+Times the analysis pipeline on synthetic dumps and records the peak memory of each stage.
+
+Dumps are generated on first use (see generate_dumps.py). Results are written to
+benchmarks/results as JSON; pass two result files to --compare to see the change
+between two commits:
+
+    python benchmarks/pipeline.py --posts 10000 100000
+    python benchmarks/pipeline.py --compare results/pipeline-abc.json results/pipeline-def.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from common import APP_DIR, RESULTS_DIR, ROOT, write_results
+from generate_dumps import DATA_DIR, generate_dump
+
+sys.path.insert(0, APP_DIR)
+
+from utils import pipeline  # noqa: E402
+from utils.read_data import load_reddit_data, read_lines_zst, compact_dataframe, memory_per_million  # noqa: E402
+from utils.clean_data import filter_data, preprocess_text  # noqa: E402
+from utils.analyze_sentiment import assign_sentiments  # noqa: E402
+from utils.analyze_clusters import perform_lda  # noqa: E402
+from utils.dedup import deduplicate  # noqa: E402
+
+MIN_CHARS = 100
+KEYWORDS = ["admission", "admissions", "campus", "tuition"]
+
+
+def measure(func, memory=True):
+    """
+    Runs `func` once for the wall time and, if `memory`, once more under tracemalloc.
+
+    Returns:
+        Tuple[Any, dict]: The result of the first run and its metrics.
+    """
+    start = time.perf_counter()
+    result = func()
+    metrics = {"seconds": time.perf_counter() - start}
+    if memory:
+        tracemalloc.start()
+        func()
+        metrics["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, metrics
+
+
+def frame_memory(path):
+    """Memory per million posts of the frame of a dump before and after `compact_dataframe`."""
+    raw = [json.loads(line) for line, _ in read_lines_zst(path)]
+    df = pd.DataFrame(raw)
+    del raw
+    before = memory_per_million(df)
+    return before, memory_per_million(compact_dataframe(df))
+
+
+def run_stages(path, memory=True):
+    """Benchmarks each stage on one dump, feeding every stage the output of the previous one."""
+    results = {}
+
+    def record(name, func, rows_in=None):
+        try:
+            result, metrics = measure(func, memory)
+        except Exception as e:  # keep benchmarking the other stages
+            results[name] = {"error": repr(e)}
+            print(f"  {name:24s} failed: {next((line.strip() for line in str(e).splitlines() if line.strip(' *')), repr(e))}")
+            return None
+        if rows_in is not None:
+            metrics["rows_in"] = rows_in
+        if hasattr(result, "__len__") and not isinstance(result, tuple):
+            metrics["rows_out"] = len(result)
+        results[name] = metrics
+        print(f"  {name:24s} {metrics['seconds']:8.2f}s" + (f" {metrics['peak_mb']:9.1f} MB" if memory else ""))
+        return result
+
+    df = record("load_reddit_data", lambda: load_reddit_data(path))
+    if df is None:
+        return results
+    before, after = frame_memory(path)
+    results["load_reddit_data"]["raw_frame_mb_per_million"] = before
+    results["load_reddit_data"]["frame_mb_per_million"] = after
+    print(f"  {'frame memory':24s} {before:8.0f} MB -> {after:.0f} MB per million posts")
+    filtered = record("filter_data", lambda: filter_data(df, MIN_CHARS, KEYWORDS), len(df))
+    if filtered is None:
+        return results
+    cleaned = record("preprocess_text", lambda: filtered["selftext"].apply(preprocess_text), len(filtered))
+    record("assign_sentiments", lambda: assign_sentiments(filtered.copy()), len(filtered))
+    if cleaned is not None:
+        record("perform_lda", lambda: perform_lda(cleaned, n_topics=5, max_features=5000), len(cleaned))
+
+    # The same downstream stages on the deduplicated posts, for the speedup of the dedup stage
+    deduplicated = record("deduplicate", lambda: deduplicate(filtered)[0], len(filtered))
+    if deduplicated is not None and cleaned is not None:
+        results["deduplicate"]["duplicate_rate"] = 1 - len(deduplicated) / max(len(filtered), 1)
+        downstream = ["preprocess_text", "assign_sentiments", "perform_lda"]
+
+        def downstream_stages():
+            perform_lda(deduplicated["selftext"].apply(preprocess_text), n_topics=5, max_features=5000)
+            assign_sentiments(deduplicated.copy())
+
+        _, dedup_metrics = measure(downstream_stages, memory=False)
+        before = sum(results[name]["seconds"] for name in downstream if "seconds" in results[name])
+        after = dedup_metrics["seconds"] + results["deduplicate"]["seconds"]
+        results["deduplicate"]["downstream_speedup"] = before / after
+        print(f"  {'duplicate rate':24s} {results['deduplicate']['duplicate_rate']:8.1%}   speedup x{before / after:.2f}")
+
+    record("prepare_data_pipeline", lambda: pipeline.prepare_data_pipeline(path, MIN_CHARS, KEYWORDS, fig="No"))
+    record("topic_modeling_pipeline", lambda: pipeline.topic_modeling_pipeline(filtered.copy()), len(filtered))
+    return results
+
+
+def compare(old_path, new_path):
+    """Prints the time and memory ratio (new / old) of every stage present in both files."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']}")
+    for size, stages in new["results"].items():
+        for stage, metrics in stages.items():
+            before = old["results"].get(size, {}).get(stage, {})
+            if "seconds" not in metrics or "seconds" not in before:
+                continue
+            line = f"{size:>9s} {stage:24s} time x{metrics['seconds'] / before['seconds']:.2f}"
+            if metrics.get("peak_mb") and before.get("peak_mb"):
+                line += f"  memory x{metrics['peak_mb'] / before['peak_mb']:.2f}"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, nargs="+", default=[10_000, 100_000], help="Dump sizes to benchmark.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc runs.")
+    parser.add_argument("--output", default=RESULTS_DIR)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit.")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    # Resolve downloads/... the same way the app does
+    os.chdir(ROOT)
+
+    # Topic labels come from OpenAI; benchmark local compute only
+    pipeline.generate_summary_for_topics = lambda topics: {topic: " ".join(words[:3]) for topic, words in topics.items()}
+
+    results = {}
+    for n_posts in args.posts:
+        path = os.path.join(DATA_DIR, str(n_posts), "Northwestern_submissions.zst")
+        if not os.path.exists(path):
+            print(f"Generating {n_posts:,} posts...")
+            generate_dump(n_posts)
+        print(f"{n_posts:,} posts:")
+        results[str(n_posts)] = run_stages(path, memory=not args.no_memory)
+
+    write_results("pipeline", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
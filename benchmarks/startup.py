@@ -0,0 +1,59 @@
+"""
+Measures the cold import time of the dashboard and of each view.
+
+Every script's top-level imports are run in a fresh interpreter (the Streamlit calls
+themselves are not executed), several times, and the results are written to JSON so
+they can be compared across commits:
+
+    python benchmarks/startup.py --repeat 5
+"""
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+
+from common import APP_DIR, RESULTS_DIR, ROOT, write_results
+
+SCRIPTS = ["dashboard.py", "views/home.py", "views/dashboard_analysis.py", "views/special_page.py", "views/compare_subreddits.py"]
+
+
+def top_level_imports(script):
+    """Returns the source of the import statements at the top level of a script."""
+    with open(os.path.join(APP_DIR, script)) as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def time_imports(code):
+    """Runs `code` in a fresh interpreter and returns the import time in seconds."""
+    timed = f"import time\n_start = time.perf_counter()\n{code}\nprint(time.perf_counter() - _start)"
+    result = subprocess.run(
+        [sys.executable, "-c", timed],
+        cwd=ROOT,
+        env=dict(os.environ, PYTHONPATH=APP_DIR),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per script.")
+    parser.add_argument("--output", default=RESULTS_DIR, help="Folder for the JSON results.")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for script in SCRIPTS:
+        timings = [time_imports(top_level_imports(script)) for _ in range(args.repeat)]
+        results[script] = {"min_s": min(timings), "median_s": statistics.median(timings), "runs_s": timings}
+        print(f"{script:32s} min {min(timings):6.2f}s  median {statistics.median(timings):6.2f}s")
+
+    write_results("startup", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""
+Makes the app modules importable the same way Streamlit does when running app/dashboard.py.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
@@ -0,0 +1,47 @@
+"""
+Local stand-in for the parts of the Reddit API used by the app.
+"""
+from types import SimpleNamespace
+
+
+class FakeReddit:
+    """Serves search results from an in-memory list of posts and counts the calls."""
+
+    def __init__(self, posts_by_subreddit):
+        self.posts_by_subreddit = posts_by_subreddit
+        self.search_calls = []
+        self.auth = SimpleNamespace(limits={})
+
+    def subreddit(self, name):
+        return FakeSubreddit(self, name)
+
+
+class FakeSubreddit:
+    """Implements `search` over the posts of one subreddit."""
+
+    def __init__(self, reddit, name):
+        self.reddit = reddit
+        self.display_name = name
+
+    def search(self, keyword, sort="relevance", limit=100):
+        self.reddit.search_calls.append((self.display_name, keyword, sort, limit))
+        posts = [
+            post for post in self.reddit.posts_by_subreddit.get(self.display_name, [])
+            if keyword.lower() in (post.title + " " + post.selftext).lower()
+        ]
+        if sort == "new":
+            posts = sorted(posts, key=lambda post: post.created_utc, reverse=True)
+        return iter(posts[:limit])
+
+
+def make_post(post_id, created_utc, title="Northwestern post", selftext="", score=1, subreddit="Northwestern"):
+    """Builds an object with the attributes of a PRAW submission."""
+    return SimpleNamespace(
+        id=post_id,
+        title=title,
+        score=score,
+        url=f"https://reddit.com/{post_id}",
+        created_utc=created_utc,
+        subreddit=SimpleNamespace(display_name=subreddit),
+        selftext=selftext,
+    )
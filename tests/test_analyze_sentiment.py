@@ -0,0 +1,70 @@
+"""
+Tests the transformer sentiment labels in analyze_sentiment.py.
+"""
+import pandas as pd
+import pytest
+
+from utils import analyze_sentiment  # pylint: disable=import-error
+
+MODEL = "stub-model"
+
+
+class StubClassifier:
+    """Labels texts mentioning 'great' as joy and all others as anger, and records the calls."""
+
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts, batch_size=None):
+        self.texts += texts
+        return [{"label": "joy" if "great" in text else "anger"} for text in texts]
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+    """Installs a stub classifier as the loaded model and empties the label cache."""
+    stub = StubClassifier()
+    monkeypatch.setitem(analyze_sentiment._transformer_pipelines, MODEL, stub)
+    monkeypatch.setattr(analyze_sentiment, "_transformer_cache", type(analyze_sentiment._transformer_cache)())
+    return stub
+
+
+def test_comment_threads_are_not_served_submission_labels(classifier):
+    """Tests that comment threads, which keep their submission ids, are scored on their own text."""
+    submissions = pd.DataFrame({"id": ["a", "b"], "selftext": ["a great campus", "a great dorm"]})
+    comments = pd.DataFrame({"id": ["a", "b"], "selftext": ["terrible housing", "a great dorm"]})
+
+    assert analyze_sentiment.assign_transformer_sentiments(submissions, MODEL)["sentiment"].tolist() == ["Joy", "Joy"]
+    assert analyze_sentiment.assign_transformer_sentiments(comments, MODEL)["sentiment"].tolist() == ["Anger", "Joy"]
+    # Only the thread whose text differs from its submission is classified again
+    assert sorted(classifier.texts) == ["a great campus", "a great dorm", "terrible housing"]
+
+
+def test_length_buckets_respect_the_limits():
+    """Tests that batches hold similar lengths and stay within the size and padded-length budgets."""
+    texts = pd.Series(["x" * length for length in [5, 400, 10, 300, 20, 7, 1000, 15]], index=list("abcdefgh"))
+    batches = analyze_sentiment.make_length_buckets(texts, max_batch_size=3, max_batch_chars=1000)
+
+    assert sorted(label for batch in batches for label in batch) == list("abcdefgh")
+    for batch in batches:
+        lengths = texts[batch].str.len()
+        assert len(batch) <= 3
+        assert len(batch) == 1 or len(batch) * lengths.max() <= 1000
+    assert batches[0] == ["a", "f", "c"]
+
+
+def test_label_cache_hits_and_eviction(classifier, monkeypatch):
+    """Tests that cached texts are not classified again and the least recently used are evicted."""
+    monkeypatch.setattr(analyze_sentiment, "TRANSFORMER_CACHE_SIZE", 2)
+    posts = pd.DataFrame({"id": ["a", "b", "c"], "selftext": ["great", "bad", "worse"]})
+
+    analyze_sentiment.assign_transformer_sentiments(posts.iloc[:2].copy(), MODEL)
+    analyze_sentiment.assign_transformer_sentiments(posts.iloc[[0]].copy(), MODEL)
+    assert len(classifier.texts) == 2
+
+    # "great" was used last, so "bad" is evicted to make room for "worse"
+    analyze_sentiment.assign_transformer_sentiments(posts.iloc[[2]].copy(), MODEL)
+    labels = analyze_sentiment.assign_transformer_sentiments(posts.copy(), MODEL)["sentiment"].tolist()
+    assert labels == ["Joy", "Anger", "Anger"]
+    assert classifier.texts[2:] == ["worse", "bad"]
+    assert len(analyze_sentiment._transformer_cache) == 2
@@ -0,0 +1,95 @@
+"""
+Tests the artifacts of the batch mode in batch.py, with the pipeline stages stubbed out.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from utils import batch, metrics, pipeline  # pylint: disable=import-error
+from utils.batch import DEFAULT_VIEW, is_up_to_date, load_artifacts, precompute_dump  # pylint: disable=import-error
+
+
+@pytest.fixture
+def stages(tmp_path, monkeypatch):
+    """Replaces the pipeline stages with stubs returning fixed images, and counts the dumps they analyze."""
+    analyzed = []
+    def filter_stage(query):
+        analyzed.append(os.path.basename(query.file_id[0]))
+        return pd.DataFrame({"year": [2020, 2020, 2021]})
+    monkeypatch.setattr(pipeline, "filter_stage", filter_stage)
+    monkeypatch.setattr(pipeline, "posts_per_year_stage", lambda query: b"posts")
+    monkeypatch.setattr(pipeline, "sentiment_stage", lambda query, engine: (None, pd.DataFrame({"year": [2020], "percentage": [100.0]}), b"sentiment"))
+    monkeypatch.setattr(pipeline, "topic_stage", lambda query, **kwargs: (b"trends", b"spikes", None))
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path / "logs"))
+    # Run the dumps in threads, so they see the stubs
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", lambda max_workers, max_tasks_per_child: ThreadPoolExecutor(max_workers))
+    return analyzed
+
+
+def make_dump(folder, subreddit, content=b"posts"):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{subreddit}_submissions.zst")
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def test_is_up_to_date_follows_the_source_and_version(tmp_path, stages, monkeypatch):
+    """Tests that artifacts are stale once the dump changes or the pipeline version is bumped."""
+    dump, artifacts = make_dump(tmp_path / "dumps", "Northwestern"), str(tmp_path / "artifacts")
+    assert not is_up_to_date(dump, artifacts)
+    precompute_dump(dump, artifacts)
+    assert is_up_to_date(dump, artifacts)
+
+    make_dump(tmp_path / "dumps", "Northwestern", b"more posts")
+    assert not is_up_to_date(dump, artifacts)
+    precompute_dump(dump, artifacts)
+    monkeypatch.setattr(batch, "ARTIFACT_VERSION", batch.ARTIFACT_VERSION + 1)
+    assert not is_up_to_date(dump, artifacts)
+
+
+def test_unchanged_dumps_are_skipped(tmp_path, stages):
+    """Tests that a rerun only precomputes the dumps that changed since the last one."""
+    dumps, artifacts = str(tmp_path / "dumps"), str(tmp_path / "artifacts")
+    make_dump(dumps, "Northwestern")
+    make_dump(dumps, "chicago")
+    args = ["--dumps-dir", dumps, "--artifacts-dir", artifacts]
+    assert batch.main(args) == 0
+    assert sorted(stages) == ["Northwestern_submissions.zst", "chicago_submissions.zst"]
+
+    stages.clear()
+    assert batch.main(args) == 0
+    assert stages == []
+
+    make_dump(dumps, "chicago", b"more posts")
+    assert batch.main(args) == 0
+    assert stages == ["chicago_submissions.zst"]
+    assert batch.main(args + ["--force"]) == 0
+    assert len(stages) == 3
+
+
+def test_load_artifacts(tmp_path, stages):
+    """Tests that the dashboard gets the figures of the default view of an unchanged dump only."""
+    dump, artifacts = make_dump(tmp_path / "dumps", "Northwestern"), str(tmp_path / "artifacts")
+    assert load_artifacts(dump, DEFAULT_VIEW, artifacts) is None
+    precompute_dump(dump, artifacts)
+
+    loaded = load_artifacts(dump, DEFAULT_VIEW, artifacts)
+    assert loaded["figures"] == [b"posts", b"sentiment", b"trends", b"spikes"]
+    assert loaded["metrics"]["name"] == "batch"
+    assert load_artifacts(dump, {**DEFAULT_VIEW, "n_topics": 8}, artifacts) is None
+    make_dump(tmp_path / "dumps", "Northwestern", b"more posts")
+    assert load_artifacts(dump, DEFAULT_VIEW, artifacts) is None
+
+
+def test_older_versions_are_removed_after_publishing(tmp_path, stages):
+    """Tests that publishing removes the artifacts of older versions, but not of newer ones."""
+    dump, artifacts = make_dump(tmp_path / "dumps", "Northwestern"), tmp_path / "artifacts"
+    version = batch.ARTIFACT_VERSION
+    for old in [f"v{version - 1}", f"v{version + 1}", "notes"]:
+        os.makedirs(artifacts / "Northwestern" / old)
+    output_dir = precompute_dump(dump, str(artifacts))
+    assert sorted(os.listdir(artifacts / "Northwestern")) == sorted([f"v{version}", f"v{version + 1}", "notes"])
+    assert os.listdir(output_dir)
@@ -0,0 +1,55 @@
+"""
+Tests the memoization and publishing helpers in cache.py.
+"""
+from utils.cache import memoize, publish_dir  # pylint: disable=import-error
+
+
+def test_memoize_shares_key_across_call_styles():
+    """Tests that positional, keyword and default arguments hit the same entry."""
+    calls = []
+
+    @memoize(maxsize=2, ignore=("callback",))
+    def stage(query, n_topics=5, callback=None):
+        calls.append((query, n_topics))
+        return query * n_topics
+
+    assert stage(2) == 10
+    assert stage(2, n_topics=5, callback=print) == 10
+    assert stage(query=2, n_topics=5) == 10
+    assert calls == [(2, 5)]
+
+
+def test_memoize_evicts_and_expires():
+    """Tests the size limit and the TTL."""
+    calls = []
+
+    @memoize(maxsize=1)
+    def stage(query):
+        calls.append(query)
+        return query
+
+    stage(1)
+    stage(2)
+    stage(1)
+    assert calls == [1, 2, 1]
+
+    @memoize(ttl=0)
+    def expired(query):
+        calls.append(query)
+        return query
+
+    expired(3)
+    expired(3)
+    assert calls[-2:] == [3, 3]
+
+
+def test_publish_dir_replaces_previous_version(tmp_path):
+    """Tests that a new folder replaces an existing one and no old copy is left behind."""
+    output_dir = tmp_path / "artifact"
+    for version in ["1", "2"]:
+        tmp_dir = tmp_path / f"artifact.tmp-{version}"
+        tmp_dir.mkdir()
+        (tmp_dir / "version.txt").write_text(version)
+        publish_dir(str(tmp_dir), str(output_dir))
+    assert (output_dir / "version.txt").read_text() == "2"
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["artifact"]
@@ -0,0 +1,37 @@
+"""
+Tests filter_data in clean_data.py on compacted DataFrames.
+"""
+from datetime import datetime
+
+import pandas as pd
+
+from utils.clean_data import filter_data  # pylint: disable=import-error
+from utils.read_data import compact_dataframe  # pylint: disable=import-error
+
+
+def make_posts():
+    """Returns raw posts as parsed from a dump."""
+    rows = []
+    for i, (text, year) in enumerate([("x" * 150 + " tuition", 2015), ("x" * 150, 2015), ("short tuition", 2015), ("x" * 150 + " tuition", 2022), (None, 2015)]):
+        rows.append({
+            "id": f"p{i}", "title": "t", "selftext": text, "score": i, "archived": False, "author": "a",
+            "created_utc": int(datetime(year, 1, 1).timestamp()), "media": None, "num_comments": 0,
+            "subreddit": "Northwestern", "created_datetime": datetime(year, 1, 1),
+        })
+    return pd.DataFrame(rows)
+
+
+def test_compact_dataframe_dtypes():
+    """Tests the categorical, string and downcast columns."""
+    df = compact_dataframe(make_posts())
+    assert df["subreddit"].dtype == "category"
+    assert isinstance(df["selftext"].dtype, pd.StringDtype)
+    assert df["score"].dtype == "int8"
+    assert df["archived"].dtype == bool
+
+
+def test_filter_data_compacted():
+    """Tests the text length, keyword and year filters, including missing text."""
+    filtered = filter_data(compact_dataframe(make_posts()), 100, ["tuition"], 2010, 2020)
+    assert filtered["id"].tolist() == ["p0"]
+    assert filtered["year"].tolist() == [2015]
@@ -0,0 +1,72 @@
+"""
+Tests the partitioned join of comment dumps in read_data.py.
+"""
+import json
+
+import zstandard
+
+from utils.read_data import load_comment_threads, comment_partition  # pylint: disable=import-error
+from utils.query import make_query  # pylint: disable=import-error
+
+
+def write_comments(path, comments):
+    """Writes comments as a zstandard-compressed dump."""
+    lines = "\n".join(json.dumps(comment) for comment in comments) + "\n"
+    path.write_bytes(zstandard.ZstdCompressor().compress(lines.encode()))
+
+
+def test_load_comment_threads(tmp_path):
+    """Tests that comments are joined to their submission and aggregated per thread."""
+    comments_path = tmp_path / "Northwestern_comments.zst"
+    write_comments(comments_path, [
+        {"link_id": "t3_a", "body": "first", "score": 2},
+        {"link_id": "t3_b", "body": "other", "score": 5},
+        {"link_id": "t3_a", "body": "second", "score": 3},
+        {"link_id": "t3_a", "body": "[deleted]", "score": 1},
+        {"link_id": "t3_z", "body": "unrelated", "score": 1},
+        {"body": "no parent"},
+    ])
+    threads = load_comment_threads(str(comments_path), ["a", "b", "c"], n_partitions=4, partitions_dir=tmp_path / "parts")
+    threads = threads.set_index("id").sort_index()
+    assert threads.index.tolist() == ["a", "b"]
+    assert threads.loc["a", "comment_count"] == 2
+    assert threads.loc["a", "comment_score"] == 5
+    assert threads.loc["a", "comment_text"] == "first\nsecond"
+
+    # The partitions are reused for other submissions of the same dump
+    assert len(list((tmp_path / "parts").iterdir())) == 1
+    assert load_comment_threads(str(comments_path), ["z"], n_partitions=4, partitions_dir=tmp_path / "parts")["id"].tolist() == ["z"]
+
+
+def test_only_needed_partitions_are_read_and_old_versions_removed(tmp_path):
+    """Tests that a join skips the partitions of other threads and a new dump replaces the old partitions."""
+    comments_path = tmp_path / "Northwestern_comments.zst"
+    write_comments(comments_path, [{"link_id": f"t3_{i}", "body": f"comment {i}", "score": 1} for i in range(20)])
+    load_comment_threads(str(comments_path), ["0"], n_partitions=8, partitions_dir=tmp_path / "parts")
+
+    # Partitions of other submissions are not opened, so removing them does not matter
+    (partition_dir,) = (tmp_path / "parts").iterdir()
+    for path in partition_dir.iterdir():
+        if path.name != f"part-{comment_partition('3', 8):03d}.jsonl":
+            path.unlink()
+    threads = load_comment_threads(str(comments_path), ["3"], n_partitions=8, partitions_dir=tmp_path / "parts")
+    assert threads["comment_text"].tolist() == ["comment 3"]
+
+    write_comments(comments_path, [{"link_id": "t3_0", "body": "edited", "score": 1}])
+    threads = load_comment_threads(str(comments_path), ["0"], n_partitions=8, partitions_dir=tmp_path / "parts")
+    assert threads["comment_text"].tolist() == ["edited"]
+    assert [path.name for path in (tmp_path / "parts").iterdir()] != [partition_dir.name]
+    assert len(list((tmp_path / "parts").iterdir())) == 1
+
+
+def test_comment_queries_follow_the_comment_dump(tmp_path):
+    """Tests that a changed comment dump gives comment analyses a new cache key."""
+    submissions_path = tmp_path / "Northwestern_submissions.zst"
+    write_comments(submissions_path, [{"id": "a"}])
+    comments_path = tmp_path / "Northwestern_comments.zst"
+    write_comments(comments_path, [{"link_id": "t3_a", "body": "first", "score": 2}])
+    query = make_query(str(submissions_path), 0, source="comments")
+    assert make_query(str(submissions_path), 0).comments_id is None
+
+    write_comments(comments_path, [{"link_id": "t3_a", "body": "first", "score": 2}, {"link_id": "t3_a", "body": "second", "score": 1}])
+    assert make_query(str(submissions_path), 0, source="comments") != query
@@ -0,0 +1,79 @@
+"""
+Tests the partitioned Parquet dataset in dataset.py.
+"""
+import json
+
+import zstandard
+
+from utils.dataset import ingest_all, query_posts, count_posts, open_dataset, build_filter  # pylint: disable=import-error
+
+
+def write_dump(path, posts):
+    """Writes posts as a zstandard-compressed dump."""
+    lines = "\n".join(json.dumps(post) for post in posts) + "\n"
+    path.write_bytes(zstandard.ZstdCompressor().compress(lines.encode()))
+
+
+def post(post_id, year, selftext):
+    created_utc = {2019: 1560000000, 2020: 1590000000, 2021: 1620000000}[year]
+    return {"id": post_id, "title": post_id, "selftext": selftext, "author": "a", "score": 1,
+            "num_comments": 0, "archived": False, "created_utc": created_utc}
+
+
+def make_dataset(tmp_path):
+    dumps = tmp_path / "dumps"
+    dumps.mkdir()
+    write_dump(dumps / "Northwestern_submissions.zst", [
+        post("n1", 2019, "dorm housing question " * 10),
+        post("n2", 2020, "short"),
+        post("n3", 2021, "financial aid " * 20),
+    ])
+    write_dump(dumps / "chicago_submissions.zst", [
+        post("c1", 2020, "Anyone from Northwestern looking for housing? " * 5),
+        post("c2", 2020, "Best pizza in the city, no question about it " * 5),
+        post("c3", 2021, "NU students moving to the loop for housing " * 5),
+        "not json",
+    ])
+    dataset = tmp_path / "dataset"
+    assert ingest_all(str(dumps), str(dataset)) == ["Northwestern", "chicago"]
+    return dumps, dataset
+
+
+def test_query_applies_all_filters(tmp_path):
+    """Tests subreddit, year, length, keyword and Northwestern filters in one query."""
+    _, dataset = make_dataset(tmp_path)
+    df = query_posts(min_chars=20, dataset_dir=str(dataset))
+    # c2 does not mention Northwestern and n2 is too short
+    assert sorted(df["id"]) == ["c1", "c3", "n1", "n3"]
+    assert df["created_datetime"].dt.year.tolist() == df["year"].tolist()
+
+    df = query_posts(["chicago"], 2020, 2021, 20, ["housing"], dataset_dir=str(dataset))
+    assert sorted(df["id"]) == ["c1", "c3"]
+    assert sorted(query_posts(start_year=2021, dataset_dir=str(dataset))["id"]) == ["c3", "n3"]
+
+    counts = count_posts(min_chars=20, dataset_dir=str(dataset))
+    assert counts.loc[2020, "chicago"] == 1 and counts.loc[2021, "Northwestern"] == 1
+
+
+def test_partitions_are_pruned(tmp_path):
+    """Tests that subreddit and year filters only open the matching files."""
+    _, dataset = make_dataset(tmp_path)
+    fragments = list(open_dataset(str(dataset)).get_fragments(filter=build_filter(["chicago"], 2021, 2021)))
+    assert [fragment.path.split("/")[-3:-1] for fragment in fragments] == [["subreddit=chicago", "year=2021"]]
+
+
+def test_unchanged_dumps_are_skipped(tmp_path):
+    """Tests that only changed dumps are ingested again."""
+    dumps, dataset = make_dataset(tmp_path)
+    assert ingest_all(str(dumps), str(dataset)) == []
+    write_dump(dumps / "chicago_submissions.zst", [post("c4", 2019, "Northwestern " * 10)])
+    assert ingest_all(str(dumps), str(dataset)) == ["chicago"]
+    assert sorted(query_posts(["chicago"], dataset_dir=str(dataset))["id"]) == ["c4"]
+
+
+def test_query_selected_ids(tmp_path):
+    """Tests that a query can be limited to given posts, e.g. a sample found by a cheaper query."""
+    _, dataset = make_dataset(tmp_path)
+    df = query_posts(ids=["c1", "n3", "c2"], columns=["id", "selftext"], dataset_dir=str(dataset))
+    # c2 is excluded by the Northwestern filter
+    assert sorted(df["id"]) == ["c1", "n3"]
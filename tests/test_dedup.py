@@ -0,0 +1,44 @@
+"""
+Tests the MinHash/LSH near-duplicate removal in dedup.py.
+"""
+import pandas as pd
+
+from utils.dedup import deduplicate  # pylint: disable=import-error
+from utils.analyze_sentiment import calculate_sentiment_distribution  # pylint: disable=import-error
+
+TEXT = "Does anyone know when the housing lottery for next year opens and how the waitlist works at Northwestern"
+
+
+def test_deduplicate_keeps_first_post_per_cluster():
+    """Tests that reposts with small edits are merged and distinct posts kept."""
+    df = pd.DataFrame({"selftext": [
+        TEXT,
+        "The football game on Saturday was amazing and the stadium was packed with wildcats fans",
+        TEXT + " edit thanks",
+        TEXT,
+        "Looking for a roommate for the summer quarter near the lakefill, preferably a grad student",
+    ]}, index=[10, 11, 12, 13, 14])
+    deduplicated, stats = deduplicate(df)
+    assert deduplicated.index.tolist() == [10, 11, 14]
+    assert deduplicated["dup_count"].tolist() == [3, 1, 1]
+    assert stats["duplicate_rate"] == 2 / 5
+
+
+def test_deduplicate_empty():
+    """Tests that an empty frame passes through."""
+    deduplicated, stats = deduplicate(pd.DataFrame({"selftext": pd.Series(dtype=str)}))
+    assert deduplicated.empty and "dup_count" in deduplicated
+    assert stats["duplicate_rate"] == 0.0
+
+
+def test_weighted_distribution_counts_duplicates():
+    """Tests that weighting by dup_count gives the percentages of all posts, not of clusters."""
+    df = pd.DataFrame({
+        "selftext": [TEXT, TEXT, TEXT, "The football game on Saturday was amazing and the stadium was packed"],
+        "created_datetime": pd.to_datetime(["2021-01-01"] * 4),
+        "sentiment": ["Negative", "Negative", "Negative", "Positive"],
+    })
+    deduplicated, _ = deduplicate(df)
+    weighted = calculate_sentiment_distribution(deduplicated, "dup_count").set_index("sentiment")
+    assert weighted.loc["Negative", "percentage"] == 75.0
+    assert weighted.loc["Negative", "total"] == 4
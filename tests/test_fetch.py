@@ -0,0 +1,48 @@
+"""
+Tests the concurrent Reddit fetcher in fetch.py.
+"""
+import time
+
+from utils.fetch import TokenBucket, fetch_api_data_concurrently, make_fetch_pairs  # pylint: disable=import-error
+from tests.fake_reddit import FakeReddit, make_post
+
+
+def test_fetch_api_data_concurrently_deduplicates():
+    """Tests that posts matched by several keywords are returned once."""
+    posts = {
+        "Northwestern": [make_post("a", 1, title="tuition and housing"), make_post("b", 2, title="housing")],
+        "chicago": [make_post("c", 3, title="tuition", subreddit="chicago")],
+    }
+    clients = []
+
+    def client_factory():
+        clients.append(FakeReddit(posts))
+        return clients[-1]
+
+    partials = []
+
+    df = fetch_api_data_concurrently(
+        make_fetch_pairs(["Northwestern", "chicago"], ["tuition", "housing"]),
+        max_workers=2,
+        client_factory=client_factory,
+        on_partial=lambda partial, done, total: partials.append((len(partial), done, total)),
+    )
+
+    # Every worker thread searches with its own client
+    assert 1 <= len(clients) <= 2
+    assert sum(len(reddit.search_calls) for reddit in clients) == 4
+    assert sorted(df["ID"]) == ["a", "b", "c"]
+    assert [done for _, done, _ in partials] == [1, 2, 3, 4]
+    # Each partial only holds the posts not seen before
+    assert sum(count for count, _, _ in partials) == 3
+
+
+def test_token_bucket_follows_quota():
+    """Tests that the refill rate spreads the remaining quota over the window."""
+    bucket = TokenBucket(rate=100, capacity=5)
+    bucket.update_from_limits({"remaining": 10, "reset_timestamp": time.time() + 100})
+    assert 0.09 < bucket.rate < 0.11
+    assert bucket.tokens <= 5
+
+    bucket.update_from_limits({"remaining": None, "reset_timestamp": None})
+    assert bucket.rate < 0.11
@@ -0,0 +1,107 @@
+"""
+Tests the worker processes of jobs.py with trivial job functions.
+"""
+import os
+import time
+
+import pytest
+
+from utils import jobs  # pylint: disable=import-error
+from utils.query import AnalysisQuery  # pylint: disable=import-error
+
+
+def query_of(name, min_chars=100):
+    return AnalysisQuery((f"/dumps/{name}_submissions.zst", 1, 1), min_chars)
+
+
+def wait_until_cancelled(query, engine, n_topics, status, cancel_event, *args):
+    """Runs until the job is cancelled."""
+    status["stage"] = "load"
+    if not cancel_event.wait(60):
+        return None
+    raise jobs.JobCancelled("Cancelled during load")
+
+
+def worker_pid(query, engine, n_topics, status, cancel_event, *args):
+    """Returns the process the job ran in."""
+    return os.getpid()
+
+
+def finish(*args):
+    """Returns at once."""
+    return None
+
+
+def crash(query, engine, n_topics, status, cancel_event, *args):
+    """Kills the worker, as running out of memory would."""
+    os._exit(1)
+
+
+def wait_for(condition, timeout=60):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def manager():
+    job_manager = jobs.JobManager(max_workers=2, max_jobs_per_session=1)
+    yield job_manager
+    job_manager.shutdown()
+
+
+def test_identical_jobs_are_shared(manager, monkeypatch):
+    """Tests that sessions asking for a running analysis join it instead of starting another."""
+    monkeypatch.setattr(jobs, "run_analysis_job", wait_until_cancelled)
+    job = manager.submit("a", query_of("Northwestern"))
+    assert manager.submit("b", query_of("Northwestern")) is job
+    assert job.sessions == {"a", "b"}
+    assert manager.submit("c", query_of("Northwestern", min_chars=0)) is not job
+
+    # The job keeps running until the last session lets go of it
+    manager.release(job.id, "a")
+    assert not job.cancel_event.is_set()
+    manager.release(job.id, "b")
+    wait_for(job.future.done)
+    assert job.state == "cancelled"
+
+
+def test_session_limit(manager, monkeypatch):
+    """Tests that a session can only run one analysis at a time, plus its preview."""
+    monkeypatch.setattr(jobs, "run_analysis_job", wait_until_cancelled)
+    monkeypatch.setattr(jobs, "run_preview_job", finish)
+    job = manager.submit("a", query_of("Northwestern"))
+    with pytest.raises(RuntimeError):
+        manager.submit("a", query_of("chicago"))
+    manager.submit("a", query_of("Northwestern"), preview=True)
+
+    manager.release(job.id, "a")
+    wait_for(job.future.done)
+    assert manager.submit("a", query_of("chicago")) is not job
+
+
+def test_jobs_of_a_dump_run_on_the_same_worker(manager, monkeypatch):
+    """Tests that reruns on the same dump reach the worker holding its memoized stages."""
+    monkeypatch.setattr(jobs, "run_analysis_job", worker_pid)
+    pids = set()
+    for min_chars in (0, 50, 100):
+        job = manager.submit("a", query_of("Northwestern", min_chars))
+        pids.add(job.result())
+        manager.release(job.id, "a")
+    assert len(pids) == 1
+
+
+def test_broken_worker_is_replaced(manager, monkeypatch):
+    """Tests that a crashed worker fails its job and is replaced for the next one."""
+    monkeypatch.setattr(jobs, "run_analysis_job", crash)
+    job = manager.submit("a", query_of("Northwestern"))
+    wait_for(job.future.done)
+    assert job.state == "failed"
+    broken = job.executor
+    assert manager.get(job.id) is job
+    assert broken not in manager.executors["analysis"]
+
+    monkeypatch.setattr(jobs, "run_analysis_job", worker_pid)
+    manager.release(job.id, "a")
+    assert manager.submit("a", query_of("Northwestern")).result() != os.getpid()
@@ -0,0 +1,45 @@
+"""
+Tests the keyword expansion table in keywords.py.
+"""
+import shutil
+
+from utils import keywords  # pylint: disable=import-error
+
+TABLE = {
+    "admission": ["admission", "admissions", "entrance", "admittance", "admissioned", "admissioning"],
+    "financial_aid": ["financial aid", "financial aids", "aid"],
+    "tuition": ["tuition", "tuitions", "fee"],
+}
+
+
+def test_lookup_expansions(tmp_path):
+    """Tests the binary search over the memory-mapped table."""
+    keywords.write_expansion_table(TABLE, tmp_path)
+    assert keywords.lookup_expansions("admission", tmp_path) == TABLE["admission"]
+    assert keywords.lookup_expansions("tuition", tmp_path) == TABLE["tuition"]
+    assert keywords.lookup_expansions("zzz", tmp_path) is None
+    assert keywords.lookup_expansions("a", tmp_path) is None
+
+
+def test_expand_keywords_phrases_and_caps(tmp_path):
+    """Tests multi-keyword input, phrases, unknown words and the caps."""
+    keywords.write_expansion_table(TABLE, tmp_path)
+    expanded = keywords.expand_keywords("Admission, financial  aid, Wildcats", max_total=7, table_dir=tmp_path)
+    assert expanded == ["admission", "financial aid", "wildcats", "admissions", "financial aids", "entrance", "aid"]
+
+    expanded = keywords.expand_keywords(["tuition"], max_per_keyword=2, table_dir=tmp_path)
+    assert expanded == ["tuition", "tuitions"]
+
+
+def test_table_built_by_another_process_is_used(tmp_path, monkeypatch):
+    """Tests that results without a table are not kept once a table is built elsewhere."""
+    keywords.write_expansion_table(TABLE, tmp_path / "built")
+    monkeypatch.setattr(keywords, "generate_similar_words", lambda keyword: [keyword, "fallback"])
+    table_dir = tmp_path / "table"
+    assert keywords.load_expansion_table(table_dir) is None
+    assert keywords.expand_keywords("tuition", table_dir=table_dir) == ["tuition", "fallback"]
+
+    # Another process publishes the table; this process' caches are not cleared
+    shutil.copytree(tmp_path / "built", table_dir)
+    assert keywords.lookup_expansions("tuition", table_dir) == TABLE["tuition"]
+    assert keywords.expand_keywords("tuition", table_dir=table_dir) == TABLE["tuition"]
@@ -0,0 +1,61 @@
+"""
+Tests the stage spans of metrics.py and their JSON log and Prometheus exports.
+"""
+import json
+import re
+
+from utils import metrics  # pylint: disable=import-error
+from utils.metrics import span, trace_run, to_prometheus, export_run  # pylint: disable=import-error
+
+
+def test_spans_are_collected_by_the_current_run(tmp_path, monkeypatch):
+    """Tests that spans record their rows and times in the enclosing run, and only there."""
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    with span("outside"):
+        pass
+    with trace_run("analysis", subreddit="Northwestern") as run:
+        with span("load", rows_in=10) as record:
+            record['rows_out'] = 7
+        with span("lda", rows_in=7):
+            pass
+    assert [record["stage"] for record in run["spans"]] == ["load", "lda"]
+    load = run["spans"][0]
+    assert (load["rows_in"], load["rows_out"]) == (10, 7)
+    assert load["wall_s"] >= 0 and load["cpu_s"] >= 0
+    assert run["wall_s"] >= load["wall_s"]
+    assert run["labels"] == {"subreddit": "Northwestern"}
+
+
+def test_export_run_appends_json_lines(tmp_path):
+    """Tests that each exported run is one JSON line of the log."""
+    for name in ["first", "second"]:
+        export_run({"name": name, "labels": {}, "wall_s": 1.0, "spans": []}, str(tmp_path))
+    lines = (tmp_path / "metrics.jsonl").read_text().splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["first", "second"]
+    # The Prometheus file only holds the last run
+    assert 'run="second"' in (tmp_path / "metrics.prom").read_text()
+    assert 'run="first"' not in (tmp_path / "metrics.prom").read_text()
+
+
+def test_to_prometheus_text_format():
+    """Tests the exposition format: HELP and TYPE per metric, one sample per stage, and the
+    times and rows of a repeated stage added up."""
+    run = {"name": "analysis", "wall_s": 3.5, "spans": [
+        {"stage": "load", "rows_in": 10, "rows_out": 7, "wall_s": 1.0, "cpu_s": 0.5,
+         "process_peak_rss_mb": 100.0, "peak_rss_growth_mb": 20.0},
+        {"stage": "load", "rows_in": 5, "rows_out": None, "wall_s": 0.5, "cpu_s": 0.25,
+         "process_peak_rss_mb": 120.0, "peak_rss_growth_mb": 20.0},
+    ]}
+    text = to_prometheus(run)
+    assert text.endswith("\n")
+    sample = re.compile(r'^[a-z_]+\{[a-z]+="[^"]*"(,[a-z]+="[^"]*")*\} [0-9.e+-]+$')
+    for line in text.splitlines():
+        assert line.startswith(("# HELP ", "# TYPE ")) or sample.match(line), line
+    samples = dict(line.rsplit(" ", 1) for line in text.splitlines() if not line.startswith("#"))
+    assert float(samples['reddit_analysis_stage_wall_seconds{run="analysis",stage="load"}']) == 1.5
+    assert float(samples['reddit_analysis_stage_rows_in{run="analysis",stage="load"}']) == 15
+    assert float(samples['reddit_analysis_stage_rows_out{run="analysis",stage="load"}']) == 7
+    assert float(samples['reddit_analysis_stage_process_peak_rss_megabytes{run="analysis",stage="load"}']) == 120.0
+    assert float(samples['reddit_analysis_stage_peak_rss_growth_megabytes{run="analysis",stage="load"}']) == 40.0
+    assert float(samples['reddit_analysis_run_wall_seconds{run="analysis"}']) == 3.5
+    assert text.count("# TYPE reddit_analysis_stage_wall_seconds gauge") == 1
@@ -0,0 +1,50 @@
+"""
+Tests that render_png in plots.py closes its figures and bounds its cache.
+"""
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import pandas as pd
+import pytest
+
+from utils import plots  # pylint: disable=import-error
+from utils.plots import render_png, plot_trends, plot_spikes, plot_posts_per_year_counts  # pylint: disable=import-error
+
+
+@pytest.fixture(autouse=True)
+def small_cache(monkeypatch):
+    monkeypatch.setattr(plots, "RENDER_CACHE_SIZE", 4)
+    monkeypatch.setattr(plots, "_render_cache", plots.OrderedDict())
+    plt.close('all')
+
+
+def trends(offset):
+    return pd.DataFrame({"Topic 1": [1 + offset, 3, 2], "Topic 2": [2, 2, 4 + offset]}, index=[2020, 2021, 2022])
+
+
+def test_render_png_closes_figures_and_bounds_the_cache():
+    """Tests that repeated renders of many datasets leave no open figures and at most
+    RENDER_CACHE_SIZE images."""
+    for i in range(10):
+        render_png(plot_trends, trends(i), dpi=30)
+        render_png(plot_posts_per_year_counts, pd.Series([10 + i, 20, 30], index=[2020, 2021, 2022]), dpi=30)
+        spikes = pd.DataFrame({"1": [3.0 + i], "2": [float('nan')]}, index=["2020-09"])
+        render_png(plot_spikes, spikes, dpi=30, title="Spikes", ylabel="Month")
+        render_png(plot_spikes, spikes.iloc[:0], dpi=30, title="Spikes", ylabel="Month")
+        assert plt.get_fignums() == []
+        assert len(plots._render_cache) <= plots.RENDER_CACHE_SIZE
+    assert len(plots._render_cache) == plots.RENDER_CACHE_SIZE
+
+
+def test_render_png_reuses_identical_renders(monkeypatch):
+    """Tests that identical data and style hit the cache, and other styles do not."""
+    image = render_png(plot_trends, trends(0))
+    assert image.startswith(b"\x89PNG")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("rendered again")
+    monkeypatch.setattr(plots.plt.Figure, "savefig", fail)
+    assert render_png(plot_trends, trends(0)) is image
+    with pytest.raises(AssertionError):
+        render_png(plot_trends, trends(0), dpi=50)
+    assert plt.get_fignums() == []
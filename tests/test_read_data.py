@@ -0,0 +1,55 @@
+"""
+Tests the cached Reddit API access in read_data.py.
+"""
+import pytest
+
+from utils import read_data  # pylint: disable=import-error
+from tests.fake_reddit import FakeReddit, make_post  # pylint: disable=import-error
+
+
+@pytest.fixture
+def fake_reddit(monkeypatch):
+    """Replaces the shared PRAW client with a local stand-in."""
+    reddit = FakeReddit({"Northwestern": [make_post("a", 100), make_post("b", 200)]})
+    monkeypatch.setattr(read_data, "get_reddit_client", lambda: reddit)
+    return reddit
+
+
+def test_get_api_data_uses_fresh_cache(fake_reddit, tmp_path):
+    """Tests that a second call within the TTL does not hit the API."""
+    first = read_data.get_api_data("Northwestern", "northwestern", cache_dir=tmp_path)
+    second = read_data.get_api_data("Northwestern", "northwestern", cache_dir=tmp_path)
+    assert len(fake_reddit.search_calls) == 1
+    assert first.equals(second)
+    assert set(first["ID"]) == {"a", "b"}
+
+
+def test_get_api_data_refreshes_incrementally(fake_reddit, tmp_path):
+    """Tests that an expired cache sorted by 'new' only adds posts newer than the cached ones."""
+    read_data.get_api_data("Northwestern", "northwestern", sort="new", cache_dir=tmp_path)
+    fake_reddit.posts_by_subreddit["Northwestern"].append(make_post("c", 300))
+    del fake_reddit.posts_by_subreddit["Northwestern"][0]
+
+    df = read_data.get_api_data("Northwestern", "northwestern", sort="new", cache_ttl=1e-9, cache_dir=tmp_path)
+
+    # "a" is still served from the cache, so only the new post was fetched
+    assert list(df["ID"]) == ["c", "b", "a"]
+
+
+def test_get_api_data_refetches_other_orders(fake_reddit, tmp_path):
+    """Tests that an expired relevance-sorted cache is replaced, not merged with newer posts."""
+    read_data.get_api_data("Northwestern", "northwestern", cache_dir=tmp_path)
+    fake_reddit.posts_by_subreddit["Northwestern"].append(make_post("c", 300))
+
+    df = read_data.get_api_data("Northwestern", "northwestern", cache_ttl=1e-9, cache_dir=tmp_path)
+
+    assert [call[2] for call in fake_reddit.search_calls] == ["relevance", "relevance"]
+    assert list(df["ID"]) == ["a", "b", "c"]
+
+
+def test_get_api_data_cache_key(fake_reddit, tmp_path):
+    """Tests that a different limit is cached separately."""
+    read_data.get_api_data("Northwestern", "northwestern", limit=1, cache_dir=tmp_path)
+    df = read_data.get_api_data("Northwestern", "northwestern", limit=2, cache_dir=tmp_path)
+    assert len(fake_reddit.search_calls) == 2
+    assert len(df) == 2
@@ -0,0 +1,57 @@
+"""
+Tests the stratified sample and confidence intervals in sampling.py.
+"""
+import json
+
+import zstandard
+
+from utils.sampling import StratifiedSample, sample_dump, wilson_interval, year_of_line, estimate_posts_per_year  # pylint: disable=import-error
+
+
+def test_year_of_line():
+    """Tests the year lookup on raw lines, with int and string timestamps."""
+    assert year_of_line('{"id": "a", "created_utc": 1609459200, "selftext": ""}') == 2021
+    assert year_of_line('{"created_utc":"1609459199"}') == 2020
+    assert year_of_line('{"id": "a"}') is None
+
+
+def test_reservoir_keeps_capacity_and_counts_population():
+    """Tests that each year keeps at most its capacity while counting every line."""
+    sample = StratifiedSample(capacity_per_year=10, seed=1)
+    for i in range(100):
+        sample.add(2020, f'{{"created_utc": 1600000000, "id": "{i}"}}')
+    sample.add(2021, '{"created_utc": 1620000000, "id": "x"}')
+    assert sample.population == {2020: 100, 2021: 1}
+    posts = sample.posts()
+    assert len(posts[2020]) == 10 and len(posts[2021]) == 1
+    assert len({post["id"] for post in posts[2020]}) == 10
+
+
+def test_wilson_interval_with_finite_population():
+    """Tests that the interval contains the estimate and collapses for a full census."""
+    low, high = wilson_interval(30, 100)
+    assert low < 0.3 < high
+    narrower = wilson_interval(30, 100, population=200)
+    assert low < narrower[0] and narrower[1] < high
+    assert wilson_interval(30, 100, population=100) == (0.3, 0.3)
+
+    estimate = estimate_posts_per_year({2020: 1000}, {2020: 100}, {2020: 30})
+    assert estimate.loc[0, "estimate"] == 300
+    assert estimate.loc[0, "low"] < 300 < estimate.loc[0, "high"]
+
+
+def test_sample_dump_snapshots_while_streaming(tmp_path):
+    """Tests that snapshots see the sample of the lines read so far and that peeking leaves it unchanged."""
+    lines = [json.dumps({"id": str(i), "created_utc": 1600000000 + i, "selftext": "x"}) for i in range(50)]
+    path = tmp_path / "Northwestern_submissions.zst"
+    path.write_bytes(zstandard.ZstdCompressor().compress(("\n".join(lines) + "\n").encode()))
+
+    snapshots = []
+
+    def on_snapshot(sample, fraction):
+        peeked = sample.peek(5)
+        snapshots.append((sample.population[2020], len(peeked[2020]), len(sample.reservoirs[2020])))
+
+    sample = sample_dump(str(path), capacity_per_year=8, progress_every=20, on_snapshot=on_snapshot)
+    assert snapshots == [(20, 5, 8), (40, 5, 8)]
+    assert sample.population == {2020: 50}
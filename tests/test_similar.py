@@ -0,0 +1,44 @@
+"""
+Tests the similar-posts index in similar.py.
+"""
+import os
+
+import pandas as pd
+
+from utils import similar  # pylint: disable=import-error
+
+TEXTS = [
+    "housing lottery dorm room roommate campus",
+    "football game stadium wildcats season coach",
+    "dorm room housing roommate lottery north campus",
+    "tuition financial aid scholarship loan cost",
+    "basketball game wildcats coach season win",
+    "financial aid tuition cost scholarship package",
+]
+
+
+def test_similar_posts_and_topics(tmp_path):
+    """Tests that the nearest posts share the topic and the query post is excluded."""
+    df = pd.DataFrame({"id": list("abcdef"), "title": list("ABCDEF"), "year": 2020, "cleaned_text": TEXTS})
+    index = similar.load_index(similar.build_index(df, str(tmp_path / "index"), n_components=4))
+
+    result = similar.similar_posts(index, "a", k=2)
+    assert "a" not in result["id"].tolist()
+    assert result["id"].iloc[0] == "c"
+    assert result["similarity"].is_monotonic_decreasing
+
+    assert set(similar.posts_like_topic(index, ["d", "f"], k=2)["id"]) == {"d", "f"}
+
+
+def test_least_recently_used_indexes_are_evicted(tmp_path):
+    """Tests that eviction keeps the most recently used indexes."""
+    df = pd.DataFrame({"id": list("abcdef"), "title": list("ABCDEF"), "year": 2020, "cleaned_text": TEXTS})
+    for name, used_at in [("old", 100), ("recent", 300), ("middle", 200)]:
+        os.utime(similar.build_index(df, str(tmp_path / name), n_components=4), (used_at, used_at))
+    similar.touch_index(str(tmp_path / "old"))
+
+    removed = similar.evict_indexes(str(tmp_path), keep=2)
+    assert [os.path.basename(path) for path in removed] == ["middle"]
+    assert sorted(os.listdir(tmp_path)) == ["old", "recent"]
+
+    assert similar.evict_indexes(str(tmp_path), max_age=60) == [str(tmp_path / "recent")]
@@ -0,0 +1,106 @@
+"""
+Tests the incremental EWMA spike detection in spikes.py.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import spikes as spikes_module  # pylint: disable=import-error
+from utils.spikes import SpikeDetector, detect_spikes_resumable, detect_spikes_streaming, strongest_spikes, topic_shares  # pylint: disable=import-error
+
+
+def make_shares(n_months=12, spike_month=8):
+    """Two topics with a stable share, except for a spike of topic 1 in one month."""
+    index = pd.period_range("2020-01", periods=n_months, freq="M")
+    share = [0.2 + 0.02 * (i % 2) for i in range(n_months)]
+    share[spike_month] = 0.6
+    return pd.DataFrame({"1": share, "2": [1 - value for value in share]}, index=index)
+
+
+def test_detects_spike_at_month_granularity():
+    """Tests that only the spike month of the rising topic is flagged."""
+    spikes, _ = detect_spikes_streaming(make_shares(), sensitivity=3.0)
+    assert spikes.index.tolist() == ["2020-09"]
+    assert spikes.loc["2020-09", "1"] > 3.0
+    assert pd.isna(spikes.loc["2020-09", "2"])
+
+
+def test_resumed_state_matches_full_run(tmp_path):
+    """Tests that a saved detector continues where it stopped, without the history."""
+    shares = make_shares()
+    _, full = detect_spikes_streaming(shares)
+
+    _, detector = detect_spikes_streaming(shares.iloc[:6])
+    detector.save(tmp_path / "state.json")
+    spikes, resumed = detect_spikes_streaming(shares.iloc[5:], detector=SpikeDetector.load(tmp_path / "state.json"))
+    assert spikes.index.tolist() == ["2020-09"]
+    assert resumed.last_bucket == full.last_bucket
+    assert resumed.series["1"] == pytest.approx(full.series["1"])
+
+
+def make_posts(shares, n_posts=50):
+    """Posts of topics 1 and 2 in the middle of each month, in the proportions of `shares`."""
+    rows = []
+    for period, share in zip(shares.index, shares["1"]):
+        n_first = round(n_posts * share)
+        rows += [(period.start_time + pd.Timedelta(days=14), 1 if i < n_first else 2) for i in range(n_posts)]
+    return pd.DataFrame(rows, columns=["created_datetime", "dominant_topic"])
+
+
+def test_resumable_detection_only_counts_new_periods(tmp_path, monkeypatch):
+    """Tests that a rerun on a grown dump scores only the new months and matches a full run."""
+    posts = make_posts(make_shares())
+    expected, _ = detect_spikes_streaming(*topic_shares(posts, "month"))
+    state, topics = tmp_path / "state.json", [["apple"], ["pear"]]
+
+    first = detect_spikes_resumable(posts[posts["created_datetime"] < "2020-07-01"], "month", state, topics)
+    assert first.empty
+
+    counted = []
+    def counting_topic_shares(df, *args):
+        counted.append(len(df))
+        return topic_shares(df, *args)
+    monkeypatch.setattr(spikes_module, "topic_shares", counting_topic_shares)
+    resumed = detect_spikes_resumable(posts, "month", state, topics)
+    # The open month of the first run (June) is counted again, the folded ones are not
+    assert counted == [7 * 50]
+    pd.testing.assert_frame_equal(resumed, expected)
+
+    # A rerun with nothing new reuses the saved scores
+    pd.testing.assert_frame_equal(detect_spikes_resumable(posts, "month", state, topics), expected)
+    # Different topics start over
+    detect_spikes_resumable(posts, "month", state, [["plum"], ["pear"]])
+    assert counted[-1] == len(posts)
+
+
+def test_topic_shares_skips_empty_buckets():
+    """Tests weekly buckets: a week without posts is left out, not scored as zero shares."""
+    df = pd.DataFrame({
+        "created_datetime": pd.to_datetime(["2021-01-04", "2021-01-05", "2021-01-20"]),
+        "dominant_topic": [1, 2, 1],
+    })
+    shares, posts = topic_shares(df, "week")
+    assert len(shares) == 2
+    assert shares.iloc[0].tolist() == [0.5, 0.5]
+    assert posts.tolist() == [2, 1]
+
+
+def test_no_spikes_without_trend():
+    """Tests that sparse random buckets are not flagged: small buckets are skipped and the
+    binomial error of the remaining ones bounds their z-scores."""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "created_datetime": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.uniform(0, 730, 250), unit="D"),
+        "dominant_topic": rng.integers(1, 6, 250),
+    })
+    for freq in ["day", "week", "month"]:
+        shares, posts = topic_shares(df, freq)
+        spikes, _ = detect_spikes_streaming(shares, posts)
+        # At most 5% of the buckets, against 24% of the days before empty buckets were skipped
+        assert len(spikes) <= 0.05 * len(shares), freq
+
+
+def test_strongest_spikes_keeps_top_periods_in_order():
+    """Tests that the cap keeps the highest z-scores and the chronological order."""
+    spikes = pd.DataFrame({"1": [3.5, 9.0, 4.0, 8.0]}, index=["2020-01", "2020-02", "2020-03", "2020-04"])
+    assert strongest_spikes(spikes, n=2).index.tolist() == ["2020-02", "2020-04"]
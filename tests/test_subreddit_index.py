@@ -0,0 +1,23 @@
+"""
+Tests subreddit_index.py.
+"""
+from utils.subreddit_index import build_subreddit_index, suggest_subreddits  # pylint: disable=import-error
+
+NAMES = ["Northwestern", "chicago", "ApplyingToCollege", "NUFootball", "northwesternmutual", "college"]
+COUNTS = [500, 9000, 7000, 100, 50, 8000]
+
+
+def test_suggest_subreddits_ranks_by_count():
+    """Tests that substring matches come back most popular first."""
+    index = build_subreddit_index(NAMES, COUNTS)
+    assert suggest_subreddits(index, "college") == ["college", "ApplyingToCollege"]
+    assert suggest_subreddits(index, "NORTH") == ["Northwestern", "northwesternmutual"]
+
+
+def test_suggest_subreddits_short_and_missing_queries():
+    """Tests queries shorter than a gram, with no match and empty input."""
+    index = build_subreddit_index(NAMES, COUNTS)
+    assert suggest_subreddits(index, "rn", k=1) == ["Northwestern"]
+    assert suggest_subreddits(index, "nu") == ["NUFootball"]
+    assert suggest_subreddits(index, "stanford") == []
+    assert suggest_subreddits(index, "  ") == []